@@ -0,0 +1,99 @@
+"""
+Compares bulk downloads using the threaded downloader (hodgepodge.http.download_files) with the asyncio one
+(hodgepodge.async_http.download_files) against a local keep-alive HTTP server that adds a fixed latency to each
+response.
+
+The threaded downloader can only have as many requests in flight as it has threads, so it's run with a typical thread
+count (--threads) as well as with one thread per concurrent request, while the asyncio downloader runs every request
+concurrently (--concurrency) on a single thread.
+
+Usage: python -m benchmarks.bench_async_http [--requests 2000] [--concurrency 1000] [--latency 0.05] [--size 16K]
+"""
+from benchmarks.bench_hashing import parse_size, KiB
+
+import hodgepodge.async_http
+import hodgepodge.http
+import multiprocessing
+import argparse
+import tempfile
+import asyncio
+import time
+import os
+
+
+def serve(ports: multiprocessing.Queue, size: int, latency: float):
+    body = os.urandom(size)
+    response = 'HTTP/1.1 200 OK\r\nContent-Length: {}\r\n\r\n'.format(size).encode('ascii') + body
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                await reader.readuntil(b'\r\n\r\n')
+                await asyncio.sleep(latency)
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0, backlog=4096)
+        ports.put(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def download_with_threads(downloads, threads: int) -> int:
+    results = hodgepodge.http.download_files(
+        downloads, max_workers=threads, max_downloads_per_host=threads, include_file_hashes=False)
+    return sum(1 for result in results if result.ok)
+
+
+def download_with_asyncio(downloads, concurrency: int) -> int:
+    async def main():
+        results = hodgepodge.async_http.download_files(
+            downloads, max_concurrent_downloads=concurrency, max_downloads_per_host=concurrency,
+            include_file_hashes=False)
+        return sum([1 async for result in results if result.ok])
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=hodgepodge.http.DEFAULT_MAX_DOWNLOAD_WORKERS)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--size', type=parse_size, default=16 * KiB)
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(ports, args.size, args.latency), daemon=True)
+    server.start()
+    url = 'http://127.0.0.1:{}/data'.format(ports.get())
+
+    engines = [
+        ('threads', args.threads, download_with_threads),
+        ('threads', args.concurrency, download_with_threads),
+        ('asyncio', args.concurrency, download_with_asyncio),
+    ]
+    print('{:>10} {:>12} {:>10} {:>12} {:>10}'.format('engine', 'concurrency', 'seconds', 'requests/s', 'ok'))
+    try:
+        for (name, concurrency, f) in engines:
+            with tempfile.TemporaryDirectory() as tmp:
+                downloads = [(url, os.path.join(tmp, str(i))) for i in range(args.requests)]
+                start = time.perf_counter()
+                ok = f(downloads, concurrency)
+                elapsed = time.perf_counter() - start
+                print('{:>10} {:>12} {:>10.2f} {:>12.0f} {:>10}'.format(
+                    name, concurrency, elapsed, args.requests / elapsed, ok))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Measures file hashing throughput (in MB/s) for files between 1 KiB and 10 GiB, comparing the original engine (8 KiB
+reads, all four digests updated serially) against the current one, both with all hash algorithms and with SHA256 only.
+
+Files up to --max-size bytes are written to a temporary directory (default: 1 GiB - pass --max-size 10G for the full
+range, which needs that much free disk space) and read once before being timed, so results reflect hashing rather than
+disk throughput.
+
+Usage: python -m benchmarks.bench_hashing [--max-size 10G]
+"""
+from hodgepodge.hashing import HASH_ALGORITHMS, SHA256
+
+import hodgepodge.hashing
+import argparse
+import hashlib
+import tempfile
+import time
+import os
+
+KiB = 1024
+MiB = 1024 * KiB
+GiB = 1024 * MiB
+
+FILE_SIZES = [KiB, 64 * KiB, MiB, 16 * MiB, 256 * MiB, GiB, 10 * GiB]
+UNITS = {'K': KiB, 'M': MiB, 'G': GiB}
+
+
+def get_file_hashes_serially(path: str, hash_algorithms=HASH_ALGORITHMS, block_size: int = 8192):
+    hashes = [hashlib.new(algorithm) for algorithm in hash_algorithms]
+    with open(path, 'rb') as fp:
+        while True:
+            data = fp.read(block_size)
+            if not data:
+                break
+
+            for h in hashes:
+                h.update(data)
+    return [h.hexdigest() for h in hashes]
+
+
+def write_file(path: str, size: int):
+    block = os.urandom(min(size, 16 * MiB))
+    with open(path, 'wb') as fp:
+        remaining = size
+        while remaining:
+            n = fp.write(block[:remaining])
+            remaining -= n
+
+
+def get_throughput(f, path: str, size: int) -> float:
+    f(path)
+    start = time.perf_counter()
+    repeat = max(1, (64 * MiB) // size)
+    for _ in range(repeat):
+        f(path)
+    return size * repeat / (time.perf_counter() - start) / MiB
+
+
+def parse_size(value: str) -> int:
+    unit = UNITS.get(value[-1:].upper())
+    return int(value[:-1]) * unit if unit else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-size', type=parse_size, default=GiB)
+    args = parser.parse_args()
+
+    engines = [
+        ('8 KiB, all', lambda path: get_file_hashes_serially(path)),
+        ('8 KiB, sha256', lambda path: get_file_hashes_serially(path, hash_algorithms=[SHA256])),
+        ('engine, all', lambda path: hodgepodge.hashing.get_file_hashes(path)),
+        ('engine, sha256', lambda path: hodgepodge.hashing.get_file_hashes(path, hash_algorithms=[SHA256])),
+    ]
+    print('{:>12}'.format('size') + ''.join('{:>16}'.format(name) for (name, _) in engines) + '   (MB/s)')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data')
+        for size in FILE_SIZES:
+            if size > args.max_size:
+                break
+
+            write_file(path, size)
+            results = [get_throughput(f, path, size) for (_, f) in engines]
+            print('{:>12}'.format(size) + ''.join('{:>16.1f}'.format(result) for result in results))
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares the throughput (in MB/s) of hashing files through a memory mapping against reading them into a reused buffer,
+to pick the file size above which it's worth passing use_mmap=True to get_file_hashes (MMAP_MIN_FILE_SIZE).
+
+Files are read once before being timed, so results reflect hashing and copying rather than disk throughput.
+
+Usage: python -m benchmarks.bench_mmap [--max-size 1G] [--hash-algorithm sha256]
+"""
+from benchmarks.bench_hashing import KiB, MiB, GiB, parse_size, write_file, get_throughput
+
+import hodgepodge.hashing
+import argparse
+import tempfile
+import os
+
+FILE_SIZES = [4 * KiB, 64 * KiB, 256 * KiB, MiB, 4 * MiB, 16 * MiB, 64 * MiB, 256 * MiB, GiB]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-size', type=parse_size, default=256 * MiB)
+    parser.add_argument('--hash-algorithm', dest='hash_algorithms', action='append')
+    args = parser.parse_args()
+
+    print('{:>12} {:>16} {:>16}   (MB/s)'.format('size', 'buffered', 'mmap'))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data')
+        for size in FILE_SIZES:
+            if size > args.max_size:
+                break
+
+            write_file(path, size)
+            results = [get_throughput(
+                lambda p: hodgepodge.hashing.get_file_hashes(p, hash_algorithms=args.hash_algorithms, use_mmap=use_mmap),
+                path,
+                size,
+            ) for use_mmap in (False, True)]
+            print('{:>12} {:>16.1f} {:>16.1f}'.format(size, *results))
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares the per-file cost of matching filenames against a growing number of glob patterns using fnmatch directly and
+using a compiled GlobMatcher.
+
+Usage: python -m benchmarks.bench_pattern_matching
+"""
+from hodgepodge.pattern_matching import GlobMatcher
+
+import fnmatch
+import timeit
+
+FILE_COUNT = 10000
+PATTERN_COUNTS = [1, 10, 100, 1000]
+
+
+def get_patterns(n: int):
+    kinds = ['file{}.txt', '*.ext{}', 'prefix{}*', '*infix{}*', 'name{}.[ch]']
+    return [kinds[i % len(kinds)].format(i) for i in range(n)]
+
+
+def get_filenames():
+    return [('/var/log/{}'.format(i), 'file{}.log'.format(i), 'file{}.log'.format(i)) for i in range(FILE_COUNT)]
+
+
+def match_with_fnmatch(filenames, patterns):
+    for values in filenames:
+        values = [v.lower() for v in values]
+        lowered = [p.lower() for p in patterns]
+        any(fnmatch.fnmatch(v, p) for v in values for p in lowered)
+
+
+def match_with_glob_matcher(filenames, matcher):
+    for values in filenames:
+        matcher.matches(values)
+
+
+def main():
+    filenames = get_filenames()
+    print('{:>10} {:>16} {:>16}'.format('patterns', 'fnmatch (us)', 'GlobMatcher (us)'))
+    for n in PATTERN_COUNTS:
+        patterns = get_patterns(n)
+        matcher = GlobMatcher(patterns)
+
+        a = timeit.timeit(lambda: match_with_fnmatch(filenames, patterns), number=1)
+        b = timeit.timeit(lambda: match_with_glob_matcher(filenames, matcher), number=1)
+        print('{:>10} {:>16.2f} {:>16.2f}'.format(n, a / FILE_COUNT * 1e6, b / FILE_COUNT * 1e6))
+
+
+if __name__ == '__main__':
+    main()
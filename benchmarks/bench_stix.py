@@ -0,0 +1,40 @@
+"""
+Compares the per-object cost of converting stix2 objects to dicts by serializing them to JSON and parsing the result
+(the original implementation of stix2_to_dict) with walking their properties directly.
+
+Usage: python -m benchmarks.bench_stix
+"""
+import hodgepodge.stix
+import json
+import stix2
+import timeit
+
+OBJECT_COUNT = 5000
+
+
+def get_objects():
+    return [stix2.AttackPattern(
+        name='Technique {}'.format(i),
+        description='Description of technique {}'.format(i) * 10,
+        kill_chain_phases=[{'kill_chain_name': 'mitre-attack', 'phase_name': 'execution'}],
+        external_references=[
+            {'source_name': 'mitre-attack', 'external_id': 'T{}'.format(i), 'url': 'https://example.com/{}'.format(i)},
+        ],
+        custom_properties={'x_mitre_platforms': ['Linux', 'macOS', 'Windows'], 'x_mitre_version': '1.0'},
+        allow_custom=True,
+    ) for i in range(OBJECT_COUNT)]
+
+
+def main():
+    objects = get_objects()
+    print('{:>20} {:>16}'.format('method', 'per object (us)'))
+    for name, f in (
+        ('serialize + parse', lambda o: json.loads(o.serialize())),
+        ('stix2_to_dict', hodgepodge.stix.stix2_to_dict),
+    ):
+        t = timeit.timeit(lambda: [f(o) for o in objects], number=1)
+        print('{:>20} {:>16.2f}'.format(name, t / OBJECT_COUNT * 1e6))
+
+
+if __name__ == '__main__':
+    main()
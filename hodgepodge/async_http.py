@@ -0,0 +1,662 @@
+from typing import Optional, Iterable, AsyncIterator, Dict, Tuple, Callable, Any
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from hodgepodge.hashing import Hashes, HashCache
+from hodgepodge.files import INCLUDE_FILE_HASHES_BY_DEFAULT
+from hodgepodge.http import HttpRequestPolicy, HttpConnectionMetrics, DownloadProgress, DownloadResult, \
+    DEFAULT_DOWNLOAD_CHUNK_SIZE, PENDING_DOWNLOADS_PER_WORKER
+
+import hodgepodge.hashing as hashing
+import hodgepodge.http
+import requests.models
+import requests.utils
+import requests
+import urllib.parse
+import http.client
+import collections
+import dataclasses
+import asyncio
+import logging
+import json
+import time
+import ssl
+import io
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 1024
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 256
+DEFAULT_TIMEOUT = 60.0
+
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 256
+DEFAULT_MAX_CONCURRENT_DOWNLOADS_PER_HOST = 64
+
+#: The largest response head (status line and headers) that will be read.
+MAX_RESPONSE_HEAD_SIZE = 1024 * 1024
+
+_READ_SIZE = 64 * 1024
+_REDIRECT_STATUS_CODES = frozenset([301, 302, 303, 307, 308])
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+#: Headers that are dropped when following a redirect to another origin, and when a redirect drops the request body.
+_CREDENTIAL_HEADERS = frozenset(['authorization', 'cookie', 'proxy-authorization'])
+_BODY_HEADERS = frozenset(['content-type', 'content-length', 'transfer-encoding'])
+
+#: Header names must be tokens, and neither header values nor request targets may contain line breaks (or, for targets,
+#: whitespace), since they'd allow extra headers or requests to be injected into the request head.
+_HEADER_NAME = re.compile(r"[!#$%&'*+\-.^_`|~0-9A-Za-z]+")
+_INVALID_HEADER_VALUE = re.compile(r'[\r\n\x00]')
+_INVALID_REQUEST_TARGET = re.compile(r'[\x00-\x20\x7f]')
+
+
+class _ConnectError(requests.exceptions.ConnectionError):
+    pass
+
+
+class _Connection:
+    __slots__ = ['key', 'reader', 'writer']
+
+    def __init__(self, key: Tuple[str, str, int], reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+
+    def is_usable(self) -> bool:
+        return not (self.writer.is_closing() or self.reader.at_eof())
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncResponse:
+    """
+    The response to a request made using an AsyncSession.
+
+    The body isn't read until it's requested using read() or iter_content(), and the connection is returned to the
+    session's pool once the body has been read in full (or is closed if the response is released before then), so
+    responses should be used as async context managers or released once they're no longer needed.
+    """
+    def __init__(self, session: 'AsyncSession', connection: _Connection, method: str, url: str, status_code: int,
+                 reason: str, headers: CaseInsensitiveDict, keep_alive: bool):
+        self.url = url
+        self.method = method
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = None
+
+        self._session = session
+        self._connection = connection
+        self._keep_alive = keep_alive
+
+        #: Bodies are either chunked, a known number of bytes long, or run until the server closes the connection.
+        self._chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        self._remaining = None
+        self._chunk_remaining = 0
+        self._done = False
+        if method == 'HEAD' or status_code in (204, 304) or 100 <= status_code < 200:
+            self._done = True
+        elif not self._chunked:
+            length = headers.get('Content-Length', '')
+            if length.isdigit():
+                self._remaining = int(length)
+                self._done = self._remaining == 0
+            else:
+                self._keep_alive = False
+        if self._done:
+            self.release()
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def is_redirect(self) -> bool:
+        return self.status_code in _REDIRECT_STATUS_CODES and 'Location' in self.headers
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise requests.exceptions.HTTPError('{} {} Error: {} for url: {}'.format(
+                self.status_code, kind, self.reason, self.url), response=self)
+
+    async def iter_content(self, chunk_size: int = _READ_SIZE) -> AsyncIterator[bytes]:
+        if self.content is not None:
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i:i + chunk_size]
+            return
+
+        try:
+            while not self._done:
+                data = await self._read(chunk_size)
+                if data:
+                    yield data
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            self.release()
+            raise requests.exceptions.ChunkedEncodingError("Failed to read the response from {}: {!r}".format(
+                self.url, e)) from e
+        self.release()
+
+    async def read(self) -> bytes:
+        if self.content is None:
+            data = bytearray()
+            async for chunk in self.iter_content(_READ_SIZE):
+                data += chunk
+            self.content = bytes(data)
+        return self.content
+
+    async def json(self) -> Any:
+        return json.loads(await self.read())
+
+    def release(self):
+        """
+        Returns the connection to the session's pool if the body has been read, and otherwise closes it.
+        """
+        if self._connection is not None:
+            self._session._release(self._connection, reusable=self._done and self._keep_alive)
+            self._connection = None
+
+    async def _read(self, n: int) -> bytes:
+        reader = self._connection.reader
+        timeout = self._session.timeout
+        if self._chunked:
+            if not self._chunk_remaining:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(line.split(b';', 1)[0].strip(), 16)
+                if size == 0:
+
+                    #: The last chunk is followed by optional trailers and an empty line.
+                    while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                        pass
+                    self._done = True
+                    return b''
+                self._chunk_remaining = size
+
+            data = await asyncio.wait_for(reader.read(min(n, self._chunk_remaining)), timeout)
+            if not data:
+                raise asyncio.IncompleteReadError(b'', self._chunk_remaining)
+            self._chunk_remaining -= len(data)
+            if not self._chunk_remaining:
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+            return data
+
+        if self._remaining is None:
+            data = await asyncio.wait_for(reader.read(n), timeout)
+            self._done = not data
+            return data
+
+        data = await asyncio.wait_for(reader.read(min(n, self._remaining)), timeout)
+        if not data:
+            raise asyncio.IncompleteReadError(b'', self._remaining)
+        self._remaining -= len(data)
+        self._done = not self._remaining
+        return data
+
+    async def _discard(self):
+
+        #: Small bodies (e.g. of redirects) are read so that the connection can be reused, while larger ones are
+        #: abandoned along with the connection.
+        length = self.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) <= _READ_SIZE:
+            try:
+                async for _ in self.iter_content(_READ_SIZE):
+                    pass
+            except requests.exceptions.RequestException:
+                pass
+        self.release()
+
+    async def __aenter__(self) -> 'AsyncResponse':
+        return self
+
+    async def __aexit__(self, *_):
+        self.release()
+
+
+class AsyncSession:
+    """
+    An asyncio HTTP/1.1 client with keep-alive connection pools and the same retry policies as hodgepodge.http.
+
+    Policies are given as HttpRequestPolicy objects (e.g. AutomaticRetryPolicy), and their retry settings are applied
+    the way urllib3 applies them: connection errors, read errors (before a response is received) and responses with a
+    status in the retry policy's `status_forcelist` are retried with exponential backoff. At most `max_connections`
+    connections are open (or in use) at once, and at most `max_connections_per_host` to any one host - requests wait
+    for a connection once those limits are reached. Errors are raised as requests exceptions.
+
+    Bodies are requested uncompressed, and proxies aren't supported.
+    """
+    def __init__(self, policies: Optional[Iterable[HttpRequestPolicy]] = None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_connections_per_host: int = DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 max_redirects: int = requests.models.DEFAULT_REDIRECT_LIMIT,
+                 headers: Optional[Dict[str, str]] = None,
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.headers = CaseInsensitiveDict({
+            'User-Agent': requests.utils.default_user_agent(),
+            'Accept': '*/*',
+            'Accept-Encoding': 'identity',
+        })
+        self.headers.update(headers or {})
+
+        self._retry = hodgepodge.http.get_http_adapter(policies or []).max_retries
+        self._ssl_context = ssl_context
+        self._counter = hodgepodge.http.HttpConnectionCounter()
+        self._idle: Dict[Tuple[str, str, int], collections.deque] = collections.defaultdict(collections.deque)
+
+        #: Semaphores are created on first use so that they're bound to the event loop that the session is used from.
+        self._semaphore = None
+        self._host_semaphores: Dict[Tuple[str, str, int], asyncio.Semaphore] = {}
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> AsyncResponse:
+        kwargs.setdefault('allow_redirects', False)
+        return await self.request('HEAD', url, **kwargs)
+
+    async def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                      data: Optional[bytes] = None, allow_redirects: bool = True) -> AsyncResponse:
+        method = method.upper()
+        retry = _RetryState(self._retry, method)
+        redirects = 0
+        while True:
+            try:
+                response = await self._send(method, url, headers=headers, data=data)
+            except requests.exceptions.RequestException as e:
+                kind = 'connect' if isinstance(e, (_ConnectError, requests.exceptions.ConnectTimeout)) else 'read'
+                if not retry.increment(kind):
+                    raise
+                logger.debug("Retrying HTTP %s request: %s (%s)", method, url, e)
+                await asyncio.sleep(retry.get_backoff_time())
+                continue
+
+            if allow_redirects and response.is_redirect:
+                await response._discard()
+                redirects += 1
+                if redirects > self.max_redirects:
+                    raise requests.exceptions.TooManyRedirects(
+                        'Exceeded {} redirects.'.format(self.max_redirects), response=response)
+
+                location = urllib.parse.urljoin(url, response.headers['Location'])
+                removed_headers = set()
+                if _get_origin(location) != _get_origin(url):
+                    removed_headers |= _CREDENTIAL_HEADERS
+                if response.status_code == 303 or (response.status_code in (301, 302) and method == 'POST'):
+                    if method != 'HEAD':
+                        method = 'GET'
+                    data = None
+                    removed_headers |= _BODY_HEADERS
+
+                #: Headers set to None are left out of the request, including those set on the session.
+                if removed_headers:
+                    headers = CaseInsensitiveDict(headers or {})
+                    headers.update(dict.fromkeys(removed_headers))
+                url = location
+                continue
+
+            if response.status_code in (self._retry.status_forcelist or ()):
+                if retry.increment('status'):
+                    await response._discard()
+                    await asyncio.sleep(max(retry.get_backoff_time(), _get_retry_after(response)))
+                    continue
+                elif self._retry.raise_on_status:
+                    response.release()
+                    raise requests.exceptions.RetryError("Too many {} error responses from {}".format(
+                        response.status_code, url), response=response)
+            return response
+
+    def get_metrics(self) -> HttpConnectionMetrics:
+        return self._counter.get_metrics()
+
+    async def close(self):
+        for connections in self._idle.values():
+            for connection in connections:
+                connection.close()
+        self._idle.clear()
+
+    async def __aenter__(self) -> 'AsyncSession':
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def _send(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                    data: Optional[bytes] = None) -> AsyncResponse:
+
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in _DEFAULT_PORTS:
+            raise requests.exceptions.InvalidSchema("No connection adapters were found for {!r}".format(url))
+        elif not parts.hostname:
+            raise requests.exceptions.InvalidURL("Invalid URL {!r}: No host supplied".format(url))
+
+        host = parts.hostname
+        port = parts.port or _DEFAULT_PORTS[scheme]
+        host_header = '[{}]'.format(host) if ':' in host else host
+        if port != _DEFAULT_PORTS[scheme]:
+            host_header += ':{}'.format(port)
+
+        request_headers = CaseInsensitiveDict(self.headers)
+        request_headers['Host'] = host_header
+        request_headers.update(headers or {})
+        for k in [k for (k, v) in request_headers.items() if v is None]:
+            del request_headers[k]
+        if data is not None:
+            request_headers['Content-Length'] = str(len(data))
+
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        if _INVALID_REQUEST_TARGET.search(target):
+            raise requests.exceptions.InvalidURL("Invalid URL {!r}: Invalid characters in path".format(url))
+        for (k, v) in request_headers.items():
+            if not _HEADER_NAME.fullmatch(str(k)) or _INVALID_HEADER_VALUE.search(str(v)):
+                raise requests.exceptions.InvalidHeader("Invalid HTTP header: {!r}: {!r}".format(k, v))
+
+        head = '{} {} HTTP/1.1\r\n'.format(method, target) + \
+            ''.join('{}: {}\r\n'.format(k, v) for (k, v) in request_headers.items()) + '\r\n'
+        request = head.encode('latin-1') + (data or b'')
+
+        #: Idle connections may have been closed by the server, in which case the request is sent again on a new
+        #: connection (without counting as a retry).
+        key = (scheme, host, port)
+        while True:
+            connection, reused = await self._acquire(key)
+            try:
+                connection.writer.write(request)
+                await asyncio.wait_for(connection.writer.drain(), self.timeout)
+                response_head = await asyncio.wait_for(
+                    connection.reader.readuntil(b'\r\n\r\n'), self.timeout)
+                break
+            except asyncio.TimeoutError as e:
+                self._release(connection, reusable=False)
+                raise requests.exceptions.ReadTimeout("Read timed out: {}".format(url)) from e
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                self._release(connection, reusable=False)
+                if not reused:
+                    raise requests.exceptions.ConnectionError("Connection to {} failed: {!r}".format(url, e)) from e
+
+        #: The connection (and its slots) must be released if the server sent a malformed response head.
+        status_line, _, header_data = response_head.partition(b'\r\n')
+        version, status_code, reason = (status_line.decode('latin-1').split(' ', 2) + [''])[:3]
+        if not version.startswith('HTTP/') or not (status_code.isdigit() and len(status_code) == 3):
+            self._release(connection, reusable=False)
+            raise requests.exceptions.ConnectionError("Invalid status line from {}: {!r}".format(url, status_line))
+
+        try:
+            message = http.client.parse_headers(io.BytesIO(header_data))
+        except http.client.HTTPException as e:
+            self._release(connection, reusable=False)
+            raise requests.exceptions.InvalidHeader("Invalid response headers from {}: {!r}".format(url, e)) from e
+
+        response_headers = CaseInsensitiveDict()
+        for k in message.keys():
+            response_headers[k] = ', '.join(message.get_all(k))
+
+        connection_header = response_headers.get('Connection', '').lower()
+        keep_alive = 'close' not in connection_header and (version != 'HTTP/1.0' or 'keep-alive' in connection_header)
+        return AsyncResponse(self, connection, method=method, url=url, status_code=int(status_code),
+                             reason=reason.strip(), headers=response_headers, keep_alive=keep_alive)
+
+    async def _acquire(self, key: Tuple[str, str, int]) -> Tuple[_Connection, bool]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        host_semaphore = self._host_semaphores.get(key)
+        if host_semaphore is None:
+            host_semaphore = self._host_semaphores[key] = asyncio.Semaphore(self.max_connections_per_host)
+
+        await host_semaphore.acquire()
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            host_semaphore.release()
+            raise
+
+        self._counter.increment('requests')
+        idle = self._idle.get(key)
+        while idle:
+            connection = idle.pop()
+            if connection.is_usable():
+                return connection, True
+            connection.close()
+
+        try:
+            connection = await self._connect(key)
+        except BaseException:
+            self._semaphore.release()
+            host_semaphore.release()
+            raise
+        return connection, False
+
+    async def _connect(self, key: Tuple[str, str, int]) -> _Connection:
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+
+        self._counter.increment('connections')
+        if ssl_context is not None:
+            self._counter.increment('tls_handshakes')
+
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl_context, limit=MAX_RESPONSE_HEAD_SIZE), self.timeout)
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.ConnectTimeout("Connection to {}:{} timed out".format(host, port)) from e
+        except OSError as e:
+            raise _ConnectError("Failed to connect to {}:{}: {!r}".format(host, port, e)) from e
+        return _Connection(key, reader, writer)
+
+    def _release(self, connection: _Connection, reusable: bool):
+        if reusable and connection.is_usable():
+            self._idle[connection.key].append(connection)
+        else:
+            connection.close()
+        self._semaphore.release()
+        self._host_semaphores[connection.key].release()
+
+
+class _RetryState:
+    """
+    Counts the retries made for a request against the limits of a urllib3 Retry object.
+    """
+    def __init__(self, retry: Retry, method: str):
+        self.retry = retry
+        self.method = method
+        self.retries = 0
+        self._remaining = {'total': retry.total, 'connect': retry.connect, 'read': retry.read, 'status': retry.status}
+
+    def increment(self, kind: str) -> bool:
+
+        #: Like urllib3, only idempotent methods are retried once the request may have reached the server.
+        if kind != 'connect' and not self._is_retryable_method():
+            return False
+
+        for name in ('total', kind):
+            remaining = self._remaining[name]
+            if remaining is False:
+                return False
+            elif remaining is not None:
+                self._remaining[name] = remaining - 1
+                if remaining < 1:
+                    return False
+        self.retries += 1
+        return True
+
+    def get_backoff_time(self) -> float:
+        if self.retries <= 1:
+            return 0
+        backoff_max = getattr(self.retry, 'backoff_max', getattr(Retry, 'BACKOFF_MAX', 120))
+        return min(backoff_max, self.retry.backoff_factor * (2 ** (self.retries - 1)))
+
+    def _is_retryable_method(self) -> bool:
+        methods = getattr(self.retry, 'allowed_methods', None) if hasattr(self.retry, 'allowed_methods') else \
+            getattr(self.retry, 'method_whitelist', None)
+        return not methods or self.method in methods
+
+
+def _get_retry_after(response: AsyncResponse) -> float:
+    value = response.headers.get('Retry-After', '')
+    return float(value) if value.isdigit() else 0
+
+
+def _get_origin(url: str) -> Tuple[str, Optional[str], Optional[int]]:
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    return scheme, parts.hostname, parts.port or _DEFAULT_PORTS.get(scheme)
+
+
+async def download_file(
+        url: str,
+        path: str,
+        session: Optional[AsyncSession] = None,
+        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+        hash_cache: Optional[HashCache] = None,
+        hash_algorithms: Optional[Iterable[str]] = None,
+        expected_hashes: Optional[Hashes] = None,
+        chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE,
+        progress: Optional[Callable[[DownloadProgress], None]] = None) -> Optional[Hashes]:
+    """
+    Downloads a file without blocking the event loop, hashing it as it's written to disk (see
+    hodgepodge.http.download_file()).
+
+    The body is received on the event loop and is written to disk and hashed in the event loop's default executor, in
+    blocks of `chunk_size` bytes.
+    """
+    if session is None:
+        async with AsyncSession() as session:
+            return await download_file(
+                url=url, path=path, session=session, include_file_hashes=include_file_hashes, hash_cache=hash_cache,
+                hash_algorithms=hash_algorithms, expected_hashes=expected_hashes, chunk_size=chunk_size,
+                progress=progress)
+
+    algorithms = []
+    if include_file_hashes:
+        algorithms.extend(hashing.get_hash_algorithms(hash_algorithms))
+    if expected_hashes is not None:
+        algorithms.extend(k for (k, v) in dataclasses.asdict(expected_hashes).items() if v is not None)
+    hasher = hashing.Hasher(algorithms) if algorithms else None
+
+    loop = asyncio.get_running_loop()
+    part = hodgepodge.http.get_partial_download_path(path)
+    tracker = hodgepodge.http.ProgressTracker(url, callback=progress)
+    fp = await loop.run_in_executor(None, open, part, 'wb')
+    try:
+        try:
+            async with await session.get(url) as response:
+                response.raise_for_status()
+                length = response.headers.get('Content-Length', '')
+                tracker.reset(0, int(length) if length.isdigit() else None)
+
+                buffer = bytearray()
+                async for chunk in response.iter_content(_READ_SIZE):
+                    buffer += chunk
+                    tracker.add(len(chunk))
+                    if len(buffer) >= chunk_size:
+                        await loop.run_in_executor(None, _write, fp, buffer, hasher)
+                        buffer = bytearray()
+                if buffer:
+                    await loop.run_in_executor(None, _write, fp, buffer, hasher)
+        finally:
+            await loop.run_in_executor(None, fp.close)
+
+        hashes = hasher.get_hashes() if hasher is not None else None
+        if expected_hashes is not None:
+            hodgepodge.http.verify_hashes(url, expected_hashes=expected_hashes, hashes=hashes)
+
+        await loop.run_in_executor(None, os.replace, part, path)
+    except BaseException:
+        if os.path.exists(part):
+            os.unlink(part)
+        raise
+
+    if hashes is not None and hash_cache is not None:
+        stat_result = await loop.run_in_executor(None, os.stat, path)
+        await loop.run_in_executor(None, hash_cache.put, stat_result, hashes)
+
+    if include_file_hashes:
+        return hashing.Hashes(**{algorithm: getattr(hashes, algorithm) for algorithm in
+                                 hashing.get_hash_algorithms(hash_algorithms)})
+
+
+def _write(fp, data: bytearray, hasher: Optional[hashing.Hasher]):
+    fp.write(data)
+    if hasher is not None:
+        hasher.update(data)
+
+
+async def download_files(
+        downloads: Iterable[Tuple[str, str]],
+        session: Optional[AsyncSession] = None,
+        max_concurrent_downloads: int = DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+        max_downloads_per_host: int = DEFAULT_MAX_CONCURRENT_DOWNLOADS_PER_HOST,
+        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+        hash_cache: Optional[HashCache] = None,
+        hash_algorithms: Optional[Iterable[str]] = None,
+        chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE) -> AsyncIterator[DownloadResult]:
+    """
+    Downloads (url, path) pairs concurrently and yields a DownloadResult for each download as soon as it completes (see
+    hodgepodge.http.download_files()).
+
+    Unless a session is provided, downloads share a new one that retries requests using the default automatic retry
+    policy.
+    """
+    owns_session = session is None
+    if owns_session:
+        session = AsyncSession(policies=[hodgepodge.http.get_automatic_retry_policy()],
+                               max_connections=max_concurrent_downloads,
+                               max_connections_per_host=max_downloads_per_host)
+
+    semaphore = asyncio.Semaphore(max_concurrent_downloads)
+    host_semaphores = collections.defaultdict(lambda: asyncio.Semaphore(max_downloads_per_host))
+
+    async def download(url: str, path: str) -> DownloadResult:
+
+        #: Downloads wait for their host before taking a global slot, so that a busy host doesn't hold up other hosts.
+        async with host_semaphores[urllib.parse.urlsplit(url).netloc.lower()], semaphore:
+            start = time.perf_counter()
+            try:
+                hashes = await download_file(
+                    url=url,
+                    path=path,
+                    session=session,
+                    include_file_hashes=include_file_hashes,
+                    hash_cache=hash_cache,
+                    hash_algorithms=hash_algorithms,
+                    chunk_size=chunk_size,
+                )
+                size = os.path.getsize(path)
+            except Exception as e:
+                logger.warning("Failed to download %s: %s", url, e)
+                return DownloadResult(url=url, path=path, duration=time.perf_counter() - start, error=e)
+            return DownloadResult(url=url, path=path, hashes=hashes, size=size, duration=time.perf_counter() - start)
+
+    max_pending = max_concurrent_downloads * PENDING_DOWNLOADS_PER_WORKER
+    pending = set()
+    try:
+        for (url, path) in downloads:
+            pending.add(asyncio.ensure_future(download(url, path)))
+            while len(pending) >= max_pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+        #: Cancelled downloads are waited for so that they've cleaned up (e.g. closed their files and connections) before
+        #: the session is closed.
+        await asyncio.gather(*pending, return_exceptions=True)
+        if owns_session:
+            await session.close()
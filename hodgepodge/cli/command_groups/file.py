@@ -1,5 +1,7 @@
 from hodgepodge import click
+from typing import Optional, Tuple
 from hodgepodge.files import FOLLOW_SYMLINKS_BY_DEFAULT
+from hodgepodge.hashing import HashCache, SUPPORTED_HASH_ALGORITHMS
 
 import hodgepodge.files
 import hodgepodge.click
@@ -22,14 +24,28 @@ def file():
 @file.command()
 @click.argument('path', type=click.Path(exists=True))
 @click.option('--include-file-hashes/--exclude-file-hashes', default=True)
-def get_metadata(path: str, include_file_hashes: bool):
+@click.option('--hash-cache', 'hash_cache_path', type=click.Path(dir_okay=False),
+              help="Cache file hashes in this SQLite database to avoid rehashing unchanged files")
+@click.option('--hash-algorithm', 'hash_algorithms', multiple=True,
+              type=click.Choice(SUPPORTED_HASH_ALGORITHMS),
+              help="Only calculate these hashes (default: md5, sha1, sha256, and sha512)")
+def get_metadata(path: str, include_file_hashes: bool, hash_cache_path: Optional[str], hash_algorithms: Tuple[str]):
+    hash_cache = HashCache(hash_cache_path) if hash_cache_path else None
     try:
-        info = hodgepodge.files.get_metadata(path, include_file_hashes=include_file_hashes)
+        info = hodgepodge.files.get_metadata(
+            path,
+            include_file_hashes=include_file_hashes,
+            hash_cache=hash_cache,
+            hash_algorithms=hash_algorithms or None,
+        )
     except FileNotFoundError as e:
         logger.error(e)
     else:
         data = hodgepodge.types.dataclass_to_json(info)
         click.echo(data)
+    finally:
+        if hash_cache is not None:
+            hash_cache.close()
 
 
 @file.command()
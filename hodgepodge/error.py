@@ -4,3 +4,7 @@ class CompressionError(Exception):
 
 class NotFound(Exception):
     pass
+
+
+class IntegrityError(Exception):
+    pass
@@ -1,33 +1,115 @@
 from arrow import arrow
 from pathlib import Path
-from dataclasses import dataclass
-from typing import Optional, Iterable, List, Iterator, Union, Tuple
-from hodgepodge.hashing import Hashes
-from hodgepodge.pattern_matching import STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT
+from dataclasses import dataclass, field
+from typing import Optional, Iterable, List, Iterator, Union, Tuple, Dict, Any, Set, FrozenSet, Callable
+from hodgepodge.hashing import Hashes, HashCache
+from hodgepodge.pattern_matching import STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT, GlobMatcher, IgnoreRules
 from hodgepodge.users import User
 
 import stat as _stat
+import array
+import concurrent.futures
+import collections
+import dataclasses
+import heapq
+import math
+import json
+import gzip
 import hodgepodge.hashing
 import hodgepodge.math
+import hodgepodge.pattern_matching
 import hodgepodge.time
+import hodgepodge.types
 import hodgepodge.users
 import datetime
 import shutil
 import glob
 import os
 
+REGULAR_FILE = 'file'
+DIRECTORY = 'directory'
+SYMLINK = 'symlink'
+FIFO = 'fifo'
+SOCKET = 'socket'
+BLOCK_DEVICE = 'block_device'
+CHARACTER_DEVICE = 'character_device'
+
+FILE_TYPES = {
+    REGULAR_FILE: _stat.S_IFREG,
+    DIRECTORY: _stat.S_IFDIR,
+    SYMLINK: _stat.S_IFLNK,
+    FIFO: _stat.S_IFIFO,
+    SOCKET: _stat.S_IFSOCK,
+    BLOCK_DEVICE: _stat.S_IFBLK,
+    CHARACTER_DEVICE: _stat.S_IFCHR,
+}
+
 FOLLOW_SYMLINKS_BY_DEFAULT = False
 FOLLOW_MOUNT_POINTS_BY_DEFAULT = True
 INCLUDE_FILE_OWNERS_BY_DEFAULT = False
 INCLUDE_FILE_HASHES_BY_DEFAULT = False
+ORDER_SEARCH_RESULTS_BY_DEFAULT = True
+DEDUPLICATE_INODES_BY_DEFAULT = False
+PRUNE_UNCHANGED_DIRECTORIES_BY_DEFAULT = False
 
+PENDING_DIRECTORIES_PER_SEARCH_WORKER = 4
+PENDING_FILES_PER_HASHING_WORKER = 16
+DEFAULT_MAX_PENDING_HASHING_BYTES = 1024 * 1024 * 1024
 
-@dataclass(frozen=True)
+#: Directory modification times are only trusted if they were older than this when a snapshot was taken, since changes
+#: made within the timestamp granularity of a filesystem (e.g. 2 seconds on FAT) won't necessarily change them.
+DIRECTORY_MTIME_GRANULARITY_NS = 2 * 1000 * 1000 * 1000
+
+
+@dataclass(init=False, repr=False, eq=False)
 class MACTimestamps:
+    """
+    Modify, access, and change times, which are stored as nanoseconds since the epoch and are only converted into
+    datetimes when they're accessed or serialized.
+
+    The modify_time, access_time, and change_time keywords are still accepted, and can be any timestamp that
+    hodgepodge.time understands.
+    """
+    __slots__ = ('modify_time_ns', 'access_time_ns', 'change_time_ns')
+
+    #: The datetimes are declared as dataclass fields (implemented by the properties below), so dataclasses.asdict()
+    #: returns the same dictionaries as it did when they were stored as datetimes.
     modify_time: datetime.datetime
     access_time: datetime.datetime
     change_time: datetime.datetime
 
+    def __init__(
+            self,
+            modify_time_ns: Optional[int] = None,
+            access_time_ns: Optional[int] = None,
+            change_time_ns: Optional[int] = None,
+            modify_time: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None,
+            access_time: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None,
+            change_time: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None):
+
+        self.modify_time_ns = _get_time_ns('modify_time', modify_time_ns, modify_time)
+        self.access_time_ns = _get_time_ns('access_time', access_time_ns, access_time)
+        self.change_time_ns = _get_time_ns('change_time', change_time_ns, change_time)
+
+    @property
+    def modify_time(self) -> datetime.datetime:
+        return _ns_to_datetime(self.modify_time_ns)
+
+    @property
+    def access_time(self) -> datetime.datetime:
+        return _ns_to_datetime(self.access_time_ns)
+
+    @property
+    def change_time(self) -> datetime.datetime:
+        return _ns_to_datetime(self.change_time_ns)
+
+    def to_dict(self) -> Dict[str, datetime.datetime]:
+        return {
+            'modify_time': self.modify_time,
+            'access_time': self.access_time,
+            'change_time': self.change_time,
+        }
+
     def __lt__(self, other: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow]):
         return all(t < other for t in self)
 
@@ -38,9 +120,34 @@ class MACTimestamps:
         for time in self.modify_time, self.access_time, self.change_time:
             yield time
 
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, MACTimestamps):
+            return NotImplemented
+        return _get_slot_values(self) == _get_slot_values(other)
 
-@dataclass(frozen=True)
+    def __hash__(self) -> int:
+        return hash(_get_slot_values(self))
+
+    def __repr__(self) -> str:
+        return _get_slot_repr(self)
+
+
+@dataclass(init=False, repr=False, eq=False)
 class StatResult:
+    """
+    The result of stat'ing a file, with timestamps stored as nanoseconds since the epoch. The st_atime, st_mtime, and
+    st_ctime attributes are only converted into datetimes when they're accessed or serialized.
+
+    The st_atime, st_mtime, and st_ctime keywords are still accepted, and can be any timestamp that hodgepodge.time
+    understands.
+    """
+    __slots__ = (
+        'st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_uid', 'st_gid', 'st_size',
+        'st_atime_ns', 'st_mtime_ns', 'st_ctime_ns',
+    )
+
+    #: As with MACTimestamps, the datetimes are declared as dataclass fields (implemented by properties) so that
+    #: dataclasses.asdict() returns the same dictionaries as it did when they were stored as datetimes.
     st_mode: int
     st_ino: int
     st_dev: int
@@ -52,13 +159,110 @@ class StatResult:
     st_mtime: datetime.datetime
     st_ctime: datetime.datetime
 
+    def __init__(
+            self,
+            st_mode: int,
+            st_ino: int,
+            st_dev: int,
+            st_nlink: int,
+            st_uid: int,
+            st_gid: int,
+            st_size: int,
+            st_atime_ns: Optional[int] = None,
+            st_mtime_ns: Optional[int] = None,
+            st_ctime_ns: Optional[int] = None,
+            st_atime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None,
+            st_mtime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None,
+            st_ctime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None):
+
+        self.st_mode = st_mode
+        self.st_ino = st_ino
+        self.st_dev = st_dev
+        self.st_nlink = st_nlink
+        self.st_uid = st_uid
+        self.st_gid = st_gid
+        self.st_size = st_size
+        self.st_atime_ns = _get_time_ns('st_atime', st_atime_ns, st_atime)
+        self.st_mtime_ns = _get_time_ns('st_mtime', st_mtime_ns, st_mtime)
+        self.st_ctime_ns = _get_time_ns('st_ctime', st_ctime_ns, st_ctime)
+
+    @property
+    def st_atime(self) -> datetime.datetime:
+        return _ns_to_datetime(self.st_atime_ns)
+
+    @property
+    def st_mtime(self) -> datetime.datetime:
+        return _ns_to_datetime(self.st_mtime_ns)
+
+    @property
+    def st_ctime(self) -> datetime.datetime:
+        return _ns_to_datetime(self.st_ctime_ns)
+
     def get_mac_timestamps(self) -> MACTimestamps:
         return MACTimestamps(
-            modify_time=hodgepodge.time.to_datetime(self.st_mtime),
-            access_time=hodgepodge.time.to_datetime(self.st_atime),
-            change_time=hodgepodge.time.to_datetime(self.st_ctime),
+            modify_time_ns=self.st_mtime_ns,
+            access_time_ns=self.st_atime_ns,
+            change_time_ns=self.st_ctime_ns,
         )
 
+    def to_dict(self) -> Dict[str, Union[int, datetime.datetime]]:
+        return {
+            'st_mode': self.st_mode,
+            'st_ino': self.st_ino,
+            'st_dev': self.st_dev,
+            'st_nlink': self.st_nlink,
+            'st_uid': self.st_uid,
+            'st_gid': self.st_gid,
+            'st_size': self.st_size,
+            'st_atime': self.st_atime,
+            'st_mtime': self.st_mtime,
+            'st_ctime': self.st_ctime,
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, StatResult):
+            return NotImplemented
+        return _get_slot_values(self) == _get_slot_values(other)
+
+    def __hash__(self) -> int:
+        return hash(_get_slot_values(self))
+
+    def __repr__(self) -> str:
+        return _get_slot_repr(self)
+
+
+def _get_slot_values(o: Any) -> Tuple[Any, ...]:
+    return tuple(getattr(o, k) for k in o.__slots__)
+
+
+def _get_slot_repr(o: Any) -> str:
+    return '{}({})'.format(type(o).__name__, ', '.join('{}={!r}'.format(k, getattr(o, k)) for k in o.__slots__))
+
+
+def _get_time_ns(
+        name: str,
+        ns: Optional[int],
+        timestamp: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None]) -> int:
+
+    if ns is not None and timestamp is not None:
+        raise TypeError("Only one of {} and {}_ns can be provided".format(name, name))
+    elif timestamp is not None:
+        return _to_epoch_time_ns(timestamp)
+    elif ns is None:
+        raise TypeError("Missing required argument: {}_ns".format(name))
+    return ns
+
+
+def _ns_to_datetime(ns: int) -> datetime.datetime:
+    return hodgepodge.time.to_datetime(_ns_to_epoch_time(ns))
+
+
+def _ns_to_epoch_time(ns: int) -> float:
+
+    #: This matches how os.stat() derives floating point timestamps from nanosecond timestamps.
+    seconds, ns = divmod(ns, 1000 * 1000 * 1000)
+    return seconds + ns * 1e-9
+
 
 @dataclass(frozen=True)
 class File:
@@ -77,28 +281,45 @@ def get_owner(path: str) -> Optional[User]:
 def get_metadata(
         path: str,
         follow_symlinks: bool = FOLLOW_SYMLINKS_BY_DEFAULT,
-        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT) -> File:
+        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+        hash_cache: Optional[HashCache] = None,
+        hash_algorithms: Optional[Iterable[str]] = None) -> File:
 
     absolute_path = get_absolute_path(path)
     real_path = get_real_path(absolute_path)
-    stat_result = stat(real_path, follow_symlinks=follow_symlinks)
+    stat_result = os.stat(real_path, follow_symlinks=follow_symlinks)
+    return _get_file(
+        path=absolute_path,
+        real_path=real_path,
+        stat_result=stat_result,
+        include_file_hashes=include_file_hashes,
+        hash_cache=hash_cache,
+        hash_algorithms=hash_algorithms,
+    )
+
+
+def _get_file(
+        path: str,
+        real_path: str,
+        stat_result: os.stat_result,
+        include_file_hashes: bool,
+        hash_cache: Optional[HashCache] = None,
+        hash_algorithms: Optional[Iterable[str]] = None) -> File:
 
     hashes = None
     if include_file_hashes and _stat.S_ISREG(stat_result.st_mode):
-        hashes = hodgepodge.hashing.get_file_hashes(path)
-
-    modify_time, access_time, change_time = stat_result.get_mac_timestamps()
+        if hash_cache is not None:
+            hashes = hash_cache.get_file_hashes(path, stat_result=stat_result, hash_algorithms=hash_algorithms)
+        else:
+            hashes = hodgepodge.hashing.get_file_hashes(path, hash_algorithms=hash_algorithms)
 
+    stat_result = parse_stat_result(stat_result)
     return File(
-        path=absolute_path,
+        path=path,
         real_path=real_path,
         hashes=hashes,
         size=stat_result.st_size,
-        mac_timestamps=MACTimestamps(
-            modify_time=modify_time,
-            access_time=access_time,
-            change_time=change_time,
-        ),
+        mac_timestamps=stat_result.get_mac_timestamps(),
         stat_result=stat_result,
     )
 
@@ -122,9 +343,9 @@ def parse_stat_result(stat_result: os.stat_result) -> StatResult:
         st_uid=stat_result.st_uid,
         st_gid=stat_result.st_gid,
         st_size=stat_result.st_size,
-        st_atime=hodgepodge.time.to_datetime(stat_result.st_atime),
-        st_mtime=hodgepodge.time.to_datetime(stat_result.st_mtime),
-        st_ctime=hodgepodge.time.to_datetime(stat_result.st_ctime),
+        st_atime_ns=stat_result.st_atime_ns,
+        st_mtime_ns=stat_result.st_mtime_ns,
+        st_ctime_ns=stat_result.st_ctime_ns,
     )
 
 
@@ -132,124 +353,949 @@ def get_size(path: str) -> int:
     return stat(path).st_size
 
 
+def get_file_type(stat_result: Union[os.stat_result, StatResult]) -> Optional[str]:
+    file_type = _stat.S_IFMT(stat_result.st_mode)
+    for name, value in FILE_TYPES.items():
+        if value == file_type:
+            return name
+    return None
+
+
+@dataclass(frozen=True)
+class SnapshotEntry:
+    path: str
+    st_mode: int
+    st_ino: int
+    st_dev: int
+    st_size: int
+    st_mtime_ns: int
+    hashes: Optional[Hashes] = None
+
+    def is_unchanged(self, stat_result: os.stat_result) -> bool:
+        return (self.st_mode, self.st_ino, self.st_dev, self.st_size, self.st_mtime_ns) == (
+            stat_result.st_mode,
+            stat_result.st_ino,
+            stat_result.st_dev,
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+        )
+
+
+@dataclass()
+class Snapshot:
+    time_ns: int = 0
+    entries: Dict[str, SnapshotEntry] = field(default_factory=dict)
+    _children: Optional[Dict[str, List[SnapshotEntry]]] = field(default=None, init=False, repr=False, compare=False)
+
+    def get_children(self, path: str) -> List[SnapshotEntry]:
+        if self._children is None:
+            self._children = collections.defaultdict(list)
+            for entry in self.entries.values():
+                self._children[dirname(entry.path)].append(entry)
+        return self._children.get(path, [])
+
+
+@dataclass(frozen=True)
+class SnapshotDiff:
+    snapshot: Snapshot
+    added: List[File] = field(default_factory=list)
+    modified: List[File] = field(default_factory=list)
+    removed: List[SnapshotEntry] = field(default_factory=list)
+
+
+def read_snapshot(path: str) -> Snapshot:
+    with gzip.open(path, 'rt') as fp:
+        snapshot = Snapshot(**json.loads(next(fp)))
+        for line in fp:
+            data = json.loads(line)
+            if data['hashes']:
+                data['hashes'] = Hashes(**data['hashes'])
+
+            entry = SnapshotEntry(**data)
+            snapshot.entries[entry.path] = entry
+    return snapshot
+
+
+def write_snapshot(snapshot: Snapshot, path: str):
+    tmp = '{}.tmp'.format(path)
+    with gzip.open(tmp, 'wt') as fp:
+        fp.write(json.dumps({'time_ns': snapshot.time_ns}) + '\n')
+        for entry in snapshot.entries.values():
+            fp.write(hodgepodge.types.dataclass_to_json(entry) + '\n')
+    os.replace(tmp, path)
+
+
+class FileTable:
+    """
+    A compact, column-oriented set of search results.
+
+    Paths are stored as an interned table of directories plus a basename per row, and stat results are stored as
+    arrays of integers (with timestamps in nanoseconds) rather than as File objects, which can be materialised on demand
+    using get_file(). If NumPy is installed, the columns can be viewed as NumPy arrays without copying them.
+    """
+    COLUMNS = {
+        'st_mode': 'L',
+        'st_ino': 'Q',
+        'st_dev': 'Q',
+        'st_nlink': 'Q',
+        'st_uid': 'L',
+        'st_gid': 'L',
+        'st_size': 'q',
+        'st_atime_ns': 'q',
+        'st_mtime_ns': 'q',
+        'st_ctime_ns': 'q',
+    }
+
+    def __init__(self):
+        self.directories = []
+        self.directory_ids = array.array('L')
+        self.names = []
+        self.is_real_path = array.array('b')
+        self.columns = {name: array.array(typecode) for (name, typecode) in self.COLUMNS.items()}
+        self._directory_ids = {}
+
+    def append(self, path: str, real_path: Optional[str], stat_result: os.stat_result):
+        directory, name = os.path.split(path)
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+
+        self.directory_ids.append(directory_id)
+        self.names.append(name)
+        self.is_real_path.append(real_path == path)
+        for (column, values) in self.columns.items():
+            values.append(getattr(stat_result, column))
+
+    def get_path(self, i: int) -> str:
+        return os.path.join(self.directories[self.directory_ids[i]], self.names[i])
+
+    def get_paths(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.get_path(i)
+
+    def get_file(self, i: int) -> File:
+        path = self.get_path(i)
+        stat_result = StatResult(
+            st_mode=self.columns['st_mode'][i],
+            st_ino=self.columns['st_ino'][i],
+            st_dev=self.columns['st_dev'][i],
+            st_nlink=self.columns['st_nlink'][i],
+            st_uid=self.columns['st_uid'][i],
+            st_gid=self.columns['st_gid'][i],
+            st_size=self.columns['st_size'][i],
+            st_atime_ns=self.columns['st_atime_ns'][i],
+            st_mtime_ns=self.columns['st_mtime_ns'][i],
+            st_ctime_ns=self.columns['st_ctime_ns'][i],
+        )
+        return File(
+            path=path,
+            real_path=path if self.is_real_path[i] else get_real_path(path),
+            size=stat_result.st_size,
+            mac_timestamps=stat_result.get_mac_timestamps(),
+            stat_result=stat_result,
+        )
+
+    def filter(
+            self,
+            min_file_size: Optional[int] = None,
+            max_file_size: Optional[int] = None,
+            min_mtime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None,
+            max_mtime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None) -> 'FileTable':
+
+        ranges = [
+            ('st_size', min_file_size, max_file_size),
+            ('st_mtime_ns', _to_epoch_time_ns(min_mtime), _to_epoch_time_ns(max_mtime)),
+        ]
+        try:
+            import numpy
+        except ImportError:
+            selected = range(len(self))
+            for (column, minimum, maximum) in ranges:
+                values = self.columns[column]
+                if minimum is not None:
+                    selected = [i for i in selected if values[i] >= minimum]
+                if maximum is not None:
+                    selected = [i for i in selected if values[i] <= maximum]
+        else:
+            columns = self.to_numpy()
+            mask = numpy.ones(len(self), dtype=bool)
+            for (column, minimum, maximum) in ranges:
+                if minimum is not None:
+                    mask &= columns[column] >= minimum
+                if maximum is not None:
+                    mask &= columns[column] <= maximum
+            selected = numpy.flatnonzero(mask).tolist()
+        return self.take(selected)
+
+    def take(self, indices: Iterable[int]) -> 'FileTable':
+        table = FileTable()
+        table.directories = self.directories
+        table._directory_ids = self._directory_ids
+
+        indices = list(indices)
+        table.directory_ids = array.array(self.directory_ids.typecode, (self.directory_ids[i] for i in indices))
+        table.names = [self.names[i] for i in indices]
+        table.is_real_path = array.array(self.is_real_path.typecode, (self.is_real_path[i] for i in indices))
+        for (column, values) in self.columns.items():
+            table.columns[column] = array.array(values.typecode, (values[i] for i in indices))
+        return table
+
+    def to_numpy(self) -> Dict[str, Any]:
+        import numpy
+        return {column: numpy.frombuffer(values, dtype=values.typecode) for (column, values) in self.columns.items()}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i: int) -> File:
+        return self.get_file(i)
+
+    def __iter__(self) -> Iterator[File]:
+        for i in range(len(self)):
+            yield self.get_file(i)
+
+
+def _to_epoch_time_ns(timestamp: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None]) -> Optional[int]:
+
+    #: Timestamps are converted using integer arithmetic, since multiplying floating point epoch times by 10^9 loses
+    #: precision (e.g. a datetime wouldn't convert to the st_mtime_ns that it was created from).
+    if timestamp is None:
+        return None
+    elif isinstance(timestamp, int):
+        return timestamp * 1000 * 1000 * 1000
+    elif isinstance(timestamp, float):
+        seconds = math.floor(timestamp)
+        return seconds * 1000 * 1000 * 1000 + round((timestamp - seconds) * 1000 * 1000 * 1000)
+
+    t = hodgepodge.time.to_datetime(timestamp)
+    seconds = int(t.replace(microsecond=0).timestamp())
+    return seconds * 1000 * 1000 * 1000 + t.microsecond * 1000
+
+
+class DirectorySet:
+    """
+    A set of directories that can check whether a path is inside any of them using one lookup per parent directory.
+    """
+    def __init__(self, directories: Iterable[str] = None):
+        self.directories = frozenset(os.path.normpath(directory) for directory in (directories or []))
+
+    def contains(self, path: str) -> bool:
+        path = os.path.normpath(path)
+        while True:
+            if path in self.directories:
+                return True
+
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def __contains__(self, path: str) -> bool:
+        return self.contains(path)
+
+    def __bool__(self) -> bool:
+        return bool(self.directories)
+
+
+@dataclass(frozen=True)
+class _Filters:
+    filename_matcher: Optional[GlobMatcher] = None
+    min_mtime_ns: Optional[int] = None
+    max_mtime_ns: Optional[int] = None
+    min_atime_ns: Optional[int] = None
+    max_atime_ns: Optional[int] = None
+    min_ctime_ns: Optional[int] = None
+    max_ctime_ns: Optional[int] = None
+    file_types: Optional[FrozenSet[int]] = None
+    user_ids: Optional[FrozenSet[int]] = None
+    group_ids: Optional[FrozenSet[int]] = None
+    seen_inodes: Optional[Set[Tuple[int, int]]] = None
+
+    def is_in_time_range(self, stat_result: Union[os.stat_result, 'SnapshotEntry']) -> bool:
+        for (timestamp, minimum, maximum) in (
+            (stat_result.st_mtime_ns, self.min_mtime_ns, self.max_mtime_ns),
+            (getattr(stat_result, 'st_atime_ns', None), self.min_atime_ns, self.max_atime_ns),
+            (getattr(stat_result, 'st_ctime_ns', None), self.min_ctime_ns, self.max_ctime_ns),
+        ):
+            if timestamp is None:
+                continue
+            if minimum is not None and timestamp < minimum:
+                return False
+            if maximum is not None and timestamp > maximum:
+                return False
+        return True
+
+
+@dataclass(frozen=True)
+class _Directory:
+    path: str
+    stat_result: os.stat_result
+    search_depth: int
+    is_real_path: bool
+    search_root: str
+
+
 @dataclass(frozen=True)
 class FileSearch:
     roots: Optional[List[str]] = None
     ignored_paths: Optional[List[str]] = None
+    ignore_rules: Optional[List[str]] = None
     filename_patterns: Optional[List[str]] = None
     follow_symlinks: Optional[bool] = FOLLOW_SYMLINKS_BY_DEFAULT
     follow_mount_points: Optional[bool] = FOLLOW_MOUNT_POINTS_BY_DEFAULT
     case_sensitive: Optional[bool] = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT
     min_file_size: Optional[int] = None
     max_file_size: Optional[int] = None
+    min_mtime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None
+    max_mtime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None
+    min_atime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None
+    max_atime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None
+    min_ctime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None
+    max_ctime: Union[str, int, float, datetime.datetime, datetime.date, arrow.Arrow, None] = None
+    file_types: Optional[List[str]] = None
+    user_ids: Optional[List[int]] = None
+    group_ids: Optional[List[int]] = None
+    required_permissions: Optional[int] = None
+    excluded_permissions: Optional[int] = None
+    deduplicate_inodes: bool = DEDUPLICATE_INODES_BY_DEFAULT
     max_search_depth: Optional[int] = None
     max_search_results: Optional[int] = None
     include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT
+    hash_algorithms: Optional[List[str]] = None
+    max_workers: Optional[int] = None
+    ordered: bool = ORDER_SEARCH_RESULTS_BY_DEFAULT
+    max_hashing_workers: Optional[int] = None
+    max_pending_hashing_bytes: int = DEFAULT_MAX_PENDING_HASHING_BYTES
+    hash_cache: Optional[HashCache] = None
+    prune_unchanged_directories: bool = PRUNE_UNCHANGED_DIRECTORIES_BY_DEFAULT
 
     def iter_matching_files(self) -> Iterator[File]:
-        for path, stat_result in self._search():
-            absolute_path = get_absolute_path(path)
-            real_path = get_real_path(absolute_path)
-            stat_result = stat(absolute_path, follow_symlinks=self.follow_symlinks)
+        results = self._search()
+        if self.include_file_hashes and self.max_hashing_workers and self.max_hashing_workers > 1:
+            yield from self._iter_files_with_hashes(results)
+        else:
+            for (path, real_path, stat_result) in results:
+                yield self._get_file(path, real_path, stat_result, include_file_hashes=self.include_file_hashes)
+
+    def _get_file(self, path: str, real_path: Optional[str], stat_result: os.stat_result, include_file_hashes: bool) -> File:
+        return _get_file(
+            path=path,
+            real_path=real_path or get_real_path(path),
+            stat_result=stat_result,
+            include_file_hashes=include_file_hashes,
+            hash_cache=self.hash_cache,
+            hash_algorithms=self.hash_algorithms,
+        )
 
-            hashes = None
-            if self.include_file_hashes and _stat.S_ISREG(stat_result.st_mode):
-                hashes = hodgepodge.hashing.get_file_hashes(absolute_path)
+    def _iter_files_with_hashes(self, results: Iterator[Tuple[str, Optional[str], os.stat_result]]) -> Iterator[File]:
+
+        #: Regular files are hashed by a pool of worker threads (hashlib releases the GIL while hashing) and are yielded
+        #: as soon as their hashes are ready. Files waiting to be hashed are scheduled largest first to avoid a long tail,
+        #: and the search is paused while too many files or too many bytes are waiting to be hashed.
+        max_queued_files = self.max_hashing_workers * PENDING_FILES_PER_HASHING_WORKER
+        queue = []
+        running = {}
+        pending_bytes = 0
+
+        def schedule():
+            nonlocal pending_bytes
+            while queue and len(running) < self.max_hashing_workers:
+                size = -queue[0][0]
+                if running and pending_bytes + size > self.max_pending_hashing_bytes:
+                    break
+
+                _, _, result = heapq.heappop(queue)
+                future = executor.submit(self._get_file, *result, include_file_hashes=True)
+                running[future] = size
+                pending_bytes += size
+
+        def collect(timeout: Optional[float] = None) -> Iterator[File]:
+            nonlocal pending_bytes
+            done, _ = concurrent.futures.wait(running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                pending_bytes -= running.pop(future)
+                yield future.result()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_hashing_workers) as executor:
+            try:
+                for i, (path, real_path, stat_result) in enumerate(results):
+                    if not _stat.S_ISREG(stat_result.st_mode):
+                        yield self._get_file(path, real_path, stat_result, include_file_hashes=False)
+                        continue
 
-            modify_time, access_time, change_time = stat_result.get_mac_timestamps()
+                    heapq.heappush(queue, (-stat_result.st_size, i, (path, real_path, stat_result)))
+                    schedule()
+                    yield from collect(timeout=0)
+
+                    while len(queue) >= max_queued_files:
+                        yield from collect()
+                        schedule()
+
+                while queue or running:
+                    schedule()
+                    yield from collect()
+            finally:
+                results.close()
+                for future in running:
+                    future.cancel()
+
+    def get_file_table(self) -> FileTable:
+        table = FileTable()
+        for (path, real_path, stat_result) in self._search():
+            table.append(path, real_path, stat_result)
+        return table
+
+    def iter_duplicate_files(self, hash_algorithm: str = hodgepodge.hashing.SHA256) -> Iterator[List[File]]:
+        """
+        Finds groups of matching regular files with identical contents.
+
+        Files are grouped by size, then by a quick hash of their first and last 64 KiB, and only files that still
+        collide are fully hashed (using `hash_algorithm`) - files with a unique size are never read. Paths referring to
+        the same inode (i.e. hardlinks) are treated as a single file, and the first path that was found is reported.
+        """
+        hash_algorithms = hodgepodge.hashing.get_hash_algorithms([hash_algorithm])
+
+        #: Group files by size.
+        inodes = set()
+        files_by_size = collections.defaultdict(list)
+        for result in self._search():
+            stat_result = result[2]
+            if not _stat.S_ISREG(stat_result.st_mode):
+                continue
+
+            inode = stat_result.st_dev, stat_result.st_ino
+            if inode not in inodes:
+                inodes.add(inode)
+                files_by_size[stat_result.st_size].append(result)
+
+        def get_quick_hash(result: Tuple[str, Optional[str], os.stat_result]) -> int:
+            path, _, stat_result = result
+            if stat_result.st_size <= 2 * hodgepodge.hashing.DEFAULT_QUICK_HASH_SAMPLE_SIZE:
+                return 0
+            return hodgepodge.hashing.get_quick_file_hash(path)
+
+        def get_hashes(result: Tuple[str, Optional[str], os.stat_result]) -> Hashes:
+            path, _, stat_result = result
+            if self.hash_cache is not None:
+                return self.hash_cache.get_file_hashes(path, stat_result=stat_result, hash_algorithms=hash_algorithms)
+            return hodgepodge.hashing.get_file_hashes(path, hash_algorithms=hash_algorithms)
+
+        executor = None
+        if self.max_hashing_workers and self.max_hashing_workers > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_hashing_workers)
+        try:
+            for size, results in files_by_size.items():
+                if len(results) < 2:
+                    continue
 
-            yield File(
-                path=absolute_path,
-                real_path=real_path,
-                hashes=hashes,
-                size=stat_result.st_size,
-                mac_timestamps=MACTimestamps(
-                    modify_time=modify_time,
-                    access_time=access_time,
-                    change_time=change_time,
-                ),
-                stat_result=stat_result,
-            )
+                #: Files that are small enough to be read in full by the quick hash are fully hashed straight away.
+                for _, results in _group_by(results, key=get_quick_hash, executor=executor):
+                    for hashes, results in _group_by(results, key=get_hashes, executor=executor):
+                        yield [
+                            dataclasses.replace(self._get_file(*result, include_file_hashes=False), hashes=hashes)
+                            for result in results
+                        ]
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
     def iter_matching_paths(self) -> Iterator[str]:
-        for path, _ in self._search():
+        for path, _, _ in self._search():
             yield path
 
-    def _search(self) -> Iterator[Tuple[str, os.stat_result]]:
+    def _search(self) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
         roots = get_paths(self.roots)
-        ignored_paths = get_paths(self.ignored_paths)
+        ignored_paths = DirectorySet(get_paths(self.ignored_paths))
+        ignore_rules = self._get_ignore_rules()
+
+        if self.max_workers and self.max_workers > 1:
+            results = self._walk_in_parallel(roots=roots, ignored_paths=ignored_paths, ignore_rules=ignore_rules)
+        else:
+            results = (
+                result for root in roots for result in
+                self._walk(root=root, ignored_paths=ignored_paths, ignore_rules=ignore_rules)
+            )
+
+        filters = self._get_filters()
 
         i = 0
-        for root in roots:
-            for (path, stat_result) in self._walk(root=root, ignored_paths=ignored_paths):
+        for (path, real_path, stat_result) in results:
+            if not self._matches_stat_result(stat_result=stat_result, filters=filters):
+                continue
+
+            #: Real paths are only resolved once the cheaper stat-based filters have passed, and are kept for the result.
+            if filters.filename_matcher:
+                real_path = real_path or get_real_path(path)
+                if not self._matches_filename(path=path, real_path=real_path, filters=filters):
+                    continue
 
-                #: Filter files by size.
-                if (self.min_file_size or self.max_file_size) and not \
-                        hodgepodge.math.in_range(stat_result.st_size, minimum=self.min_file_size, maximum=self.max_file_size):
+            #: Optionally skip paths that refer to an inode that has already been seen (e.g. hardlinks).
+            if filters.seen_inodes is not None:
+                inode = stat_result.st_dev, stat_result.st_ino
+                if inode in filters.seen_inodes:
                     continue
+                filters.seen_inodes.add(inode)
 
-                #: Filter files by path/name.
-                real_path = get_real_path(path)
-                if self.filename_patterns:
-                    filenames = {
-                        real_path,
-                        get_base_name(path),
-                        get_base_name(real_path),
-                    }
-                    if not hodgepodge.pattern_matching.str_matches_glob(filenames, self.filename_patterns, self.case_sensitive):
-                        continue
+            yield path, real_path, stat_result
+
+            #: Optionally limit the number of search results.
+            i += 1
+            if self.max_search_results and i >= self.max_search_results:
+                results.close()
+                return
+
+    def _matches(
+            self,
+            path: str,
+            real_path: Optional[str],
+            stat_result: Union[os.stat_result, SnapshotEntry],
+            filters: _Filters) -> bool:
+
+        if not self._matches_stat_result(stat_result=stat_result, filters=filters):
+            return False
+
+        #: Filter files by path/name - real paths are only resolved if they aren't already known.
+        if filters.filename_matcher:
+            return self._matches_filename(path=path, real_path=real_path or get_real_path(path), filters=filters)
+        return True
+
+    def _matches_stat_result(self, stat_result: Union[os.stat_result, SnapshotEntry], filters: _Filters) -> bool:
+
+        #: Filter files by size.
+        if (self.min_file_size or self.max_file_size) and not \
+                hodgepodge.math.in_range(stat_result.st_size, minimum=self.min_file_size, maximum=self.max_file_size):
+            return False
+
+        #: Filter files by type.
+        if filters.file_types is not None and _stat.S_IFMT(stat_result.st_mode) not in filters.file_types:
+            return False
+
+        #: Filter files by permissions.
+        permissions = _stat.S_IMODE(stat_result.st_mode)
+        if self.required_permissions and permissions & self.required_permissions != self.required_permissions:
+            return False
+        if self.excluded_permissions and permissions & self.excluded_permissions:
+            return False
+
+        #: Filter files by owner - snapshot entries don't record owners, so they're only filtered by the other criteria.
+        if isinstance(stat_result, os.stat_result):
+            if filters.user_ids is not None and stat_result.st_uid not in filters.user_ids:
+                return False
+            if filters.group_ids is not None and stat_result.st_gid not in filters.group_ids:
+                return False
+
+        #: Filter files by modify, access, and change time - timestamps are compared as integers to avoid converting them.
+        return filters.is_in_time_range(stat_result)
+
+    @staticmethod
+    def _matches_filename(path: str, real_path: str, filters: _Filters) -> bool:
+        filenames = {
+            real_path,
+            get_base_name(path),
+            get_base_name(real_path),
+        }
+        return filters.filename_matcher.matches(filenames)
+
+    def _get_filters(self) -> _Filters:
+        filename_matcher = None
+        if self.filename_patterns:
+            filename_matcher = hodgepodge.pattern_matching.compile_globs(self.filename_patterns, case_sensitive=self.case_sensitive)
+
+        file_types = None
+        if self.file_types is not None:
+            unsupported_file_types = set(self.file_types) - set(FILE_TYPES)
+            if unsupported_file_types:
+                raise ValueError("Unsupported file types: {} (supported: {})".format(
+                    sorted(unsupported_file_types), sorted(FILE_TYPES)))
+            file_types = frozenset(FILE_TYPES[file_type] for file_type in self.file_types)
+
+        return _Filters(
+            filename_matcher=filename_matcher,
+            min_mtime_ns=_to_epoch_time_ns(self.min_mtime),
+            max_mtime_ns=_to_epoch_time_ns(self.max_mtime),
+            min_atime_ns=_to_epoch_time_ns(self.min_atime),
+            max_atime_ns=_to_epoch_time_ns(self.max_atime),
+            min_ctime_ns=_to_epoch_time_ns(self.min_ctime),
+            max_ctime_ns=_to_epoch_time_ns(self.max_ctime),
+            file_types=file_types,
+            user_ids=frozenset(self.user_ids) if self.user_ids is not None else None,
+            group_ids=frozenset(self.group_ids) if self.group_ids is not None else None,
+            seen_inodes=set() if self.deduplicate_inodes else None,
+        )
+
+    def get_snapshot(self) -> Snapshot:
+        return self.diff(Snapshot()).snapshot
+
+    def diff(self, snapshot: Snapshot) -> SnapshotDiff:
+
+        #: Everything below the search roots is recorded in the new snapshot so that later searches can prune unchanged
+        #: directories, but only files matching the search criteria are reported as changes or hashed.
+        time_ns = int(hodgepodge.time.current_time_as_epoch_time() * 1000 * 1000 * 1000)
+        diff = SnapshotDiff(snapshot=Snapshot(time_ns=time_ns))
+        entries = diff.snapshot.entries
+        filters = self._get_filters()
+
+        for (path, real_path, stat_result, previous) in self._walk_snapshot(snapshot):
+            if stat_result is None or (previous and previous.is_unchanged(stat_result)):
+                entries[path] = previous
+                continue
+
+            hashes = None
+            if self._matches(path=path, real_path=real_path, stat_result=stat_result, filters=filters):
+                file = self._get_file(path, real_path, stat_result, include_file_hashes=self.include_file_hashes)
+                hashes = file.hashes
+                if previous:
+                    diff.modified.append(file)
+                else:
+                    diff.added.append(file)
+
+            entries[path] = SnapshotEntry(
+                path=path,
+                st_mode=stat_result.st_mode,
+                st_ino=stat_result.st_ino,
+                st_dev=stat_result.st_dev,
+                st_size=stat_result.st_size,
+                st_mtime_ns=stat_result.st_mtime_ns,
+                hashes=hashes,
+            )
+
+        for path, entry in snapshot.entries.items():
+            if path in entries:
+                continue
 
-                yield path, stat_result
+            if self._matches(path=path, real_path=None, stat_result=entry, filters=filters):
+                diff.removed.append(entry)
+        return diff
 
-                #: Optionally limit the number of search results.
-                i += 1
-                if self.max_search_results and i >= self.max_search_results:
-                    return
+    def _walk_snapshot(
+            self,
+            snapshot: Snapshot) -> Iterator[Tuple[str, Optional[str], Optional[os.stat_result], Optional[SnapshotEntry]]]:
+
+        ignored_paths = DirectorySet(get_paths(self.ignored_paths))
+        ignore_rules = self._get_ignore_rules()
+        for root in get_paths(self.roots):
+            directory = self._get_search_root(root)
+            if directory:
+                real_path = root if directory.is_real_path else None
+                yield root, real_path, directory.stat_result, snapshot.entries.get(root)
+
+                if _stat.S_ISDIR(directory.stat_result.st_mode):
+                    yield from self._walk_snapshot_directory(
+                        directory, ignored_paths=ignored_paths, ignore_rules=ignore_rules, snapshot=snapshot)
+
+    def _walk_snapshot_directory(
+            self,
+            directory: _Directory,
+            ignored_paths: DirectorySet,
+            ignore_rules: Optional[IgnoreRules],
+            snapshot: Snapshot) -> Iterator[Tuple[str, Optional[str], Optional[os.stat_result], Optional[SnapshotEntry]]]:
+
+        #: If a directory hasn't been modified since the last snapshot, its entries are taken from the last snapshot
+        #: rather than by listing it. Files are assumed to be unchanged, while subdirectories are stat'd to check whether
+        #: they need to be listed. Note that files modified in-place won't be detected inside unmodified directories.
+        previous = snapshot.entries.get(directory.path)
+        if self.prune_unchanged_directories and previous and previous.is_unchanged(directory.stat_result) and \
+                previous.st_mtime_ns < snapshot.time_ns - DIRECTORY_MTIME_GRANULARITY_NS:
+            entries = self._iter_snapshot_children(directory.path, snapshot=snapshot)
+        else:
+            entries = (
+                (path, real_path, stat_result, snapshot.entries.get(path)) for (path, real_path, stat_result) in
+                self._scan_directory(directory, ignore_rules=ignore_rules)
+            )
+
+        for (path, real_path, stat_result, previous) in entries:
+            yield path, real_path, stat_result, previous
+
+            if stat_result is not None:
+                subdirectory = self._get_searchable_directory(
+                    path=path,
+                    real_path=real_path,
+                    stat_result=stat_result,
+                    parent=directory,
+                    ignored_paths=ignored_paths,
+                )
+                if subdirectory:
+                    yield from self._walk_snapshot_directory(
+                        subdirectory, ignored_paths=ignored_paths, ignore_rules=ignore_rules, snapshot=snapshot)
+
+    def _iter_snapshot_children(
+            self,
+            path: str,
+            snapshot: Snapshot) -> Iterator[Tuple[str, Optional[str], Optional[os.stat_result], SnapshotEntry]]:
+
+        for entry in snapshot.get_children(path):
+            if _stat.S_ISDIR(entry.st_mode):
+                try:
+                    stat_result = os.stat(entry.path, follow_symlinks=self.follow_symlinks)
+                except FileNotFoundError:
+                    continue
+                yield entry.path, None, stat_result, entry
+            else:
+                yield entry.path, None, None, entry
 
     def _walk(
             self,
             root: str,
-            ignored_paths: Iterable[str],
-            current_search_depth: int = 0) -> Iterator[Tuple[str, os.stat_result]]:
+            ignored_paths: DirectorySet,
+            ignore_rules: Optional[IgnoreRules]) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
+
+        #: Each path is only stat'd once - search roots are stat'd here, and everything else reuses the stat result of
+        #: its directory entry. Real paths are only included if they're known without resolving them (i.e. if neither
+        #: the path nor any of its parents are symlinks), otherwise they're None.
+        directory = self._get_search_root(root)
+        if directory:
+            yield root, root if directory.is_real_path else None, directory.stat_result
+            if _stat.S_ISDIR(directory.stat_result.st_mode):
+                yield from self._walk_directory(directory, ignored_paths=ignored_paths, ignore_rules=ignore_rules)
+
+    def _walk_directory(
+            self,
+            directory: _Directory,
+            ignored_paths: DirectorySet,
+            ignore_rules: Optional[IgnoreRules]) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
 
+        for (path, real_path, stat_result) in self._scan_directory(directory, ignore_rules=ignore_rules):
+            yield path, real_path, stat_result
+
+            subdirectory = self._get_searchable_directory(
+                path=path,
+                real_path=real_path,
+                stat_result=stat_result,
+                parent=directory,
+                ignored_paths=ignored_paths,
+            )
+            if subdirectory:
+                yield from self._walk_directory(subdirectory, ignored_paths=ignored_paths, ignore_rules=ignore_rules)
+
+    def _walk_in_parallel(
+            self,
+            roots: Iterable[str],
+            ignored_paths: DirectorySet,
+            ignore_rules: Optional[IgnoreRules]) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
+
+        #: Each directory is listed as a separate work item, so idle workers will pick up directories from deep subtrees
+        #: rather than waiting for a single worker to walk the whole subtree on its own.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            try:
+                if self.ordered:
+                    yield from self._walk_in_parallel_in_order(
+                        roots=roots,
+                        ignored_paths=ignored_paths,
+                        ignore_rules=ignore_rules,
+                        executor=executor,
+                        futures=futures,
+                    )
+                else:
+                    yield from self._walk_in_parallel_out_of_order(
+                        roots=roots,
+                        ignored_paths=ignored_paths,
+                        ignore_rules=ignore_rules,
+                        executor=executor,
+                        futures=futures,
+                    )
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _walk_in_parallel_in_order(
+            self,
+            roots: Iterable[str],
+            ignored_paths: DirectorySet,
+            ignore_rules: Optional[IgnoreRules],
+            executor: concurrent.futures.Executor,
+            futures: Dict[concurrent.futures.Future, _Directory]) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
+
+        #: Directory listings are prefetched in the background and consumed in the same order as a serial search.
+        max_pending_directories = self.max_workers * PENDING_DIRECTORIES_PER_SEARCH_WORKER
+        listings = {}
+
+        def prefetch(directory: _Directory):
+            if len(listings) < max_pending_directories:
+                future = executor.submit(self._list_directory, directory, ignore_rules)
+                listings[directory.path] = future
+                futures[future] = directory
+
+        def visit(directory: _Directory) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
+            future = listings.pop(directory.path, None) or executor.submit(self._list_directory, directory, ignore_rules)
+            futures.pop(future, None)
+
+            entries = []
+            for (path, real_path, stat_result) in future.result():
+                subdirectory = self._get_searchable_directory(
+                    path=path,
+                    real_path=real_path,
+                    stat_result=stat_result,
+                    parent=directory,
+                    ignored_paths=ignored_paths,
+                )
+                if subdirectory:
+                    prefetch(subdirectory)
+                entries.append(((path, real_path, stat_result), subdirectory))
+
+            for entry, subdirectory in entries:
+                yield entry
+                if subdirectory:
+                    yield from visit(subdirectory)
+
+        directories = []
+        for root in roots:
+            directory = self._get_search_root(root)
+            if directory:
+                directories.append(directory)
+                if _stat.S_ISDIR(directory.stat_result.st_mode):
+                    prefetch(directory)
+
+        for directory in directories:
+            yield directory.path, directory.path if directory.is_real_path else None, directory.stat_result
+            if _stat.S_ISDIR(directory.stat_result.st_mode):
+                yield from visit(directory)
+
+    def _walk_in_parallel_out_of_order(
+            self,
+            roots: Iterable[str],
+            ignored_paths: DirectorySet,
+            ignore_rules: Optional[IgnoreRules],
+            executor: concurrent.futures.Executor,
+            futures: Dict[concurrent.futures.Future, _Directory]) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
+
+        #: Directory listings are consumed as soon as they're ready - pending directories are handled most recent first
+        #: to keep the backlog of pending directories small.
+        max_pending_directories = self.max_workers * PENDING_DIRECTORIES_PER_SEARCH_WORKER
+        pending = collections.deque()
+
+        for root in roots:
+            directory = self._get_search_root(root)
+            if directory:
+                yield directory.path, directory.path if directory.is_real_path else None, directory.stat_result
+                if _stat.S_ISDIR(directory.stat_result.st_mode):
+                    pending.append(directory)
+
+        while pending or futures:
+            while pending and len(futures) < max_pending_directories:
+                directory = pending.pop()
+                futures[executor.submit(self._list_directory, directory, ignore_rules)] = directory
+
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                directory = futures.pop(future)
+                for (path, real_path, stat_result) in future.result():
+                    yield path, real_path, stat_result
+
+                    subdirectory = self._get_searchable_directory(
+                        path=path,
+                        real_path=real_path,
+                        stat_result=stat_result,
+                        parent=directory,
+                        ignored_paths=ignored_paths,
+                    )
+                    if subdirectory:
+                        pending.append(subdirectory)
+
+    def _get_search_root(self, root: str) -> Optional[_Directory]:
+        stat_result = self._stat_search_root(root)
+        if stat_result is not None:
+            return _Directory(
+                path=root,
+                stat_result=stat_result,
+                search_depth=0,
+                is_real_path=root == get_real_path(root),
+                search_root=root,
+            )
+
+    def _get_searchable_directory(
+            self,
+            path: str,
+            real_path: Optional[str],
+            stat_result: os.stat_result,
+            parent: _Directory,
+            ignored_paths: DirectorySet) -> Optional[_Directory]:
+
+        search_depth = parent.search_depth + 1
+        if self._is_searchable_directory(
+                path=path,
+                stat_result=stat_result,
+                parent_stat_result=parent.stat_result,
+                search_depth=search_depth,
+                ignored_paths=ignored_paths):
+
+            return _Directory(
+                path=path,
+                stat_result=stat_result,
+                search_depth=search_depth,
+                is_real_path=real_path is not None,
+                search_root=parent.search_root,
+            )
+
+    def _list_directory(
+            self,
+            directory: _Directory,
+            ignore_rules: Optional[IgnoreRules]) -> List[Tuple[str, Optional[str], os.stat_result]]:
+        return list(self._scan_directory(directory, ignore_rules=ignore_rules))
+
+    def _stat_search_root(self, root: str) -> Optional[os.stat_result]:
         try:
-            entries = os.scandir(root)
+            return os.stat(root, follow_symlinks=self.follow_symlinks)
         except FileNotFoundError:
+            return None
+
+    def _scan_directory(
+            self,
+            directory: _Directory,
+            ignore_rules: Optional[IgnoreRules]) -> Iterator[Tuple[str, Optional[str], os.stat_result]]:
+        try:
+            entries = os.scandir(directory.path)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
             return
-        except (NotADirectoryError, PermissionError):
-            yield root, os.stat(root, follow_symlinks=self.follow_symlinks)
-        else:
-            yield root, os.stat(root, follow_symlinks=self.follow_symlinks)
 
-            current_search_depth += 1
+        #: Paths excluded by the ignore rules (which are compiled once per search) are skipped before they're stat'd, and
+        #: excluded directories aren't listed.
+        offset = len(os.path.join(directory.search_root, ''))
+
+        with entries:
             for entry in entries:
-                path = getattr(entry, 'path')
-                stat_result = getattr(entry, 'stat')(follow_symlinks=self.follow_symlinks)
-                yield path, stat_result
+                path = entry.path
+                if ignore_rules and ignore_rules.is_ignored(
+                        path=path[offset:].replace(os.sep, '/'),
+                        is_directory=entry.is_dir(follow_symlinks=self.follow_symlinks)):
+                    continue
 
-                #: If this is a subdirectory.
-                if _stat.S_ISDIR(stat_result.st_mode):
+                try:
+                    stat_result = entry.stat(follow_symlinks=self.follow_symlinks)
+                except FileNotFoundError:
+                    continue
 
-                    #: Optionally limit search depth.
-                    if self.max_search_depth and current_search_depth >= self.max_search_depth:
-                        continue
+                is_real_path = directory.is_real_path and not entry.is_symlink()
+                yield path, path if is_real_path else None, stat_result
 
-                    #: Optionally disable mount point following.
-                    if self.follow_mount_points is False:
-                        a = stat_result
-                        b = os.stat(root, follow_symlinks=self.follow_symlinks)
-                        if a.st_dev != b.st_dev:
-                            continue
+    def _get_ignore_rules(self) -> Optional[IgnoreRules]:
+        if self.ignore_rules:
+            return hodgepodge.pattern_matching.compile_ignore_rules(self.ignore_rules, case_sensitive=self.case_sensitive)
 
-                    #: Optionally ignore certain directories.
-                    if self.ignored_paths and in_directory(path, directories=ignored_paths):
-                        continue
+    def _is_searchable_directory(
+            self,
+            path: str,
+            stat_result: os.stat_result,
+            parent_stat_result: os.stat_result,
+            search_depth: int,
+            ignored_paths: DirectorySet) -> bool:
 
-                    yield from self._walk(
-                        root=path,
-                        ignored_paths=ignored_paths,
-                        current_search_depth=current_search_depth,
-                    )
+        if not _stat.S_ISDIR(stat_result.st_mode):
+            return False
+
+        #: Optionally limit search depth.
+        if self.max_search_depth and search_depth >= self.max_search_depth:
+            return False
+
+        #: Optionally disable mount point following.
+        if self.follow_mount_points is False and stat_result.st_dev != parent_stat_result.st_dev:
+            return False
+
+        #: Optionally ignore certain directories.
+        if ignored_paths and in_directory(path, directories=ignored_paths):
+            return False
+        return True
 
     def __iter__(self):
         return self.iter_matching_files()
@@ -300,13 +1346,34 @@ def get_paths(paths: Iterable[str]) -> List[str]:
     return sorted(results)
 
 
-def in_directory(path: str, directories: Iterable[str]) -> bool:
-    path = os.path.join(path, '')
-    for directory in directories:
-        directory = os.path.join(directory, '')
-        if path.startswith(directory):
-            return True
-    return False
+def _group_by(
+        items: List[Any],
+        key: Callable[[Any], Any],
+        executor: Optional[concurrent.futures.Executor] = None) -> Iterator[Tuple[Any, List[Any]]]:
+
+    #: Items for which the key can't be calculated (e.g. files that have since been deleted) are left out, as are groups
+    #: with a single item.
+    def get_key(item: Any) -> Any:
+        try:
+            return key(item)
+        except OSError:
+            return None
+
+    groups = collections.defaultdict(list)
+    keys = executor.map(get_key, items) if executor is not None else map(get_key, items)
+    for item, k in zip(items, keys):
+        if k is not None:
+            groups[k].append(item)
+
+    for k, group in groups.items():
+        if len(group) > 1:
+            yield k, group
+
+
+def in_directory(path: str, directories: Union[DirectorySet, Iterable[str]]) -> bool:
+    if not isinstance(directories, DirectorySet):
+        directories = DirectorySet(directories)
+    return directories.contains(path)
 
 
 def get_real_path(path: str) -> str:
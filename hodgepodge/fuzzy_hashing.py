@@ -0,0 +1,261 @@
+"""
+Context-triggered piecewise hashing (CTPH) in the style of ssdeep, and an index for finding similar digests.
+
+Digests have the form `<block size>:<part 1>:<part 2>`. Each part is made of one base64 character per piece of the
+input, where pieces end wherever a rolling hash of the last 7 bytes hits a trigger value that depends on the block size
+(part 2 uses twice the block size of part 1). Because piece boundaries depend on content rather than on offsets,
+inserting, removing or changing bytes only changes the characters of the pieces that were touched, so similar inputs
+have digests with a small edit distance.
+
+The digests are not byte-for-byte compatible with ssdeep's: pieces are hashed using CRC32 so that they can be hashed
+in C rather than a byte at a time, and digests should only be compared with other digests produced by this module.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import collections
+import zlib
+
+SPAMSUM_LENGTH = 64
+MIN_BLOCK_SIZE = 3
+ROLLING_WINDOW_SIZE = 7
+
+#: Digests are only compared if their signatures have a substring of at least this many characters in common.
+MIN_COMMON_SUBSTRING_LENGTH = 7
+
+BASE64_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+_WINDOW_MASK = (1 << (8 * ROLLING_WINDOW_SIZE)) - 1
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+
+class _BlockHash:
+    __slots__ = ['block_size', 'chars', 'crc', 'offset']
+
+    def __init__(self, block_size: int, offset: int = 0):
+        self.block_size = block_size
+        self.chars = []
+        self.crc = 0
+        self.offset = offset
+
+    def get_signature(self, max_length: int) -> str:
+        chars = self.chars[:max_length - 1] if self.crc else self.chars[:max_length]
+        if self.crc:
+            chars = chars + [BASE64_ALPHABET[self.crc % 64]]
+        return ''.join(chars)
+
+
+class CTPH:
+    """
+    A streaming CTPH digest with a hashlib-like interface.
+
+    The block size is chosen as data is hashed (rather than from the size of the input), so the total size of the
+    input doesn't need to be known up front.
+    """
+    name = 'ctph'
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview, None] = None):
+        self._block_hashes = [_BlockHash(MIN_BLOCK_SIZE), _BlockHash(MIN_BLOCK_SIZE * 2)]
+        self._window = 0
+        if data:
+            self.update(data)
+
+    def update(self, data: Union[bytes, bytearray, memoryview]):
+        block_hashes = self._block_hashes
+        window = self._window
+        block_size = block_hashes[0].block_size
+
+        #: The rolling hash is the only part of the digest that's calculated a byte at a time - pieces are hashed in bulk
+        #: once their boundaries are known.
+        for (i, c) in enumerate(data):
+            window = ((window << 8) | c) & _WINDOW_MASK
+            h = ((window * _MULTIPLIER) & _MASK_64) >> 32
+            if h % block_size == block_size - 1:
+                self._end_pieces(data, end=i + 1, h=h)
+                block_size = block_hashes[0].block_size
+
+        for block_hash in block_hashes:
+            block_hash.crc = zlib.crc32(data[block_hash.offset:], block_hash.crc)
+            block_hash.offset = 0
+        self._window = window
+
+    def _end_pieces(self, data: Union[bytes, bytearray, memoryview], end: int, h: int):
+        block_hashes = self._block_hashes
+
+        #: Block sizes double from one block hash to the next, so a piece can only end at a block size if it also ends at
+        #: every smaller block size.
+        for block_hash in list(block_hashes):
+            if h % block_hash.block_size != block_hash.block_size - 1:
+                break
+
+            crc = zlib.crc32(data[block_hash.offset:end], block_hash.crc)
+            block_hash.chars.append(BASE64_ALPHABET[crc % 64])
+            block_hash.crc = 0
+            block_hash.offset = end
+
+        #: Start hashing at a larger block size once the largest one is half full, and stop hashing at the smallest one
+        #: once the next one no longer fits in a digest (at which point neither would be used).
+        top = block_hashes[-1]
+        if len(top.chars) >= SPAMSUM_LENGTH // 2:
+            block_hashes.append(_BlockHash(top.block_size * 2, offset=end))
+        if len(block_hashes) > 2 and len(block_hashes[1].chars) > SPAMSUM_LENGTH:
+            del block_hashes[0]
+
+    def hexdigest(self) -> str:
+        block_hashes = self._block_hashes
+        i = 0
+        while i < len(block_hashes) - 2 and len(block_hashes[i].get_signature(SPAMSUM_LENGTH + 1)) > SPAMSUM_LENGTH:
+            i += 1
+
+        return '{}:{}:{}'.format(
+            block_hashes[i].block_size,
+            block_hashes[i].get_signature(SPAMSUM_LENGTH),
+            block_hashes[i + 1].get_signature(SPAMSUM_LENGTH // 2),
+        )
+
+    digest = hexdigest
+
+
+def get_ctph(data: Union[str, bytes]) -> str:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return CTPH(data).hexdigest()
+
+
+def parse_ctph(digest: str) -> Tuple[int, str, str]:
+    try:
+        block_size, a, b = digest.split(':', 2)
+        return int(block_size), a, b
+    except ValueError:
+        raise ValueError("Invalid CTPH digest: {}".format(digest)) from None
+
+
+def compare(a: str, b: str) -> int:
+    """
+    Compares two CTPH digests and returns a similarity score between 0 (no similarity) and 100 (identical).
+
+    Only digests whose block sizes are equal or differ by a factor of two can be compared.
+    """
+    if a == b:
+        return 100
+
+    block_size_a, a1, a2 = parse_ctph(a)
+    block_size_b, b1, b2 = parse_ctph(b)
+    a1, a2, b1, b2 = map(_eliminate_sequences, (a1, a2, b1, b2))
+
+    if block_size_a == block_size_b:
+        return max(_score(a1, b1, block_size_a), _score(a2, b2, block_size_a * 2))
+    elif block_size_a == block_size_b * 2:
+        return _score(a1, b2, block_size_a)
+    elif block_size_b == block_size_a * 2:
+        return _score(a2, b1, block_size_b)
+    return 0
+
+
+def _score(a: str, b: str, block_size: int) -> int:
+    if not (_get_ngrams(a) & _get_ngrams(b)):
+        return 0
+
+    distance = _get_edit_distance(a, b)
+    score = (distance * SPAMSUM_LENGTH) // (len(a) + len(b))
+    score = (100 * score) // SPAMSUM_LENGTH
+    if score >= 100:
+        return 0
+    score = 100 - score
+
+    #: Signatures of small inputs are made of few, small pieces, so they're capped to avoid exaggerating matches.
+    cap = block_size // MIN_BLOCK_SIZE * min(len(a), len(b))
+    return min(score, cap)
+
+
+def _get_edit_distance(a: str, b: str) -> int:
+
+    #: Insertions and deletions cost 1, and substitutions cost 2.
+    previous = list(range(len(b) + 1))
+    for (i, x) in enumerate(a, start=1):
+        current = [i]
+        for (j, y) in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (0 if x == y else 2),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def _eliminate_sequences(signature: str) -> str:
+
+    #: Runs of more than three identical characters carry little information, so they're shortened to three characters.
+    chars = []
+    for c in signature:
+        if len(chars) < 3 or not (c == chars[-1] == chars[-2] == chars[-3]):
+            chars.append(c)
+    return ''.join(chars)
+
+
+def _get_ngrams(signature: str) -> Set[str]:
+    n = MIN_COMMON_SUBSTRING_LENGTH
+    return {signature[i:i + n] for i in range(len(signature) - n + 1)}
+
+
+class SimilarityIndex:
+    """
+    An index of CTPH digests that finds the digests most similar to a given digest.
+
+    Two digests can only have a non-zero similarity score if they have compatible block sizes and a substring of at
+    least 7 characters in common, so digests are indexed by (block size, 7-gram) and only digests sharing at least one
+    of those with the query are scored, rather than comparing the query against every digest.
+    """
+    def __init__(self, items: Optional[Iterable[Tuple[Any, str]]] = None):
+        self._digests: Dict[Any, str] = {}
+        self._order: Dict[Any, int] = {}
+        self._index: Dict[Tuple[int, str], Set[Any]] = collections.defaultdict(set)
+        for (key, digest) in items or ():
+            self.add(key, digest)
+
+    def add(self, key: Any, digest: str):
+        if key in self._digests:
+            self.remove(key)
+
+        self._digests[key] = digest
+        self._order[key] = len(self._order)
+        for k in _get_index_keys(digest):
+            self._index[k].add(key)
+
+    def remove(self, key: Any):
+        digest = self._digests.pop(key)
+        del self._order[key]
+        for k in _get_index_keys(digest):
+            keys = self._index[k]
+            keys.discard(key)
+            if not keys:
+                del self._index[k]
+
+    def query(self, digest: str, limit: Optional[int] = 10, min_score: int = 1) -> List[Tuple[Any, int]]:
+        candidates = set()
+        for k in _get_index_keys(digest):
+            candidates.update(self._index.get(k, ()))
+
+        results = []
+        for key in candidates:
+            score = compare(digest, self._digests[key])
+            if score >= min_score:
+                results.append((key, score))
+
+        #: Digests with the same score are returned in the order in which they were added.
+        results.sort(key=lambda result: (-result[1], self._order[result[0]]))
+        return results[:limit] if limit is not None else results
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._digests
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+
+def _get_index_keys(digest: str) -> Set[Tuple[int, str]]:
+    block_size, a, b = parse_ctph(digest)
+    keys = {(block_size, ngram) for ngram in _get_ngrams(_eliminate_sequences(a))}
+    keys.update((block_size * 2, ngram) for ngram in _get_ngrams(_eliminate_sequences(b)))
+    return keys
@@ -1,18 +1,51 @@
-from typing import Callable, Optional, Union
+from typing import Optional, Union, Iterable, Tuple, Dict, Any, List
 from dataclasses import dataclass
 
+import concurrent.futures
+import dataclasses
 import hashlib
+import hodgepodge.fuzzy_hashing
 import hodgepodge.types
+import threading
+import sqlite3
+import stat
+import mmap
+import time
+import zlib
+import os
 
-DEFAULT_FILE_IO_BLOCK_SIZE = 8192
+DEFAULT_FILE_IO_BLOCK_SIZE = 1024 * 1024
+
+#: The number of bytes read from the start and from the end of a file to calculate a quick hash of it.
+DEFAULT_QUICK_HASH_SAMPLE_SIZE = 64 * 1024
+
+#: Files smaller than this are cheaper to read into a reused buffer than to memory map (see benchmarks/bench_mmap.py), so
+#: callers that opt in to memory mapping with `use_mmap` should only do so for files of at least this size.
+MMAP_MIN_FILE_SIZE = 1024 * 1024
+
+DEFAULT_HASH_CACHE_MAX_ENTRIES = 1000000
+DEFAULT_HASH_CACHE_WRITES_PER_COMMIT = 1000
 
 MD5 = 'md5'
 SHA1 = 'sha1'
 SHA256 = 'sha256'
 SHA512 = 'sha512'
 
+CTPH = 'ctph'
+
+#: The hashes that are calculated by default.
 HASH_ALGORITHMS = [MD5, SHA1, SHA256, SHA512]
 
+#: Similarity hashes are much slower to calculate than cryptographic hashes, so they're only calculated on request.
+SUPPORTED_HASH_ALGORITHMS = HASH_ALGORITHMS + [CTPH]
+
+_HASHLIB_CONSTRUCTORS = {
+    MD5: hashlib.md5,
+    SHA1: hashlib.sha1,
+    SHA256: hashlib.sha256,
+    SHA512: hashlib.sha512,
+    CTPH: hodgepodge.fuzzy_hashing.CTPH,
+}
 
 @dataclass(frozen=True)
 class Hashes:
@@ -20,30 +53,15 @@ class Hashes:
     sha1: Optional[str] = None
     sha256: Optional[str] = None
     sha512: Optional[str] = None
-
-
-@dataclass(frozen=True)
-class _HashlibWrapper:
-    name: str
-    update: Callable[[bytes], None]
-    get_hex_digest: Callable[[], str]
-
-
-def _get_hashlib_wrapper(f) -> _HashlibWrapper:
-    return _HashlibWrapper(
-        name=f.name,
-        update=f.update,
-        get_hex_digest=f.hexdigest,
-    )
+    ctph: Optional[str] = None
 
 
 def _get_hex_digest_via_hashlib(f, data: Union[str, bytes]) -> str:
     if isinstance(data, str):
         data = hodgepodge.types.str_to_bytes(data)
 
-    h = _get_hashlib_wrapper(f)
-    h.update(data)
-    return h.get_hex_digest()
+    f.update(data)
+    return f.hexdigest()
 
 
 def get_md5(data: Union[str, bytes]) -> str:
@@ -62,34 +80,337 @@ def get_sha512(data: Union[str, bytes]) -> str:
     return _get_hex_digest_via_hashlib(hashlib.sha512(), data=data)
 
 
-def get_hashes(data: Union[str, bytes]) -> Hashes:
+def get_hashes(data: Union[str, bytes], hash_algorithms: Optional[Iterable[str]] = None) -> Hashes:
     if isinstance(data, str):
         data = hodgepodge.types.str_to_bytes(data)
 
-    return Hashes(
-        md5=get_md5(data),
-        sha1=get_sha1(data),
-        sha256=get_sha256(data),
-        sha512=get_sha512(data),
-    )
-
-
-def get_file_hashes(path: str, block_size: int = DEFAULT_FILE_IO_BLOCK_SIZE) -> Hashes:
-    hashes = {
-        MD5: _get_hashlib_wrapper(hashlib.md5()),
-        SHA1: _get_hashlib_wrapper(hashlib.sha1()),
-        SHA256: _get_hashlib_wrapper(hashlib.sha256()),
-        SHA512: _get_hashlib_wrapper(hashlib.sha512()),
-    }
-    with open(path, 'rb') as fp:
-        while True:
-            data = fp.read(block_size)
-            if not data:
-                break
-
-            for h in hashes.values():
-                h.update(data)
-
-    for (k, h) in hashes.items():
-        hashes[k] = h.get_hex_digest()
-    return Hashes(**hashes)
+    hashes = _get_hashlib_objects(hash_algorithms)
+    for h in hashes.values():
+        h.update(data)
+    return _get_hashes(hashes)
+
+
+class Hasher:
+    """
+    Calculates hashes of data that's provided incrementally (e.g. while it's being downloaded).
+    """
+    def __init__(self, hash_algorithms: Optional[Iterable[str]] = None):
+        self._hashes = _get_hashlib_objects(hash_algorithms)
+
+    def update(self, data: Union[bytes, bytearray, memoryview]):
+        for h in self._hashes.values():
+            h.update(data)
+
+    def get_hashes(self) -> Hashes:
+        return _get_hashes(self._hashes)
+
+
+def get_file_hashes(
+        path: str,
+        block_size: int = DEFAULT_FILE_IO_BLOCK_SIZE,
+        cache: Optional['HashCache'] = None,
+        hash_algorithms: Optional[Iterable[str]] = None,
+        use_mmap: bool = False,
+        max_workers: Optional[int] = None) -> Hashes:
+    """
+    Hashes the file at the given path by reading it in blocks into a reused buffer.
+
+    Multiple digests of large files are updated concurrently using up to `max_workers` threads (one per digest by
+    default). Calls made from a thread other than the main thread (e.g. a pool worker that's hashing one of many files)
+    update the digests serially in the calling thread unless `max_workers` is given, since the caller is already
+    parallel.
+
+    If `use_mmap` is set, regular files are memory mapped and hashed without copying them instead. Reading a mapping of
+    a file that's truncated while it's being hashed raises SIGBUS, so only opt in for files that won't be modified
+    (e.g. files that the caller owns).
+    """
+    if cache is not None:
+        return cache.get_file_hashes(
+            path, block_size=block_size, hash_algorithms=hash_algorithms, use_mmap=use_mmap, max_workers=max_workers)
+
+    hashes = _get_hashlib_objects(hash_algorithms)
+    max_workers = _get_max_hashing_workers(max_workers, len(hashes))
+    with open(path, 'rb', buffering=0) as fp:
+        stat_result = os.fstat(fp.fileno())
+        size = stat_result.st_size
+        _advise_sequential_access(fp.fileno())
+
+        if use_mmap and size and stat.S_ISREG(stat_result.st_mode):
+            if _update_from_mmap(fp, hashes=list(hashes.values()), block_size=block_size, max_workers=max_workers):
+                return _get_hashes(hashes)
+
+        #: Small files are read using a buffer that's just large enough to hold them (and detect EOF) rather than a full
+        #: block, and handing blocks off to other threads isn't worth it for files that fit in a single block.
+        if 0 < size < block_size:
+            block_size = size + 1
+
+        if max_workers == 1 or size < block_size:
+            _update_serially(fp, hashes=hashes.values(), block_size=block_size)
+        else:
+            _update_in_parallel(fp, hashes=hashes.values(), block_size=block_size, max_workers=max_workers)
+    return _get_hashes(hashes)
+
+
+def get_quick_file_hash(path: str, sample_size: int = DEFAULT_QUICK_HASH_SAMPLE_SIZE) -> int:
+    """
+    Calculates a fast, non-cryptographic hash (CRC32) of the first and last `sample_size` bytes of a file.
+
+    Files with different quick hashes are known to differ, but files with the same quick hash may still differ.
+    """
+    with open(path, 'rb', buffering=0) as fp:
+        size = os.fstat(fp.fileno()).st_size
+        crc = zlib.crc32(fp.read(sample_size))
+        if size > sample_size:
+            fp.seek(max(sample_size, size - sample_size))
+            crc = zlib.crc32(fp.read(sample_size), crc)
+    return crc
+
+
+def _update_from_mmap(fp, hashes: List[Any], block_size: int, max_workers: int) -> bool:
+    try:
+        m = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return False
+
+    with m:
+        if hasattr(m, 'madvise'):
+            m.madvise(mmap.MADV_SEQUENTIAL)
+
+        #: Each digest reads the mapping through its own memoryview slices, so nothing is copied and multiple digests can
+        #: consume the file concurrently.
+        view = memoryview(m)
+        try:
+            if max_workers == 1:
+                for h in hashes:
+                    _update_from_view(view, h=h, block_size=block_size)
+            else:
+                with _get_hashing_executor(max_workers) as executor:
+                    futures = [executor.submit(_update_from_view, view, h=h, block_size=block_size) for h in hashes]
+                    for future in futures:
+                        future.result()
+        finally:
+            view.release()
+    return True
+
+
+def _update_from_view(view: memoryview, h: Any, block_size: int):
+    for offset in range(0, len(view), block_size):
+        h.update(view[offset:offset + block_size])
+
+
+def _advise_sequential_access(fd: int):
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def _update_serially(fp, hashes: Iterable[Any], block_size: int):
+    buffer = memoryview(bytearray(block_size))
+    while True:
+        n = fp.readinto(buffer)
+        if not n:
+            break
+
+        for h in hashes:
+            h.update(buffer[:n])
+
+
+def _update_in_parallel(fp, hashes: Iterable[Any], block_size: int, max_workers: int):
+
+    #: hashlib releases the GIL while hashing large buffers, so each block is fed to every digest concurrently while the
+    #: next block is read into a second buffer - the buffers are only reused once every digest has finished with them.
+    buffers = [memoryview(bytearray(block_size)), memoryview(bytearray(block_size))]
+    with _get_hashing_executor(max_workers) as executor:
+        i = 0
+        n = fp.readinto(buffers[i])
+        while n:
+            data = buffers[i][:n]
+            futures = [executor.submit(h.update, data) for h in hashes]
+
+            i ^= 1
+            n = fp.readinto(buffers[i])
+            for future in futures:
+                future.result()
+
+
+def _get_max_hashing_workers(max_workers: Optional[int], total_hashes: int) -> int:
+    if max_workers is None:
+        if threading.current_thread() is not threading.main_thread():
+            return 1
+        max_workers = total_hashes
+    return max(1, min(max_workers, total_hashes))
+
+
+def _get_hashing_executor(max_workers: int) -> concurrent.futures.ThreadPoolExecutor:
+
+    #: Each call gets its own (small) executor rather than sharing a process-wide one, so that concurrent callers don't
+    #: queue behind each other's blocks and the number of threads is bounded by the caller.
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hashing')
+
+
+def get_hash_algorithms(hash_algorithms: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    if hash_algorithms is None:
+        return tuple(HASH_ALGORITHMS)
+
+    hash_algorithms = tuple(dict.fromkeys(algorithm.lower() for algorithm in hash_algorithms))
+    unsupported_hash_algorithms = set(hash_algorithms) - set(SUPPORTED_HASH_ALGORITHMS)
+    if unsupported_hash_algorithms:
+        raise ValueError("Unsupported hash algorithms: {} (supported: {})".format(
+            sorted(unsupported_hash_algorithms), SUPPORTED_HASH_ALGORITHMS))
+    elif not hash_algorithms:
+        raise ValueError("At least one hash algorithm is required")
+    return hash_algorithms
+
+
+def _get_hashlib_objects(hash_algorithms: Optional[Iterable[str]]) -> Dict[str, Any]:
+    return {algorithm: _HASHLIB_CONSTRUCTORS[algorithm]() for algorithm in get_hash_algorithms(hash_algorithms)}
+
+
+def _get_hashes(hashes: Dict[str, Any]) -> Hashes:
+    return Hashes(**{algorithm: h.hexdigest() for (algorithm, h) in hashes.items()})
+
+
+class HashCache:
+    """
+    A persistent, SQLite-backed cache of file hashes.
+
+    Entries are keyed by device and inode and are only considered valid while the size and modification time (in
+    nanoseconds) of the file are unchanged, so unchanged files can be looked up using the stat result of the file alone.
+    The least recently used entries are evicted once the cache holds more than `max_entries` entries.
+    """
+    def __init__(self, path: str, max_entries: int = DEFAULT_HASH_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS hashes (
+                st_dev INTEGER NOT NULL,
+                st_ino INTEGER NOT NULL,
+                st_size INTEGER NOT NULL,
+                st_mtime_ns INTEGER NOT NULL,
+                md5 TEXT,
+                sha1 TEXT,
+                sha256 TEXT,
+                sha512 TEXT,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (st_dev, st_ino)
+            );
+            CREATE INDEX IF NOT EXISTS hashes_by_last_used ON hashes (last_used);
+        """)
+
+        #: Caches created before similarity hashes were supported don't have a column for them.
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(hashes)")}
+        if CTPH not in columns:
+            self._connection.execute("ALTER TABLE hashes ADD COLUMN ctph TEXT")
+            self._connection.commit()
+
+    def get_file_hashes(
+            self,
+            path: str,
+            stat_result: Optional[os.stat_result] = None,
+            block_size: int = DEFAULT_FILE_IO_BLOCK_SIZE,
+            hash_algorithms: Optional[Iterable[str]] = None,
+            use_mmap: bool = False,
+            max_workers: Optional[int] = None) -> Hashes:
+
+        #: The file is stat'd before it's read, so if it's modified while it's being hashed the entry won't match again.
+        stat_result = stat_result or os.stat(path)
+        hash_algorithms = get_hash_algorithms(hash_algorithms)
+        hashes = self.get(stat_result)
+
+        #: Only the hashes that are missing from the cache entry (if any) are calculated, and they're merged into it.
+        missing = [algorithm for algorithm in hash_algorithms if hashes is None or getattr(hashes, algorithm) is None]
+        if missing:
+            new_hashes = get_file_hashes(
+                path, block_size=block_size, hash_algorithms=missing, use_mmap=use_mmap, max_workers=max_workers)
+            if hashes is not None:
+                new_hashes = dataclasses.replace(
+                    hashes, **{algorithm: getattr(new_hashes, algorithm) for algorithm in missing})
+            hashes = new_hashes
+            self.put(stat_result, hashes)
+
+        return Hashes(**{algorithm: getattr(hashes, algorithm) for algorithm in hash_algorithms})
+
+    def get(self, stat_result: os.stat_result) -> Optional[Hashes]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT st_size, st_mtime_ns, md5, sha1, sha256, sha512, ctph FROM hashes "
+                "WHERE st_dev = ? AND st_ino = ?",
+                (stat_result.st_dev, stat_result.st_ino),
+            ).fetchone()
+            if row is None:
+                return None
+
+            size, mtime_ns, md5, sha1, sha256, sha512, ctph = row
+            if (size, mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns):
+                return None
+
+            self._connection.execute(
+                "UPDATE hashes SET last_used = ? WHERE st_dev = ? AND st_ino = ?",
+                (time.time(), stat_result.st_dev, stat_result.st_ino),
+            )
+            self._on_write()
+            return Hashes(md5=md5, sha1=sha1, sha256=sha256, sha512=sha512, ctph=ctph)
+
+    def put(self, stat_result: os.stat_result, hashes: Hashes):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO hashes "
+                "(st_dev, st_ino, st_size, st_mtime_ns, md5, sha1, sha256, sha512, ctph, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    stat_result.st_dev,
+                    stat_result.st_ino,
+                    stat_result.st_size,
+                    stat_result.st_mtime_ns,
+                    hashes.md5,
+                    hashes.sha1,
+                    hashes.sha256,
+                    hashes.sha512,
+                    hashes.ctph,
+                    time.time(),
+                )
+            )
+            self._on_write()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _on_write(self):
+        self._pending_writes += 1
+        if self._pending_writes >= DEFAULT_HASH_CACHE_WRITES_PER_COMMIT:
+            self._commit()
+
+    def _commit(self):
+        if self._pending_writes:
+            self._evict()
+            self._connection.commit()
+            self._pending_writes = 0
+
+    def _evict(self):
+        self._connection.execute(
+            "DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
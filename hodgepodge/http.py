@@ -1,18 +1,30 @@
 from dataclasses import dataclass, field
-from typing import Iterable, Optional, List
+from typing import Iterable, Iterator, Optional, List, Dict, Any, Tuple, Callable
 
 import requests
 from requests import Session as _Session
 from requests.adapters import HTTPAdapter, BaseAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from urllib3.util.retry import Retry
-from hodgepodge.hashing import Hashes
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from hodgepodge.hashing import Hashes, HashCache
 from hodgepodge.files import INCLUDE_FILE_HASHES_BY_DEFAULT
+from hodgepodge.error import IntegrityError
+from hodgepodge.http_cache import HttpCache
 
 import hodgepodge.hashing as hashing
-import hodgepodge.files
+import hodgepodge.http_cache
 import hodgepodge.logging
+import concurrent.futures
+import collections
+import dataclasses
+import urllib.parse
+import threading
 import logging
-import shutil
+import json
+import time
+import os
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -23,13 +35,44 @@ DEFAULT_MAX_RETRIES_ON_REDIRECT = 5
 DEFAULT_BACKOFF_FACTOR = 0.1
 DEFAULT_PREFIXES = ['http://', 'https://']
 
+#: The number of hosts to keep connection pools for, and the number of idle connections to keep open to each host.
+DEFAULT_POOL_CONNECTIONS = 16
+DEFAULT_POOL_MAXSIZE = 16
+
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MIN_DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_DOWNLOAD_RESUMES = 5
+DEFAULT_MAX_DOWNLOAD_WORKERS = 16
+DEFAULT_MAX_DOWNLOADS_PER_HOST = 4
+
+#: The number of downloads that download_files() reads ahead of those that are running, per worker.
+PENDING_DOWNLOADS_PER_WORKER = 64
+
+_CONTENT_RANGE = re.compile(r'^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$')
+
+#: Downloads ask for unencoded content, since byte ranges and lengths refer to the encoded representation.
+_IDENTITY_ENCODING = {'Accept-Encoding': 'identity'}
+
 
 def configure_http_request_logging(log_level=logging.INFO):
     hodgepodge.logging.configure_http_request_logging(log_level=log_level)
 
 
 class Session(_Session):
+    """
+    A requests session that logs requests and, if given an HttpCache, answers GET requests from the cache using
+    conditional requests (see HttpCache).
+    """
+    def __init__(self, cache: Optional[HttpCache] = None):
+        super().__init__()
+        self.cache = cache
+
     def send(self, request, **kwargs):
+        if self.cache is not None and hodgepodge.http_cache.is_cacheable_request(request):
+            return self.cache.send(request, send=lambda r: self._send(r, **kwargs), stream=kwargs.get('stream', False))
+        return self._send(request, **kwargs)
+
+    def _send(self, request, **kwargs):
         url = request.url
         method = request.method
         logger.debug("Sending HTTP %s request: %s", method, url)
@@ -40,9 +83,17 @@ class Session(_Session):
 
 @dataclass(frozen=True)
 class HttpRequestPolicy:
-    def to_http_adapter(self) -> HTTPAdapter:
+    """
+    Policies describe themselves as HTTPAdapter keyword arguments (see get_http_adapter_options()) so that they can be
+    combined into a single adapter. Policies that only override to_http_adapter() are still supported, but their
+    adapters can't be combined with other policies.
+    """
+    def get_http_adapter_options(self) -> Dict[str, Any]:
         raise NotImplementedError()
 
+    def to_http_adapter(self) -> HTTPAdapter:
+        return HTTPAdapter(**self.get_http_adapter_options())
+
 
 @dataclass(frozen=True)
 class AutomaticRetryPolicy(HttpRequestPolicy):
@@ -52,16 +103,30 @@ class AutomaticRetryPolicy(HttpRequestPolicy):
     backoff_factor: float = DEFAULT_BACKOFF_FACTOR
     force_retry_on: List[int] = field(default_factory=lambda: [502, 503, 504])
 
-    def to_http_adapter(self) -> HTTPAdapter:
-        return HTTPAdapter(
-            max_retries=Retry(
+    def get_http_adapter_options(self) -> Dict[str, Any]:
+        return {
+            'max_retries': Retry(
                 connect=self.max_retries_on_connection_errors,
                 read=self.max_retries_on_read_errors,
                 redirect=self.max_retries_on_redirects,
                 backoff_factor=self.backoff_factor,
                 status_forcelist=self.force_retry_on,
             )
-        )
+        }
+
+
+@dataclass(frozen=True)
+class ConnectionPoolPolicy(HttpRequestPolicy):
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE
+    pool_block: bool = False
+
+    def get_http_adapter_options(self) -> Dict[str, Any]:
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'pool_block': self.pool_block,
+        }
 
 
 def get_automatic_retry_policy(max_retries_on_connection_errors: int = DEFAULT_MAX_RETRIES_ON_CONNECTION_ERRORS,
@@ -76,9 +141,34 @@ def get_automatic_retry_policy(max_retries_on_connection_errors: int = DEFAULT_M
     )
 
 
+def get_http_adapter(policies: Iterable[HttpRequestPolicy]) -> HTTPAdapter:
+    """
+    Combines policies into a single adapter (a session can only use one adapter per prefix, so mounting an adapter per
+    policy would leave only the last policy in effect).
+    """
+    policies = list(policies)
+
+    #: Adapters built by policies that only override to_http_adapter() can't be merged, so the last one takes precedence
+    #: (as it would if each policy were mounted on its own).
+    custom_policies = [policy for policy in policies if _has_custom_http_adapter(policy)]
+    if custom_policies:
+        return custom_policies[-1].to_http_adapter()
+    return HTTPAdapter(**_get_http_adapter_options(policies))
+
+
+def _get_http_adapter_options(policies: Iterable[HttpRequestPolicy]) -> Dict[str, Any]:
+    options = {}
+    for policy in policies:
+        options.update(policy.get_http_adapter_options())
+    return options
+
+
+def _has_custom_http_adapter(policy: HttpRequestPolicy) -> bool:
+    return type(policy).to_http_adapter is not HttpRequestPolicy.to_http_adapter
+
+
 def attach_session_policies(session: Session, policies: Iterable[HttpRequestPolicy], prefixes: Iterable[str] = None):
-    adapters = [policy.to_http_adapter() for policy in policies]
-    attach_session_adapters(session=session, adapters=adapters, prefixes=prefixes)
+    attach_session_adapters(session=session, adapters=[get_http_adapter(policies)], prefixes=prefixes)
 
 
 def attach_session_adapters(session: Session, adapters: Iterable[BaseAdapter], prefixes: Iterable[str] = None):
@@ -88,17 +178,682 @@ def attach_session_adapters(session: Session, adapters: Iterable[BaseAdapter], p
             session.mount(prefix, adapter)
 
 
+@dataclass(frozen=True)
+class HttpConnectionMetrics:
+    requests: int = 0
+    connections: int = 0
+    tls_handshakes: int = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return self.requests - self.connections
+
+
+class HttpConnectionCounter:
+    """
+    A thread-safe count of the requests, connections, and TLS handshakes made by a session.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+
+    def increment(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def get_metrics(self) -> HttpConnectionMetrics:
+        with self._lock:
+            return HttpConnectionMetrics(**self._counts)
+
+
+class _MeteredHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that counts how many connections were checked out of its connection pools, and how many of those were
+    new connections (i.e. connections that needed a TCP, and possibly TLS, handshake).
+    """
+    def __init__(self, counter: HttpConnectionCounter, **kwargs):
+        self.counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _get_metered_connection_pool_class(HTTPConnectionPool, self.counter, tls=False),
+            'https': _get_metered_connection_pool_class(HTTPSConnectionPool, self.counter, tls=True),
+        }
+
+
+def _get_metered_connection_pool_class(cls: type, counter: HttpConnectionCounter, tls: bool) -> type:
+    class MeteredConnectionPool(cls):
+        def _get_conn(self, *args, **kwargs):
+            counter.increment('requests')
+            return super()._get_conn(*args, **kwargs)
+
+        def _new_conn(self, *args, **kwargs):
+            counter.increment('connections')
+            if tls:
+                counter.increment('tls_handshakes')
+            return super()._new_conn(*args, **kwargs)
+
+    return MeteredConnectionPool
+
+
+class SessionManager:
+    """
+    Hands out sessions that share connection pools, so that connections (and TLS sessions) are kept alive and reused
+    across calls and threads rather than being opened for each request.
+
+    requests sessions aren't thread-safe, so each thread gets its own session, but every session mounts the same
+    adapters (urllib3's connection pools are thread-safe). Connection pools hold up to `pool_maxsize` idle connections
+    per host, which can be overridden for individual hosts using `host_pool_sizes` (e.g. {'cti-taxii.mitre.org': 32}).
+    Sessions share `cache` if one is provided.
+    """
+    def __init__(self, policies: Optional[Iterable[HttpRequestPolicy]] = None,
+                 pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 host_pool_sizes: Optional[Dict[str, int]] = None,
+                 cache: Optional[HttpCache] = None):
+        self.cache = cache
+        self._counter = HttpConnectionCounter()
+        self._local = threading.local()
+
+        pool_policy = ConnectionPoolPolicy(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        policies = [pool_policy] + list(policies or [])
+        self._adapters = [(prefix, self._get_adapter(policies)) for prefix in DEFAULT_PREFIXES]
+
+        #: Sessions use the adapter with the longest matching prefix, so host-specific adapters take precedence.
+        for (host, maxsize) in (host_pool_sizes or {}).items():
+            host_policies = policies + [ConnectionPoolPolicy(pool_connections=1, pool_maxsize=maxsize)]
+            for prefix in DEFAULT_PREFIXES:
+                self._adapters.append(('{}{}/'.format(prefix, host), self._get_adapter(host_policies)))
+
+    def _get_adapter(self, policies: Iterable[HttpRequestPolicy]) -> HTTPAdapter:
+        policies = list(policies)
+
+        #: Adapters built by policies that override to_http_adapter() are used as-is (and aren't metered).
+        if any(_has_custom_http_adapter(policy) for policy in policies):
+            return get_http_adapter(policies)
+        return _MeteredHTTPAdapter(self._counter, **_get_http_adapter_options(policies))
+
+    def get_session(self) -> Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = Session(cache=self.cache)
+            for (prefix, adapter) in self._adapters:
+                session.mount(prefix, adapter)
+        return session
+
+    def get_metrics(self) -> HttpConnectionMetrics:
+        return self._counter.get_metrics()
+
+    def close(self):
+        for (_, adapter) in self._adapters:
+            adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_SESSION_MANAGER = None
+_SESSION_MANAGER_LOCK = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    """
+    Returns the process-wide session manager, which is used whenever a session isn't provided.
+    """
+    global _SESSION_MANAGER
+    with _SESSION_MANAGER_LOCK:
+        if _SESSION_MANAGER is None:
+            _SESSION_MANAGER = SessionManager()
+        return _SESSION_MANAGER
+
+
+def get_session() -> Session:
+    return get_session_manager().get_session()
+
+
+@dataclass(frozen=True)
+class DownloadProgress:
+    url: str
+    downloaded: int
+    total: Optional[int] = None
+    transferred: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        The number of bytes per second that have been transferred since the download started (or resumed).
+        """
+        return self.transferred / self.elapsed if self.elapsed else 0.0
+
+
+class ProgressTracker:
+    """
+    Tracks how much of a download has been written (from any thread), and reports it to an optional callback.
+    """
+    def __init__(self, url: str, callback: Optional[Callable[[DownloadProgress], None]] = None):
+        self.url = url
+        self.callback = callback
+        self.downloaded = 0
+        self.total = None
+        self.transferred = 0
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def reset(self, downloaded: int, total: Optional[int]):
+        with self._lock:
+            self.downloaded = downloaded
+            self.total = total
+
+    def add(self, n: int):
+        with self._lock:
+            self.downloaded += n
+            self.transferred += n
+            if self.callback is not None:
+                self.callback(DownloadProgress(
+                    url=self.url,
+                    downloaded=self.downloaded,
+                    total=self.total,
+                    transferred=self.transferred,
+                    elapsed=time.perf_counter() - self._start,
+                ))
+
+
+@dataclass(frozen=True)
+class _RemoteFile:
+    size: Optional[int] = None
+    validator: Optional[str] = None
+    accepts_ranges: bool = False
+
+
+class _RangeNotSatisfied(Exception):
+    pass
+
+
 def download_file(
         url: str,
         path: str,
         session: Optional[_Session] = None,
-        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT) -> Optional[Hashes]:
+        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+        hash_cache: Optional[HashCache] = None,
+        hash_algorithms: Optional[Iterable[str]] = None,
+        expected_hashes: Optional[Hashes] = None,
+        chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE,
+        resume: bool = True,
+        segments: int = 1,
+        min_segment_size: int = DEFAULT_MIN_DOWNLOAD_SEGMENT_SIZE,
+        max_resumes: int = DEFAULT_MAX_DOWNLOAD_RESUMES,
+        progress: Optional[Callable[[DownloadProgress], None]] = None) -> Optional[Hashes]:
+    """
+    Downloads a file, hashing it as it's written to disk.
+
+    The file is written to a partial file (`.<filename>.part`) in the same directory and is only moved into place once it
+    has been downloaded in full and (if `expected_hashes` is provided) its hashes have been verified - an IntegrityError
+    is raised if they don't match.
+
+    If the server supports range requests, dropped connections are resumed from where they left off (up to
+    `max_resumes` times per call), and if `resume` is set, partial files left behind by earlier calls are resumed as long
+    as the file hasn't changed on the server since (according to its ETag or Last-Modified date). Files of at least
+    `2 * min_segment_size` bytes can also be split into up to `segments` byte ranges that are downloaded in parallel
+    (unless a `session` is provided, since sessions aren't thread-safe, in which case the file is downloaded in one
+    piece).
+
+    If provided, `progress` is called with a DownloadProgress each time a chunk is written.
+    """
+    algorithms = []
+    if include_file_hashes:
+        algorithms.extend(hashing.get_hash_algorithms(hash_algorithms))
+    if expected_hashes is not None:
+        algorithms.extend(k for (k, v) in dataclasses.asdict(expected_hashes).items() if v is not None)
+    new_hasher = (lambda: hashing.Hasher(algorithms)) if algorithms else None
+
+    part = get_partial_download_path(path)
+    tracker = ProgressTracker(url, callback=progress)
+    try:
+        remote_file = None
+        if segments > 1 and session is None and hasattr(os, 'pwrite'):
+            remote_file = _get_remote_file(get_session(), url)
+            if not (remote_file and remote_file.accepts_ranges and remote_file.validator and
+                    (remote_file.size or 0) >= 2 * min_segment_size):
+                remote_file = None
+
+        if remote_file is not None:
+            try:
+                segments = min(segments, remote_file.size // min_segment_size)
+                _download_segments(get_session, url, part, remote_file, segments=segments, tracker=tracker,
+                                   chunk_size=chunk_size, max_resumes=max_resumes)
+            except _RangeNotSatisfied:
+                logger.info("%s changed or stopped honouring range requests, downloading it in one piece", url)
+                remote_file = None
+
+        if remote_file is None:
+            hashes = _download_stream(session if session is not None else get_session(), url, part, resume=resume,
+                                      new_hasher=new_hasher, tracker=tracker, chunk_size=chunk_size,
+                                      max_resumes=max_resumes)
+        else:
+            hashes = hashing.get_file_hashes(part, hash_algorithms=algorithms) if algorithms else None
+
+        if expected_hashes is not None:
+            verify_hashes(url, expected_hashes=expected_hashes, hashes=hashes)
+
+        os.replace(part, path)
+        _discard(_get_download_state_path(part))
+    except BaseException as e:
+
+        #: Partial files are kept (so that the next call can resume them) unless they can't be resumed or are corrupt.
+        if isinstance(e, IntegrityError) or not resume or _read_download_state(part) is None:
+            _discard(part, _get_download_state_path(part))
+        raise
+
+    if hashes is not None and hash_cache is not None:
+        hash_cache.put(os.stat(path), hashes)
+
+    if include_file_hashes:
+        return hashing.Hashes(**{algorithm: getattr(hashes, algorithm) for algorithm in
+                                 hashing.get_hash_algorithms(hash_algorithms)})
 
-    with open(path, 'wb') as fp:
-        session = session or Session()
-        response = session.get(url)
+
+def _download_stream(
+        session: _Session,
+        url: str,
+        part: str,
+        resume: bool,
+        new_hasher: Optional[Callable[[], hashing.Hasher]],
+        tracker: ProgressTracker,
+        chunk_size: int,
+        max_resumes: int) -> Optional[Hashes]:
+
+    state = _read_download_state(part) if resume else None
+    offset = 0
+    validator = None
+    if state is not None and state.get('url') == url and os.path.exists(part):
+        offset = os.path.getsize(part)
+        validator = state['validator']
+
+    hasher = new_hasher() if new_hasher else None
+    hashed = 0
+    resumable = validator is not None
+    resumes = 0
+    while True:
+        headers = dict(_IDENTITY_ENCODING)
+        if offset:
+            headers.update({'Range': 'bytes={}-'.format(offset), 'If-Range': validator})
+        try:
+            with session.get(url, stream=True, headers=headers) as response:
+
+                #: The partial file may already be complete (e.g. if it was downloaded but failed to be moved into place).
+                if response.status_code == 416 and offset and _get_content_range(response)[2] == offset:
+                    if hasher is not None:
+                        hasher, hashed = _catch_up_hasher(hasher, new_hasher, part, hashed=hashed, offset=offset)
+                    tracker.reset(offset, offset)
+                    break
+
+                response.raise_for_status()
+                if response.status_code == 206 and _get_content_range(response)[0] == offset:
+                    validator = _get_validator(response) or validator
+                    total = _get_content_range(response)[2]
+                else:
+                    offset = 0
+                    validator = _get_validator(response)
+                    resumable = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+                    total = _get_content_length(response)
+
+                resumable = resumable and validator is not None
+                if resumable:
+                    _write_download_state(part, {'url': url, 'validator': validator})
+                else:
+                    _discard(_get_download_state_path(part))
+
+                if hasher is not None:
+                    hasher, hashed = _catch_up_hasher(hasher, new_hasher, part, hashed=hashed, offset=offset)
+
+                tracker.reset(offset, total)
+                with open(part, 'r+b' if offset else 'wb') as fp:
+                    fp.seek(offset)
+                    fp.truncate()
+                    for chunk in _iter_raw_content(response, chunk_size=chunk_size):
+                        fp.write(chunk)
+                        offset += len(chunk)
+                        if hasher is not None:
+                            hasher.update(chunk)
+                            hashed = offset
+                        tracker.add(len(chunk))
+                break
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            resumes += 1
+            if not resumable or resumes > max_resumes:
+                raise
+            logger.info("Download of %s was interrupted after %d bytes, resuming (%s)", url, offset, e)
+
+    return hasher.get_hashes() if hasher is not None else None
+
+
+def _catch_up_hasher(
+        hasher: hashing.Hasher,
+        new_hasher: Callable[[], hashing.Hasher],
+        part: str,
+        hashed: int,
+        offset: int) -> Tuple[hashing.Hasher, int]:
+
+    #: Data that was downloaded by an earlier call needs to be hashed before the rest of the file (and if the download
+    #: restarted from an earlier offset, hashing starts over).
+    if offset < hashed:
+        hasher = new_hasher()
+        hashed = 0
+    if hashed != offset:
+        hashed += _update_hasher_from_file(hasher, part, start=hashed, end=offset)
+    return hasher, hashed
+
+
+def _download_segments(
+        get_thread_session: Callable[[], _Session],
+        url: str,
+        part: str,
+        remote_file: _RemoteFile,
+        segments: int,
+        tracker: ProgressTracker,
+        chunk_size: int,
+        max_resumes: int):
+
+    #: Segmented downloads can't be resumed by later calls, so any earlier partial download is discarded.
+    _discard(_get_download_state_path(part))
+
+    size = remote_file.size
+    tracker.reset(0, size)
+    cancelled = threading.Event()
+    with open(part, 'wb') as fp:
+        _preallocate(fp.fileno(), size)
+
+        #: Segments are written straight to their offsets in the preallocated file, so they can complete in any order.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = []
+            for i in range(segments):
+                start, end = i * size // segments, (i + 1) * size // segments - 1
+                futures.append(executor.submit(
+                    _download_segment, get_thread_session, url, fp.fileno(), start=start, end=end,
+                    validator=remote_file.validator, tracker=tracker, chunk_size=chunk_size, max_resumes=max_resumes,
+                    cancelled=cancelled))
+
+            concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+            cancelled.set()
+            for future in futures:
+                future.result()
+
+
+def _download_segment(
+        get_thread_session: Callable[[], _Session],
+        url: str,
+        fd: int,
+        start: int,
+        end: int,
+        validator: str,
+        tracker: ProgressTracker,
+        chunk_size: int,
+        max_resumes: int,
+        cancelled: threading.Event):
+
+    position = start
+    resumes = 0
+    while position <= end:
+        headers = {'Range': 'bytes={}-{}'.format(position, end), 'If-Range': validator, **_IDENTITY_ENCODING}
+        try:
+            with get_thread_session().get(url, stream=True, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206 or _get_content_range(response)[0] != position:
+                    raise _RangeNotSatisfied(url)
+
+                for chunk in _iter_raw_content(response, chunk_size=chunk_size):
+                    if cancelled.is_set():
+                        return
+
+                    chunk = chunk[:end + 1 - position]
+                    _write_at(fd, chunk, position)
+                    position += len(chunk)
+                    tracker.add(len(chunk))
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            logger.info("Download of bytes %d-%d of %s was interrupted, resuming (%s)", position, end, url, e)
+
+        if position <= end:
+            resumes += 1
+            if resumes > max_resumes:
+                raise requests.exceptions.ConnectionError("Failed to download bytes {}-{} of {}".format(
+                    position, end, url))
+
+
+def _get_remote_file(session: _Session, url: str) -> Optional[_RemoteFile]:
+    try:
+        response = session.head(url, allow_redirects=True, headers=_IDENTITY_ENCODING)
         response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.debug("Failed to get the size of %s: %s", url, e)
+        return None
+
+    return _RemoteFile(
+        size=_get_content_length(response),
+        validator=_get_validator(response),
+        accepts_ranges=response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+    )
+
+
+def _iter_raw_content(response: requests.Response, chunk_size: int) -> Iterator[bytes]:
+
+    #: Byte ranges, Content-Range, and Content-Length all count encoded bytes, so responses are written exactly as they
+    #: were sent (if a server ignores Accept-Encoding: identity) rather than being decoded by iter_content(). Responses
+    #: that have already been read (e.g. by an HttpCache) are served from their content instead.
+    if response._content_consumed:
+        yield from response.iter_content(chunk_size=chunk_size)
+        return
+
+    try:
+        yield from response.raw.stream(chunk_size, decode_content=False)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.exceptions.ConnectionError(e)
+
+
+def _get_validator(response: requests.Response) -> Optional[str]:
+
+    #: Weak ETags can't be used with If-Range, in which case the Last-Modified date is used instead.
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def _get_content_length(response: requests.Response) -> Optional[int]:
+    value = response.headers.get('Content-Length', '')
+    return int(value) if value.isdigit() else None
+
+
+def _get_content_range(response: requests.Response) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+    if not match:
+        return None, None, None
+
+    start, end, total = match.groups()
+    return (
+        int(start) if start is not None else None,
+        int(end) if end is not None else None,
+        int(total) if total != '*' else None,
+    )
+
+
+def _update_hasher_from_file(hasher: hashing.Hasher, path: str, start: int, end: int) -> int:
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        remaining = end - start
+        while remaining:
+            data = fp.read(min(remaining, DEFAULT_DOWNLOAD_CHUNK_SIZE))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return end - start - remaining
+
+
+def _write_at(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+
+def _preallocate(fd: int, size: int):
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+def get_partial_download_path(path: str) -> str:
+    """
+    Returns the path of the partial file (`.<filename>.part`) that a file is downloaded to before it's moved into place.
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '.{}.part'.format(filename))
+
+
+def _get_download_state_path(part: str) -> str:
+    return part + '.json'
+
+
+def _read_download_state(part: str) -> Optional[dict]:
+    try:
+        with open(_get_download_state_path(part)) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_download_state(part: str, state: dict):
+    with open(_get_download_state_path(part), 'w') as fp:
+        json.dump(state, fp)
+
+
+def _discard(*paths: str):
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def verify_hashes(url: str, expected_hashes: Hashes, hashes: Hashes):
+    """
+    Raises an IntegrityError if any of the expected hashes of a downloaded file don't match its actual hashes.
+    """
+    for (algorithm, expected) in dataclasses.asdict(expected_hashes).items():
+        if expected is not None and expected.lower() != getattr(hashes, algorithm):
+            raise IntegrityError("{} hash mismatch for {}: expected {}, got {}".format(
+                algorithm, url, expected.lower(), getattr(hashes, algorithm)))
+
+
+@dataclass(frozen=True)
+class DownloadResult:
+    url: str
+    path: str
+    hashes: Optional[Hashes] = None
+    size: Optional[int] = None
+    duration: float = 0.0
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def download_files(
+        downloads: Iterable[Tuple[str, str]],
+        session_manager: Optional[SessionManager] = None,
+        max_workers: int = DEFAULT_MAX_DOWNLOAD_WORKERS,
+        max_downloads_per_host: int = DEFAULT_MAX_DOWNLOADS_PER_HOST,
+        include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+        hash_cache: Optional[HashCache] = None,
+        hash_algorithms: Optional[Iterable[str]] = None,
+        chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE) -> Iterator[DownloadResult]:
+    """
+    Downloads (url, path) pairs concurrently and yields a DownloadResult for each download as soon as it completes.
+
+    At most `max_workers` files are downloaded at once, and at most `max_downloads_per_host` from any one host. Failed
+    downloads are reported through DownloadResult.error rather than raised, so that one failure doesn't stop the rest.
+
+    Unless a session manager is provided, downloads share a new one that retries requests using the default automatic
+    retry policy and keeps up to `max_downloads_per_host` connections open to each host.
+    """
+    owns_session_manager = session_manager is None
+    if owns_session_manager:
+        session_manager = SessionManager(policies=[get_automatic_retry_policy()], pool_maxsize=max_downloads_per_host)
+
+    def download(url: str, path: str) -> DownloadResult:
+        start = time.perf_counter()
+        try:
+            hashes = download_file(
+                url=url,
+                path=path,
+                session=session_manager.get_session(),
+                include_file_hashes=include_file_hashes,
+                hash_cache=hash_cache,
+                hash_algorithms=hash_algorithms,
+                chunk_size=chunk_size,
+            )
+            size = os.path.getsize(path)
+        except Exception as e:
+            logger.warning("Failed to download %s: %s", url, e)
+            return DownloadResult(url=url, path=path, duration=time.perf_counter() - start, error=e)
+        return DownloadResult(url=url, path=path, hashes=hashes, size=size, duration=time.perf_counter() - start)
+
+    #: Downloads are queued by host and are only started once their host has a free slot, so that workers never sit
+    #: idle waiting on a busy host while downloads from other hosts are pending.
+    downloads = iter(downloads)
+    max_queued_downloads = max_workers * PENDING_DOWNLOADS_PER_WORKER
+    queues = collections.defaultdict(collections.deque)
+    queued = 0
+    running = {}
+    running_by_host = collections.Counter()
+
+    def schedule():
+        nonlocal queued, downloads
+        while len(running) < max_workers:
+            host = next((h for (h, q) in queues.items() if q and running_by_host[h] < max_downloads_per_host), None)
+            if host is None:
+                if downloads is None or queued >= max_queued_downloads:
+                    break
+
+                try:
+                    url, path = next(downloads)
+                except StopIteration:
+                    downloads = None
+                    break
+
+                queues[urllib.parse.urlsplit(url).netloc.lower()].append((url, path))
+                queued += 1
+                continue
+
+            url, path = queues[host].popleft()
+            if not queues[host]:
+                del queues[host]
+            queued -= 1
+
+            running[executor.submit(download, url, path)] = host
+            running_by_host[host] += 1
 
-        shutil.copyfileobj(response.raw, fp)
-        if include_file_hashes:
-            return hashing.get_file_hashes(path)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            schedule()
+            while running:
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    running_by_host[running.pop(future)] -= 1
+                    yield future.result()
+                schedule()
+    finally:
+        if owns_session_manager:
+            session_manager.close()
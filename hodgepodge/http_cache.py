@@ -0,0 +1,363 @@
+from dataclasses import dataclass
+from typing import Optional, Dict, Callable, Mapping
+
+import requests
+import requests.utils
+from requests.structures import CaseInsensitiveDict
+
+import hodgepodge.hashing
+import http.client
+import collections
+import dataclasses
+import datetime
+import threading
+import tempfile
+import sqlite3
+import json
+import time
+import io
+import os
+import re
+
+DEFAULT_HTTP_CACHE_MAX_SIZE = 1024 * 1024 * 1024
+DEFAULT_HTTP_CACHE_MAX_ENTRY_SIZE = 64 * 1024 * 1024
+DEFAULT_HTTP_CACHE_WRITES_PER_COMMIT = 1000
+
+#: Headers that describe how the body was transferred rather than the body itself (bodies are cached decoded).
+_TRANSFER_HEADERS = frozenset(['content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive'])
+
+#: Headers that a 304 response can update in the cached response.
+_REVALIDATION_HEADERS = frozenset(['etag', 'last-modified', 'cache-control', 'expires', 'date', 'age'])
+
+_CONDITIONAL_HEADERS = frozenset(['if-none-match', 'if-modified-since', 'if-range', 'if-match', 'if-unmodified-since'])
+
+#: Requests with credentials aren't cached, since their responses may be specific to (and private to) the requester.
+_CREDENTIAL_HEADERS = frozenset(['authorization', 'proxy-authorization', 'cookie'])
+
+#: Request headers (and their default values) that are part of the cache key, so responses that vary on them (see the
+#: Vary header) can be cached.
+_KEY_HEADERS = {'accept': '*/*', 'accept-language': ''}
+
+#: Responses can also vary on Accept-Encoding, since bodies are cached decoded.
+_VARY_HEADERS = frozenset(_KEY_HEADERS) | {'accept-encoding'}
+
+_MAX_AGE = re.compile(r'(?:^|,)\s*max-age\s*=\s*"?(\d+)"?', re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class HttpCacheStats:
+    hits: int = 0
+    revalidations: int = 0
+    misses: int = 0
+    bytes_saved: int = 0
+
+    @property
+    def requests(self) -> int:
+        return self.hits + self.revalidations + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The fraction of requests that were answered using a cached body (with or without revalidating it).
+        """
+        return (self.hits + self.revalidations) / self.requests if self.requests else 0.0
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    expires_at: float
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def get_conditional_headers(self) -> Dict[str, str]:
+        headers = CaseInsensitiveDict(self.headers)
+        conditional_headers = {}
+        if 'ETag' in headers:
+            conditional_headers['If-None-Match'] = headers['ETag']
+        if 'Last-Modified' in headers:
+            conditional_headers['If-Modified-Since'] = headers['Last-Modified']
+        return conditional_headers
+
+    def to_response(self, request: requests.PreparedRequest) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.reason = http.client.responses.get(self.status_code)
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.headers['Content-Length'] = str(len(self.body))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = self.url
+        response.request = request
+        response.elapsed = datetime.timedelta(0)
+        response.raw = io.BytesIO(self.body)
+        response._content = self.body
+        response._content_consumed = True
+        return response
+
+
+class HttpCache:
+    """
+    A persistent cache of HTTP responses to GET requests that's used by sessions created with `Session(cache=...)`.
+
+    Responses are cached if they have an ETag or Last-Modified date (or a Cache-Control max-age), and are served from
+    the cache without contacting the server until their max-age expires. After that, they're revalidated using
+    If-None-Match/If-Modified-Since, and a 304 (Not Modified) response is answered using the cached body. Bodies are
+    stored as files next to a SQLite index, and the least recently used responses are evicted once the bodies take up
+    more than `max_size` bytes. Responses larger than `max_entry_size` bytes aren't cached.
+
+    Responses are cached per URL, Accept, and Accept-Language header. Responses that vary on other request headers, and
+    responses to requests with credentials (e.g. an Authorization header or cookies), aren't cached.
+    """
+    def __init__(self, directory: str, max_size: int = DEFAULT_HTTP_CACHE_MAX_SIZE,
+                 max_entry_size: int = DEFAULT_HTTP_CACHE_MAX_ENTRY_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        self._pending_writes = 0
+        self._connection = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT NOT NULL PRIMARY KEY,
+                url TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_by_last_used ON responses (last_used);
+        """)
+
+    def send(self, request: requests.PreparedRequest, send: Callable[[requests.PreparedRequest], requests.Response],
+             stream: bool = False) -> requests.Response:
+        """
+        Answers a request from the cache, or by calling `send` (with conditional headers if the request matches a stale
+        cached response), and caches the response.
+        """
+        key = _get_key(request.url, request.headers)
+        cached = self._get(key, request.url)
+        if cached is not None and cached.is_fresh():
+            self._record(hits=1, bytes_saved=len(cached.body))
+            return cached.to_response(request)
+
+        if cached is not None:
+            request.headers.update(cached.get_conditional_headers())
+
+        response = send(request)
+        if cached is not None and response.status_code == 304:
+            response.close()
+            cached = self._revalidate(key, cached, response)
+            self._record(revalidations=1, bytes_saved=len(cached.body))
+            return cached.to_response(request)
+
+        self._record(misses=1)
+        self._put_response(key, response, stream=stream)
+        return response
+
+    def get(self, url: str, headers: Optional[Mapping[str, str]] = None) -> Optional[CachedResponse]:
+        """
+        Looks up the cached response to a GET request for a URL with the given request headers.
+        """
+        return self._get(_get_key(url, headers or {}), url)
+
+    def _get(self, key: str, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status_code, headers, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            try:
+                with open(self._get_body_path(key), 'rb') as fp:
+                    body = fp.read()
+            except FileNotFoundError:
+                self._delete(key)
+                self._on_write()
+                return None
+
+            #: Access times are only used to pick responses to evict, so updates to them are committed in batches rather
+            #: than on every hit.
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._on_write()
+
+        status_code, headers, expires_at = row
+        return CachedResponse(url=url, status_code=status_code, headers=json.loads(headers), body=body,
+                              expires_at=expires_at)
+
+    def put(self, response: requests.Response, stream: bool = False) -> bool:
+        """
+        Caches a response if it can be cached and returns whether it was.
+
+        The bodies of streamed responses are only read (and cached) if their Content-Length shows that they aren't too
+        large to cache.
+        """
+        request = response.request
+        if request is not None and not is_cacheable_request(request):
+            return False
+
+        key = _get_key(response.url, request.headers if request is not None else {})
+        return self._put_response(key, response, stream=stream)
+
+    def _put_response(self, key: str, response: requests.Response, stream: bool) -> bool:
+        if not _is_cacheable_response(response):
+            return False
+
+        if stream and not response._content_consumed:
+            length = response.headers.get('Content-Length', '')
+            if not length.isdigit() or int(length) > self.max_entry_size:
+                return False
+
+        body = response.content
+        if len(body) > self.max_entry_size:
+            return False
+
+        headers = {k: v for (k, v) in response.headers.items() if k.lower() not in _TRANSFER_HEADERS}
+        self._put(key, response.url, response.status_code, headers, body)
+        return True
+
+    def get_stats(self) -> HttpCacheStats:
+        with self._lock:
+            return HttpCacheStats(**self._stats)
+
+    def get_size(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            for (key,) in self._connection.execute("SELECT key FROM responses").fetchall():
+                self._delete(key)
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            if self._pending_writes:
+                self._commit()
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _revalidate(self, key: str, cached: CachedResponse, response: requests.Response) -> CachedResponse:
+        headers = CaseInsensitiveDict(cached.headers)
+        headers.update((k, v) for (k, v) in response.headers.items() if k.lower() in _REVALIDATION_HEADERS)
+        headers = dict(headers)
+        self._put(key, cached.url, cached.status_code, headers, cached.body)
+        return dataclasses.replace(cached, headers=headers, expires_at=_get_expiry_time(headers))
+
+    def _put(self, key: str, url: str, status_code: int, headers: Dict[str, str], body: bytes):
+
+        #: Bodies are written to a uniquely named temporary file, so concurrent writes of the same response can't collide.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(body)
+            os.replace(tmp, self._get_body_path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, status_code, headers, size, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status_code, json.dumps(headers), len(body), _get_expiry_time(headers), now),
+            )
+            self._evict()
+            self._commit()
+
+    def _on_write(self):
+        self._pending_writes += 1
+        if self._pending_writes >= DEFAULT_HTTP_CACHE_WRITES_PER_COMMIT:
+            self._commit()
+
+    def _commit(self):
+        self._connection.commit()
+        self._pending_writes = 0
+
+    def _evict(self):
+        size = 0
+        for (key, n) in self._connection.execute("SELECT key, size FROM responses ORDER BY last_used DESC").fetchall():
+            size += n
+            if size > self.max_size:
+                self._delete(key)
+
+    def _delete(self, key: str):
+        self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+        path = self._get_body_path(key)
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def _record(self, **counts: int):
+        with self._lock:
+            self._stats.update(counts)
+
+    def _get_body_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+
+def is_cacheable_request(request: requests.PreparedRequest) -> bool:
+
+    #: Requests that are already conditional or ranged are left alone, since their responses aren't the whole resource.
+    headers = request.headers
+    return request.method == 'GET' and 'Range' not in headers and \
+        not any(k.lower() in _CONDITIONAL_HEADERS or k.lower() in _CREDENTIAL_HEADERS for k in headers) and \
+        'no-store' not in headers.get('Cache-Control', '').lower()
+
+
+def _is_cacheable_response(response: requests.Response) -> bool:
+    if response.status_code != 200:
+        return False
+
+    cache_control = response.headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control:
+        return False
+
+    #: Responses that vary on request headers that aren't part of the cache key (or on everything - "Vary: *") can't be
+    #: told apart, so they aren't cached.
+    vary = {name.strip().lower() for name in response.headers.get('Vary', '').split(',') if name.strip()}
+    if not vary <= _VARY_HEADERS:
+        return False
+    return 'ETag' in response.headers or 'Last-Modified' in response.headers or _get_max_age(response.headers) > 0
+
+
+def _get_expiry_time(headers: Dict[str, str]) -> float:
+    headers = CaseInsensitiveDict(headers)
+    age = headers.get('Age', '')
+    return time.time() + _get_max_age(headers) - (int(age) if age.isdigit() else 0)
+
+
+def _get_max_age(headers) -> int:
+
+    #: Responses without a max-age (or with no-cache) are revalidated every time they're requested.
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control.lower():
+        return 0
+
+    match = _MAX_AGE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def _get_key(url: str, headers: Mapping[str, str]) -> str:
+    headers = CaseInsensitiveDict(headers)
+    values = [headers.get(name, default) for (name, default) in _KEY_HEADERS.items()]
+    return hodgepodge.hashing.get_sha256('\n'.join([url] + values))
@@ -1,34 +1,263 @@
-from typing import Iterable, Union
+from typing import Iterable, Union, Tuple
 
+import collections
+import functools
 import fnmatch
+import re
 
 STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT = False
 
+GLOB_CHARACTERS = frozenset('*?[')
+
+MAX_CACHED_GLOB_MATCHERS = 1024
+MAX_SUBSTRINGS_PER_EXPRESSION = 16
+
+
+class GlobMatcher:
+    """
+    Matches strings against a set of glob patterns that have been compiled up-front.
+
+    Literal patterns, prefixes (e.g. `abc*`), suffixes (e.g. `*abc`), and substrings (e.g. `*abc*`) are grouped by
+    length and matched using set lookups, so the cost of matching a string depends on the number of distinct pattern
+    lengths rather than the number of patterns. All other patterns are translated into regular expressions, which are
+    combined and grouped by the literal prefix of each pattern so that only plausible patterns are tried.
+    """
+    def __init__(
+            self,
+            patterns: Union[str, Iterable[str]],
+            case_sensitive: bool = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT):
+
+        patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+        if not case_sensitive:
+            patterns = list(map(str.lower, patterns))
+
+        self.patterns = tuple(patterns)
+        self.case_sensitive = case_sensitive
+
+        self._matches_everything = False
+        self._literals = set()
+        self._prefixes = collections.defaultdict(set)
+        self._suffixes = collections.defaultdict(set)
+        self._substrings = collections.defaultdict(set)
+        expressions = collections.defaultdict(list)
+
+        for pattern in patterns:
+            body = pattern.strip('*')
+            if GLOB_CHARACTERS.isdisjoint(pattern):
+                self._literals.add(pattern)
+            elif not body:
+                self._matches_everything = True
+            elif not GLOB_CHARACTERS.isdisjoint(body):
+                prefix = _get_literal_prefix(pattern)
+                expressions[prefix].append(fnmatch.translate(pattern))
+            elif pattern.startswith('*') and pattern.endswith('*'):
+                self._substrings[len(body)].add(body)
+            elif pattern.endswith('*'):
+                self._prefixes[len(body)].add(body)
+            else:
+                self._suffixes[len(body)].add(body)
+
+        #: Small numbers of substrings are cheaper to find using a single regular expression than by sliding a window.
+        self._substring_expression = None
+        substrings = set().union(*self._substrings.values())
+        if len(substrings) <= MAX_SUBSTRINGS_PER_EXPRESSION:
+            self._substrings.clear()
+            if substrings:
+                self._substring_expression = re.compile('|'.join(map(re.escape, sorted(substrings))))
+
+        self._expressions = {}
+        for prefix, group in expressions.items():
+            self._expressions[prefix] = re.compile('|'.join(group))
+        self._expression_prefix_lengths = sorted({len(prefix) for prefix in self._expressions})
+
+    def matches(self, values: Union[str, Iterable[str], None]) -> bool:
+        if values is None:
+            return False
+
+        values = [values] if isinstance(values, str) else values
+        for value in values:
+            if self._matches(value):
+                return True
+        return False
+
+    def _matches(self, value: str) -> bool:
+        if self._matches_everything:
+            return True
+
+        if not self.case_sensitive:
+            value = value.lower()
+
+        if value in self._literals:
+            return True
+
+        n = len(value)
+        for length, prefixes in self._prefixes.items():
+            if length <= n and value[:length] in prefixes:
+                return True
+
+        for length, suffixes in self._suffixes.items():
+            if length <= n and value[n - length:] in suffixes:
+                return True
+
+        if self._substring_expression and self._substring_expression.search(value):
+            return True
+
+        for length, substrings in self._substrings.items():
+            for i in range(n - length + 1):
+                if value[i:i + length] in substrings:
+                    return True
+
+        for length in self._expression_prefix_lengths:
+            if length > n:
+                break
+
+            expression = self._expressions.get(value[:length])
+            if expression and expression.match(value):
+                return True
+        return False
+
+    def __call__(self, values: Union[str, Iterable[str], None]) -> bool:
+        return self.matches(values)
+
+
+def is_glob(pattern: str) -> bool:
+    return not GLOB_CHARACTERS.isdisjoint(pattern)
+
+
+def _get_literal_prefix(pattern: str) -> str:
+    for i, c in enumerate(pattern):
+        if c in GLOB_CHARACTERS:
+            return pattern[:i]
+    return pattern
+
+
+def compile_globs(
+        patterns: Union[str, Iterable[str]],
+        case_sensitive: bool = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT) -> GlobMatcher:
+
+    patterns = (patterns,) if isinstance(patterns, str) else tuple(patterns)
+    return _compile_globs(patterns, case_sensitive)
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_GLOB_MATCHERS)
+def _compile_globs(patterns: Tuple[str, ...], case_sensitive: bool) -> GlobMatcher:
+    return GlobMatcher(patterns, case_sensitive=case_sensitive)
+
 
 def matches(
         values: Union[str, Iterable[str]],
-        patterns: Union[str, Iterable[str]],
+        patterns: Union[str, Iterable[str], GlobMatcher],
         case_sensitive: bool = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT):
     return str_matches_glob(values=values, patterns=patterns, case_sensitive=case_sensitive)
 
 
 def str_matches_glob(
         values: Union[str, Iterable[str]],
-        patterns: Union[str, Iterable[str]],
+        patterns: Union[str, Iterable[str], GlobMatcher],
         case_sensitive: bool = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT) -> bool:
 
     if values is None or patterns is None:
         return False
 
-    values = [values] if isinstance(values, str) else values
-    patterns = [patterns] if isinstance(patterns, str) else patterns
+    if not isinstance(patterns, GlobMatcher):
+        patterns = compile_globs(patterns, case_sensitive=case_sensitive)
+    return patterns.matches(values)
 
-    if not case_sensitive:
-        values = list(map(str.lower, values))
-        patterns = list(map(str.lower, patterns))
 
-    for value in values:
-        for pattern in patterns:
-            if fnmatch.fnmatch(value, pattern):
-                return True
-    return False
+class IgnoreRules:
+    """
+    Matches relative paths against a list of gitignore-style rules.
+
+    Blank lines and lines starting with `#` are skipped, rules starting with `!` re-include paths excluded by earlier
+    rules, rules ending with `/` only match directories, and rules containing a `/` are anchored to the root that paths
+    are relative to (otherwise they match at any depth). `*` and `?` don't match `/`, while `**` matches any number of
+    directories. The last matching rule wins.
+    """
+    def __init__(
+            self,
+            rules: Iterable[str],
+            case_sensitive: bool = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT):
+
+        self.rules = tuple(rules)
+        self.case_sensitive = case_sensitive
+
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self._rules = []
+        for rule in self.rules:
+            rule = rule.strip()
+            if not rule or rule.startswith('#'):
+                continue
+
+            is_negated = rule.startswith('!')
+            if is_negated:
+                rule = rule[1:]
+
+            is_directory_rule = rule.endswith('/')
+            rule = rule.rstrip('/')
+
+            is_anchored = '/' in rule
+            expression = _translate_ignore_rule(rule.lstrip('/'))
+            if not is_anchored:
+                expression = '(?:.*/)?' + expression
+            self._rules.append((re.compile(expression + r'\Z', flags=flags), is_negated, is_directory_rule))
+
+    def is_ignored(self, path: str, is_directory: bool = False) -> bool:
+        ignored = False
+        for expression, is_negated, is_directory_rule in self._rules:
+            if is_directory_rule and not is_directory:
+                continue
+
+            if ignored == is_negated and expression.match(path):
+                ignored = not is_negated
+        return ignored
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+
+def _translate_ignore_rule(rule: str) -> str:
+    i = 0
+    n = len(rule)
+    expression = []
+    while i < n:
+        if rule.startswith('**/', i):
+            expression.append('(?:.*/)?')
+            i += 3
+        elif rule.startswith('/**', i) and i + 3 == n:
+            expression.append('/.*')
+            i += 3
+        elif rule.startswith('**', i):
+            expression.append('.*')
+            i += 2
+        elif rule[i] == '*':
+            expression.append('[^/]*')
+            i += 1
+        elif rule[i] == '?':
+            expression.append('[^/]')
+            i += 1
+        elif rule[i] == '[':
+            j = rule.find(']', i + 2)
+            if j == -1:
+                expression.append(re.escape(rule[i]))
+                i += 1
+            else:
+                body = rule[i + 1:j]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                expression.append('[{}]'.format(body.replace('\\', '\\\\')))
+                i = j + 1
+        else:
+            expression.append(re.escape(rule[i]))
+            i += 1
+    return ''.join(expression)
+
+
+def compile_ignore_rules(
+        rules: Iterable[str],
+        case_sensitive: bool = STRING_COMPARISON_IS_CASE_SENSITIVE_BY_DEFAULT) -> IgnoreRules:
+    return _compile_ignore_rules(tuple(rules), case_sensitive)
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_GLOB_MATCHERS)
+def _compile_ignore_rules(rules: Tuple[str, ...], case_sensitive: bool) -> IgnoreRules:
+    return IgnoreRules(rules, case_sensitive=case_sensitive)
@@ -18,6 +18,16 @@ OS_TYPE = platform.system()
 OS_VERSION = platform.version()
 OS_BITNESS = 8 * struct.calcsize("P")
 
+_OS_TYPE_MATCHERS = [
+    (hodgepodge.pattern_matching.compile_globs(patterns), os_type) for (patterns, os_type) in (
+        (['*microsoft*', '*windows*', '*cygwin*', '*mingw*', '*msys*', '*dos*'], WINDOWS),
+        (['*linux*', '*ubuntu*', '*rhel*', '*red*hat*', '*centos*', '*debian*', '*gentoo*', '*opensuse*', '*sles*'], LINUX),
+        (['*darwin*', '*mac*os*', '*os*x*'], DARWIN),
+        (['*FreeBSD*', '*OpenBSD*', '*pfsense*'], BSD),
+        (['*solaris*'], SOLARIS),
+    )
+]
+
 
 @dataclass(frozen=True)
 class Platform:
@@ -60,34 +70,8 @@ def is_darwin() -> bool:
 
 def parse_os_type(os_type: Optional[str]) -> Optional[str]:
     if os_type:
-
-        #: Windows.
-        if hodgepodge.pattern_matching.str_matches_glob(os_type, patterns=[
-            '*microsoft*', '*windows*', '*cygwin*', '*mingw*', '*msys*', '*dos*'
-        ]):
-            os_type = WINDOWS
-
-        #: Linux.
-        elif hodgepodge.pattern_matching.str_matches_glob(os_type, patterns=[
-            '*linux*', '*ubuntu*', '*rhel*', '*red*hat*', '*centos*', '*debian*', '*gentoo*', '*opensuse*', '*sles*',
-        ]):
-            os_type = LINUX
-
-        #: macOS.
-        elif hodgepodge.pattern_matching.str_matches_glob(os_type, patterns=[
-            '*darwin*', '*mac*os*', '*os*x*'
-        ]):
-            os_type = DARWIN
-
-        #: BSD.
-        elif hodgepodge.pattern_matching.str_matches_glob(os_type, patterns=['*FreeBSD*', '*OpenBSD*', '*pfsense*']):
-            os_type = BSD
-
-        #: Solaris.
-        elif hodgepodge.pattern_matching.str_matches_glob(os_type, patterns='*solaris*'):
-            os_type = SOLARIS
-
-        #: Anything else.
-        else:
-            os_type = OTHER
+        for matcher, parsed_os_type in _OS_TYPE_MATCHERS:
+            if matcher.matches(os_type):
+                return parsed_os_type
+        return OTHER
     return os_type
@@ -8,6 +8,8 @@ class JSONEncoder(_JSONEncoder):
     def default(self, o):
         if isinstance(o, (datetime.datetime, datetime.date)):
             return o.isoformat()
+        elif callable(getattr(o, 'to_dict', None)):
+            return o.to_dict()
         elif dataclasses.is_dataclass(o):
             return dataclasses.asdict(o)
         elif callable(o):
@@ -1,13 +1,28 @@
-from stix2.datastore import DataSource, CompositeDataSource
-from typing import List, Union, Optional, Iterator, Tuple, Any, Iterable
+from stix2.datastore import DataSource, CompositeDataSource, DataSourceError
+from stix2.datastore.filters import FilterSet, apply_common_filters
+from stix2.base import _STIXBase
+from stix2.utils import format_datetime, deduplicate
+from typing import List, Union, Optional, Iterator, Tuple, Any, Iterable, Dict, Set, Callable
 
 import hodgepodge.pattern_matching
 import hodgepodge.compression
 import hodgepodge.files
+import hodgepodge.hashing
+import hodgepodge.http
+import concurrent.futures
+import collections
+import datetime
+import gzip
 import json
+import zlib
+import shutil
+import time
+import os
+import re
 import logging
 import stix2.datastore.memory
 import taxii2client.v20
+import requests
 
 logger = logging.getLogger(__name__)
 
@@ -22,14 +37,256 @@ PUBLIC_TAXII_SERVICE_URLS = [
 ]
 
 DEFAULT_TAXII_PAGE_SIZE = 5000
+DEFAULT_TAXII_MAX_WORKERS = 8
 
+DEFAULT_TAXII_CACHE_TTL = 24 * 60 * 60
+TAXII_CACHE_REFRESH_OVERLAP = 5 * 60
 
-def get_taxii_data_source(url, allow_custom: bool = True, page_size: int = 5000) -> stix2.TAXIICollectionSource:
-    collection = taxii2client.v20.Collection(url)
-    return stix2.TAXIICollectionSource(collection, allow_custom=allow_custom, items_per_page=page_size)
+DEFAULT_BUNDLE_READ_BLOCK_SIZE = 1024 * 1024
+
+_JSON_SCALAR_TYPES = frozenset([str, int, float, bool, type(None)])
+_WHITESPACE = re.compile(r'\s*')
+_TAXII_CONTENT_RANGE = re.compile(r'^items (?:(\d+)-(\d+)|\*)/(\d+|\*)$')
+
+
+def get_taxii_data_source(url, allow_custom: bool = True, page_size: int = 5000,
+                          cache: Optional['TaxiiCache'] = None,
+                          max_workers: int = DEFAULT_TAXII_MAX_WORKERS) -> Union[stix2.TAXIICollectionSource, 'StixStore']:
+    if cache is not None:
+        return cache.get_data_source(url, allow_custom=allow_custom)
 
+    collection = get_taxii_collection(url, max_workers=max_workers)
+    return ConcurrentTaxiiCollectionSource(
+        collection, allow_custom=allow_custom, items_per_page=page_size, max_workers=max_workers)
 
-def get_filesystem_data_source(path: str, allow_custom: bool = True) -> Union[stix2.MemorySource, stix2.FileSystemSource]:
+
+def get_taxii_collection(url: str, max_workers: int = DEFAULT_TAXII_MAX_WORKERS) -> taxii2client.v20.Collection:
+    """
+    Returns a TAXII 2.0 collection whose HTTP session keeps up to `max_workers` connections to each host open, so that
+    pages can be fetched concurrently without opening a new connection for each page.
+    """
+    collection = taxii2client.v20.Collection(url)
+    policy = hodgepodge.http.ConnectionPoolPolicy(pool_maxsize=max_workers)
+    hodgepodge.http.attach_session_policies(collection._conn.session, [policy])
+    return collection
+
+
+def iter_taxii_pages(collection: taxii2client.v20.Collection, page_size: int = DEFAULT_TAXII_PAGE_SIZE,
+                     max_workers: int = DEFAULT_TAXII_MAX_WORKERS, **filters) -> Iterator[dict]:
+    """
+    Pages through the objects in a TAXII 2.0 collection and yields each page (a bundle) in order.
+
+    The first page is fetched on its own to find out how many objects there are (from its Content-Range header), and
+    the remaining pages are then fetched concurrently using up to `max_workers` threads. Servers that don't say how many
+    objects there are are paged through one page at a time.
+    """
+    try:
+        yield from _iter_taxii_pages(collection, page_size=page_size, max_workers=max_workers, **filters)
+    except requests.exceptions.HTTPError as e:
+
+        #: TAXII 2.0 servers that don't send Content-Range headers respond with a 416 (Range Not Satisfiable) once the
+        #: pager runs past the last page, so it's treated as the end of the pages rather than as an error.
+        if e.response is None or e.response.status_code != 416:
+            raise
+
+
+def _iter_taxii_pages(collection: taxii2client.v20.Collection, page_size: int, max_workers: int,
+                      **filters) -> Iterator[dict]:
+    response = collection.get_objects(per_request=page_size, **filters)
+    yield response.json()
+
+    content_range = _parse_taxii_content_range(response)
+    if content_range is None:
+        return
+
+    start, end, total = content_range
+    if start is None:
+        return
+
+    #: Servers may return fewer objects per page than were asked for, in which case their page size is used instead.
+    page_size = min(page_size, end - start + 1)
+
+    def get_page(offset: int) -> dict:
+        return collection.get_objects(start=offset, per_request=page_size, **filters).json()
+
+    if total is None:
+        offset = end + 1
+        while True:
+            page = get_page(offset)
+            objects = page.get('objects', [])
+            if not objects:
+                break
+
+            yield page
+            if len(objects) < page_size:
+                break
+            offset += page_size
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            yield from executor.map(get_page, range(end + 1, total, page_size))
+
+
+def _parse_taxii_content_range(response) -> Optional[Tuple[Optional[int], Optional[int], Optional[int]]]:
+    match = _TAXII_CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+    if not match:
+        return None
+
+    start, end, total = match.groups()
+    return (
+        int(start) if start is not None else None,
+        int(end) if end is not None else None,
+        int(total) if total != '*' else None,
+    )
+
+
+class ConcurrentTaxiiCollectionSource(stix2.TAXIICollectionSource):
+    """
+    A TAXIICollectionSource that fetches the pages of each query concurrently (see iter_taxii_pages()).
+    """
+    def __init__(self, collection: taxii2client.v20.Collection, allow_custom: bool = True,
+                 items_per_page: int = DEFAULT_TAXII_PAGE_SIZE, max_workers: int = DEFAULT_TAXII_MAX_WORKERS):
+        super().__init__(collection, allow_custom=allow_custom, items_per_page=items_per_page)
+        self.max_workers = max_workers
+
+    def query(self, query=None, version=None, _composite_filters=None):
+        query = FilterSet(query)
+        if self.filters:
+            query.add(self.filters)
+        if _composite_filters:
+            query.add(_composite_filters)
+
+        #: Filters that the server supports are applied by the server, and the rest are applied locally.
+        taxii_filters = self._parse_taxii_filters(query)
+        pages = iter_taxii_pages(self.collection, page_size=self.items_per_page, max_workers=self.max_workers,
+                                 **{f.property: f.value for f in taxii_filters})
+        try:
+            objects = deduplicate(o for page in pages for o in page.get('objects', []))
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                raise DataSourceError(
+                    "The requested STIX objects for the TAXII Collection resource defined in the supplied TAXII "
+                    "Collection object are either not found or access is denied. Received error: ", e)
+            raise
+
+        query.remove(taxii_filters)
+        return [stix2.parse(o, allow_custom=self.allow_custom, version=version)
+                for o in apply_common_filters(objects, query)]
+
+
+class TaxiiCache:
+    """
+    An on-disk cache of TAXII 2.0 collections.
+
+    Each collection is stored as gzip-compressed JSON lines (one STIX object per line) alongside a small JSON index that
+    records when the collection was last refreshed. Collections are served from the cache until they're older than
+    `ttl` seconds, at which point only objects added to the collection since the last refresh are requested (using the
+    `added_after` filter) and appended to the cache as a new gzip member.
+    """
+    def __init__(self, directory: str, ttl: float = DEFAULT_TAXII_CACHE_TTL, page_size: int = DEFAULT_TAXII_PAGE_SIZE,
+                 max_workers: int = DEFAULT_TAXII_MAX_WORKERS):
+        self.directory = directory
+        self.ttl = ttl
+        self.page_size = page_size
+        self.max_workers = max_workers
+        os.makedirs(directory, exist_ok=True)
+
+    def get_data_source(self, url: str, allow_custom: bool = True, object_types: Optional[Iterable[str]] = None,
+                        compress: bool = False) -> 'StixStore':
+        if not self.is_fresh(url):
+            self.refresh(url)
+
+        object_types = frozenset(object_types) if object_types else None
+        objects = (o for o in self.iter_objects(url) if object_types is None or o.get('type') in object_types)
+        return StixStore(objects, allow_custom=allow_custom, compress=compress)
+
+    def is_fresh(self, url: str) -> bool:
+        index = self._read_index(url)
+        return index is not None and time.time() - index['refreshed_at'] < self.ttl
+
+    def refresh(self, url: str, full: bool = False) -> int:
+        """
+        Fetches objects that were added to the collection since it was last refreshed (or every object if `full` is set
+        or the collection isn't cached yet) and returns the number of objects that were fetched.
+        """
+        index = self._read_index(url)
+        if full or index is None:
+            index = {'url': url, 'added_after': None, 'object_count': 0}
+
+        #: The next refresh asks for objects added shortly before this one started in case the server's clock is behind.
+        started_at = datetime.datetime.now(tz=datetime.timezone.utc)
+        added_after = index['added_after']
+
+        collection = get_taxii_collection(url, max_workers=self.max_workers)
+        filters = {'added_after': added_after} if added_after else {}
+        pages = iter_taxii_pages(collection, page_size=self.page_size, max_workers=self.max_workers, **filters)
+
+        path = self._get_objects_path(url)
+        tmp = path + '.tmp'
+        object_count = 0
+        with gzip.open(tmp, 'wb') as fp:
+            for page in pages:
+                for o in page.get('objects', []):
+                    fp.write(json.dumps(o, separators=(',', ':')).encode('utf-8') + b'\n')
+                    object_count += 1
+
+        #: New objects are appended to the cache as a new gzip member (gzip files can contain multiple members), and the
+        #: cache is only rewritten if objects were added.
+        if added_after is None or not os.path.exists(path):
+            os.replace(tmp, path)
+        elif object_count:
+            with open(tmp, 'rb') as src, open(path, 'rb') as original, open(tmp + '.merged', 'wb') as dst:
+                shutil.copyfileobj(original, dst)
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp + '.merged', path)
+            os.unlink(tmp)
+        else:
+            os.unlink(tmp)
+
+        index['object_count'] += object_count
+        index['added_after'] = format_datetime(started_at - datetime.timedelta(seconds=TAXII_CACHE_REFRESH_OVERLAP))
+        index['refreshed_at'] = started_at.timestamp()
+        self._write_index(url, index)
+        return object_count
+
+    def iter_objects(self, url: str) -> Iterator[dict]:
+        path = self._get_objects_path(url)
+        if not os.path.exists(path):
+            return
+
+        with gzip.open(path, 'rt', encoding='utf-8') as fp:
+            for line in fp:
+                yield json.loads(line)
+
+    def clear(self, url: str):
+        for path in (self._get_objects_path(url), self._get_index_path(url)):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _read_index(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._get_index_path(url)) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def _write_index(self, url: str, index: dict):
+        path = self._get_index_path(url)
+        with open(path + '.tmp', 'w') as fp:
+            json.dump(index, fp)
+        os.replace(path + '.tmp', path)
+
+    def _get_objects_path(self, url: str) -> str:
+        return os.path.join(self.directory, _get_cache_key(url) + '.jsonl.gz')
+
+    def _get_index_path(self, url: str) -> str:
+        return os.path.join(self.directory, _get_cache_key(url) + '.json')
+
+
+def _get_cache_key(url: str) -> str:
+    return hodgepodge.hashing.get_sha256(url.rstrip('/'))
+
+
+def get_filesystem_data_source(path: str, allow_custom: bool = True) -> Union['StixStore', stix2.FileSystemSource]:
     if not hodgepodge.files.exists(path):
         raise FileNotFoundError(path)
 
@@ -39,17 +296,17 @@ def get_filesystem_data_source(path: str, allow_custom: bool = True) -> Union[st
         return _get_data_source_from_file(path=path, allow_custom=allow_custom)
 
 
-def _get_data_source_from_file(path: str, allow_custom: bool = True) -> stix2.MemorySource:
-    with open(path, 'rb') as fp:
-        data = json.load(fp)
-        return stix2.MemorySource(data, allow_custom=allow_custom)
+def _get_data_source_from_file(path: str, allow_custom: bool = True) -> 'StixStore':
+    return StixStore.from_file(path=path, allow_custom=allow_custom)
 
 
 def _get_data_source_from_directory(path: str, allow_custom: bool = True) -> stix2.FileSystemSource:
     return stix2.FileSystemSource(stix_dir=path, allow_custom=allow_custom)
 
 
-def get_composite_data_source(paths: Iterable[str] = None, urls: Iterable[str] = None, allow_custom: bool = True) -> CompositeDataSource:
+def get_composite_data_source(paths: Iterable[str] = None, urls: Iterable[str] = None, allow_custom: bool = True,
+                              taxii_cache: Optional[TaxiiCache] = None,
+                              max_workers: Optional[int] = None) -> CompositeDataSource:
     if not (paths or urls):
         raise ValueError("At least one path or URL is required")
 
@@ -62,19 +319,379 @@ def get_composite_data_source(paths: Iterable[str] = None, urls: Iterable[str] =
 
     if urls:
         for url in urls:
-            data_source = get_taxii_data_source(url=url, allow_custom=allow_custom)
+            data_source = get_taxii_data_source(url=url, allow_custom=allow_custom, cache=taxii_cache)
             data_sources.append(data_source)
 
-    return combine_data_sources(data_sources)
+    return combine_data_sources(data_sources, max_workers=max_workers)
 
 
-def combine_data_sources(data_sources: Iterable[DataSource]) -> CompositeDataSource:
-    src = CompositeDataSource()
+def combine_data_sources(data_sources: Iterable[DataSource], max_workers: Optional[int] = None) -> CompositeDataSource:
+    src = ParallelCompositeDataSource(max_workers=max_workers)
     src.add_data_sources(list(data_sources))
     return src
 
 
+class ParallelCompositeDataSource(CompositeDataSource):
+    """
+    A CompositeDataSource that queries its data sources concurrently (using up to `max_workers` threads, or one thread
+    per data source by default) rather than one after another, so that queries take as long as the slowest data source
+    rather than as long as all of them combined.
+
+    As with CompositeDataSource, results are merged and deduplicated by (id, modified), and get() returns the latest
+    version of an object across all data sources.
+    """
+    def __init__(self, max_workers: Optional[int] = None):
+        super().__init__()
+        self.max_workers = max_workers
+
+    def get(self, stix_id, _composite_filters=None):
+        results = self._map(lambda ds, filters: ds.get(stix_id=stix_id, _composite_filters=filters), _composite_filters)
+
+        stix_obj = latest_ver = None
+        for obj in filter(None, results):
+            ver = obj.get('modified') or obj.get('created')
+            if stix_obj is None or ver is None or ver > latest_ver:
+                stix_obj = obj
+                latest_ver = ver
+        return stix_obj
+
+    def all_versions(self, stix_id, _composite_filters=None):
+        return self._merge(lambda ds, filters: ds.all_versions(stix_id=stix_id, _composite_filters=filters),
+                           _composite_filters)
+
+    def query(self, query=None, _composite_filters=None):
+        query = query or []
+        return self._merge(lambda ds, filters: ds.query(query=query, _composite_filters=filters), _composite_filters)
+
+    def relationships(self, *args, **kwargs):
+        return self._merge(lambda ds, _: ds.relationships(*args, **kwargs))
+
+    def related_to(self, *args, **kwargs):
+        return self._merge(lambda ds, _: ds.related_to(*args, **kwargs))
+
+    def _merge(self, f: Callable[[DataSource, FilterSet], list], _composite_filters=None) -> list:
+        results = [o for result in self._map(f, _composite_filters) for o in result]
+        return deduplicate(results) if results else results
+
+    def _map(self, f: Callable[[DataSource, FilterSet], Any], _composite_filters=None) -> list:
+        if not self.has_data_sources():
+            raise AttributeError("CompositeDataSource has no data sources")
+
+        filters = FilterSet()
+        filters.add(self.filters)
+        if _composite_filters:
+            filters.add(_composite_filters)
+
+        data_sources = self.data_sources
+        if len(data_sources) == 1:
+            return [f(data_sources[0], filters)]
+
+        #: Results are returned in the order of the data sources so that deduplication picks the same object each time.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers or len(data_sources)) as executor:
+            return list(executor.map(lambda ds: f(ds, filters), data_sources))
+
+
+class StixStore(DataSource):
+    """
+    A read-only, in-memory STIX data source that indexes objects by ID, type, external ID, and (lowercase) name/alias.
+
+    Objects are kept as the dicts that they were loaded from (or as zlib-compressed JSON if `compress` is set) and are
+    only parsed into stix2 objects when they're retrieved through the stix2 DataSource interface (e.g. when the store is
+    part of a CompositeDataSource), so get_object() and iter_objects() are dictionary lookups.
+    """
+    def __init__(self, objects: Iterable[dict] = None, allow_custom: bool = True, compress: bool = False):
+        super().__init__()
+        self.allow_custom = allow_custom
+        self.compress = compress
+
+        self._versions: Dict[str, List[Tuple[str, Union[dict, bytes]]]] = {}
+        self._ids_by_type: Dict[str, List[str]] = collections.defaultdict(list)
+        self._ids_by_external_id: Dict[str, Set[str]] = collections.defaultdict(set)
+        self._ids_by_name: Dict[str, Set[str]] = collections.defaultdict(set)
+        for o in objects or ():
+            self.add(o)
+
+    @classmethod
+    def from_file(cls, path: str, allow_custom: bool = True, object_types: Optional[Iterable[str]] = None,
+                  compress: bool = False) -> 'StixStore':
+        return cls(iter_bundle_objects(path, object_types=object_types), allow_custom=allow_custom, compress=compress)
+
+    @classmethod
+    def from_data_source(cls, data_source: DataSource, allow_custom: bool = True,
+                         object_types: Optional[Iterable[str]] = None, compress: bool = False) -> 'StixStore':
+        constraints = [('type', 'in', list(object_types))] if object_types else None
+        return cls(query(data_source, constraints), allow_custom=allow_custom, compress=compress)
+
+    def add(self, o: dict):
+        o = stix2_to_dict(o)
+        object_id = o['id']
+
+        #: Only the latest version of each object is indexed, so a new version replaces the previous one in the indexes.
+        versions = self._versions.get(object_id)
+        if versions is None:
+            versions = self._versions[object_id] = []
+            self._ids_by_type[o['type']].append(object_id)
+            latest = None
+        else:
+            latest = versions[-1]
+
+        #: Objects can be added more than once (e.g. when refreshing a cache), in which case they replace themselves.
+        modified = o.get('modified', '')
+        versions[:] = [version for version in versions if version[0] != modified]
+        versions.append((modified, self._pack(o)))
+        versions.sort(key=lambda version: version[0])
+        if versions[-1] is not latest:
+            if latest is not None:
+                self._unindex(self._unpack(latest[1]))
+            self._index(o)
+
+    def _pack(self, o: dict) -> Union[dict, bytes]:
+        if self.compress:
+            return zlib.compress(json.dumps(o, separators=(',', ':')).encode('utf-8'), 1)
+        return o
+
+    @staticmethod
+    def _unpack(o: Union[dict, bytes]) -> dict:
+        if isinstance(o, bytes):
+            return json.loads(zlib.decompress(o))
+        return o
+
+    def _index(self, o: dict):
+        object_id = o['id']
+        for external_id in _get_external_ids(o):
+            self._ids_by_external_id[external_id].add(object_id)
+        for name in _get_names(o):
+            self._ids_by_name[name.lower()].add(object_id)
+
+    def _unindex(self, o: dict):
+        object_id = o['id']
+        for external_id in _get_external_ids(o):
+            self._ids_by_external_id[external_id].discard(object_id)
+        for name in _get_names(o):
+            self._ids_by_name[name.lower()].discard(object_id)
+
+    def get_object(self, object_id: str) -> Optional[dict]:
+        versions = self._versions.get(object_id)
+        if versions:
+            return self._unpack(versions[-1][1])
+
+    def iter_objects(self, object_ids: Iterable[str] = None, object_external_ids: Iterable[str] = None,
+                     object_types: Iterable[str] = None, object_names: Iterable[str] = None) -> Iterator[dict]:
+
+        #: Each filter is resolved to a set of candidate object IDs using the indexes, and objects must match every filter.
+        candidates = None
+
+        def intersect(ids: Iterable[str]):
+            nonlocal candidates
+            candidates = set(ids) if candidates is None else candidates.intersection(ids)
+
+        if object_ids:
+            intersect(object_ids)
+
+        if object_external_ids:
+            intersect(object_id for external_id in object_external_ids
+                      for object_id in self._ids_by_external_id.get(external_id, ()))
+
+        if object_names:
+            intersect(self._get_ids_by_names(object_names))
+
+        if object_types:
+            ids = [object_id for object_type in object_types for object_id in self._ids_by_type.get(object_type, ())]
+            if candidates is None:
+                candidates = ids
+            else:
+                intersect(ids)
+
+        if candidates is None:
+            candidates = self._versions.keys()
+        elif not isinstance(candidates, list):
+            candidates = sorted(candidates)
+
+        for object_id in candidates:
+            o = self.get_object(object_id)
+            if o is not None:
+                yield o
+
+    def _get_ids_by_names(self, names: Iterable[str]) -> Set[str]:
+        names = list(names)
+        literals = [name for name in names if not hodgepodge.pattern_matching.is_glob(name)]
+        patterns = [name for name in names if hodgepodge.pattern_matching.is_glob(name)]
+
+        ids = set()
+        for name in literals:
+            ids.update(self._ids_by_name.get(name.lower(), ()))
+
+        #: Wildcards are matched against the distinct names in the index rather than against every object.
+        if patterns:
+            matcher = hodgepodge.pattern_matching.compile_globs(patterns)
+            for name, object_ids in self._ids_by_name.items():
+                if object_ids and matcher.matches(name):
+                    ids.update(object_ids)
+        return ids
+
+    def get(self, stix_id: str, _composite_filters=None):
+        latest_version = [self._unpack(o) for (_, o) in self._versions.get(stix_id, [])[-1:]]
+        objects = self._parse(self._apply_filters(latest_version, _composite_filters))
+        return objects[0] if objects else None
+
+    def all_versions(self, stix_id: str, _composite_filters=None):
+        versions = [self._unpack(o) for (_, o) in self._versions.get(stix_id, [])]
+        return self._parse(self._apply_filters(versions, _composite_filters))
+
+    def query(self, query=None, _composite_filters=None):
+        objects = (self._unpack(o) for versions in self._versions.values() for (_, o) in versions)
+        return self._parse(self._apply_filters(objects, _composite_filters, query))
+
+    def _apply_filters(self, objects: Iterable[dict], composite_filters=None, query=None) -> Iterator[dict]:
+        filters = FilterSet(query)
+        filters.add(self.filters)
+        if composite_filters:
+            filters.add(composite_filters)
+        return apply_common_filters(objects, filters)
+
+    def _parse(self, objects: Iterable[dict]) -> list:
+        return [stix2.parse(o, allow_custom=self.allow_custom) for o in objects]
+
+    def __contains__(self, object_id: str) -> bool:
+        return object_id in self._versions
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+
+def get_stix_store(path: str, allow_custom: bool = True, object_types: Optional[Iterable[str]] = None,
+                   compress: bool = False) -> StixStore:
+    if not hodgepodge.files.exists(path):
+        raise FileNotFoundError(path)
+
+    if hodgepodge.files.is_directory(path):
+        data_source = _get_data_source_from_directory(path=path, allow_custom=allow_custom)
+        return StixStore.from_data_source(data_source, allow_custom=allow_custom, object_types=object_types,
+                                          compress=compress)
+    else:
+        return StixStore.from_file(path=path, allow_custom=allow_custom, object_types=object_types, compress=compress)
+
+
+def iter_bundle_objects(path: str, object_types: Optional[Iterable[str]] = None,
+                        block_size: int = DEFAULT_BUNDLE_READ_BLOCK_SIZE) -> Iterator[dict]:
+    """
+    Incrementally parses the objects in a STIX bundle (or a JSON list of STIX objects), optionally skipping objects
+    that aren't of the given types, without loading the whole file into memory. Gzip-compressed files are supported.
+    """
+    object_types = frozenset(object_types) if object_types else None
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as fp:
+        for o in _iter_bundle_objects(_JSONStreamReader(fp, block_size=block_size)):
+            if object_types is None or o.get('type') in object_types:
+                yield o
+
+
+def _iter_bundle_objects(reader: '_JSONStreamReader') -> Iterator[dict]:
+    c = reader.peek()
+    if c == '[':
+        yield from reader.iter_array()
+        return
+
+    #: Values other than the list of objects are small, so they're decoded and discarded.
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        if key == 'objects':
+            yield from reader.iter_array()
+        else:
+            reader.decode()
+
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
+
+
+class _JSONStreamReader:
+    def __init__(self, fp, block_size: int = DEFAULT_BUNDLE_READ_BLOCK_SIZE):
+        self.fp = fp
+        self.block_size = block_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _read(self) -> bool:
+        if self.eof:
+            return False
+
+        #: Data that has already been parsed is dropped before reading more, so only the current value is kept in memory.
+        data = self.fp.read(self.block_size)
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        self.eof = not data
+        return not self.eof
+
+    def peek(self) -> str:
+        while True:
+            match = _WHITESPACE.match(self.buffer, self.position)
+            self.position = match.end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            elif not self._read():
+                raise ValueError("Unexpected end of JSON input")
+
+    def expect(self, c: str):
+        if self.peek() != c:
+            raise ValueError("Expected {!r} at offset {} of JSON input".format(c, self.position))
+        self.position += 1
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+
+            #: Values that end at the end of the buffer might be truncated (e.g. numbers), so they're decoded again once
+            #: more data has been read.
+            if end == len(self.buffer) and self._read():
+                continue
+
+            self.position = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+
+        while True:
+            yield self.decode()
+            if self.peek() == ']':
+                self.position += 1
+                return
+            self.expect(',')
+
+
+def _get_external_ids(o: dict) -> Iterator[str]:
+    for ref in o.get('external_references', ()):
+        if 'external_id' in ref:
+            yield ref['external_id']
+
+
+def _get_names(o: dict) -> List[str]:
+    if 'name' not in o:
+        return []
+    return [o['name']] + o.get('aliases', [])
+
+
 def get_object(data_source: DataSource, object_id: str) -> Optional[dict]:
+    if isinstance(data_source, StixStore):
+        return data_source.get_object(object_id)
+
     row = data_source.get(stix_id=object_id)
     if row:
         return stix2_to_dict(row)
@@ -83,6 +700,15 @@ def get_object(data_source: DataSource, object_id: str) -> Optional[dict]:
 def iter_objects(data_source: DataSource, object_ids: Iterable[str] = None, object_external_ids: Iterable[str] = None,
                  object_types: Iterable[str] = None, object_names: Iterable[str] = None) -> Iterator[dict]:
 
+    if isinstance(data_source, StixStore):
+        yield from data_source.iter_objects(
+            object_ids=object_ids,
+            object_external_ids=object_external_ids,
+            object_types=object_types,
+            object_names=object_names,
+        )
+        return
+
     constraints = []
 
     #: Filter objects by (internal) ID.
@@ -95,17 +721,19 @@ def iter_objects(data_source: DataSource, object_ids: Iterable[str] = None, obje
         constraint = ('type', 'in', object_types)
         constraints.append(constraint)
 
+    #: Filter objects by name or alias - doing this client-side allows us to support globs.
+    name_matcher = hodgepodge.pattern_matching.compile_globs(object_names) if object_names else None
+
     #: Execute the query.
     for row in query(data_source=data_source, constraints=constraints):
-        row = stix2_to_dict(row)
 
-        #: Filter objects by name or alias - doing this here allows us to support regular expressions and globs.
-        if object_names:
+        #: Filter objects by name or alias.
+        if name_matcher:
             if 'name' not in row:
                 continue
 
             names = [row['name']] + row.get('aliases', [])
-            if not hodgepodge.pattern_matching.str_matches_glob(values=names, patterns=object_names):
+            if not name_matcher.matches(names):
                 continue
 
         #: Filter objects by external ID - performing this operation on the server-side appears to be broken. :(
@@ -118,7 +746,7 @@ def iter_objects(data_source: DataSource, object_ids: Iterable[str] = None, obje
 
 
 def query(data_source: DataSource, constraints: List[Tuple[str, str, Any]] = None) -> Iterator[dict]:
-    constraints = [stix2.Filter(k, o, v) for (k, o, v) in constraints]
+    constraints = [stix2.Filter(k, o, v) for (k, o, v) in constraints or []]
     for row in data_source.query(constraints):
         yield stix2_to_dict(row)
 
@@ -126,4 +754,22 @@ def query(data_source: DataSource, constraints: List[Tuple[str, str, Any]] = Non
 def stix2_to_dict(data: Any) -> dict:
     if isinstance(data, dict):
         return data
-    return json.loads(data.serialize())
+    return _stix2_to_json_compatible(data)
+
+
+def _stix2_to_json_compatible(value: Any) -> Any:
+
+    #: This produces the same result as parsing the output of serialize() - optional properties that were set to their
+    #: default values are left out, and timestamps are formatted as STIX timestamps - without going through JSON.
+    if type(value) in _JSON_SCALAR_TYPES:
+        return value
+    elif isinstance(value, _STIXBase):
+        defaulted = value._defaulted_optional_properties
+        return {k: _stix2_to_json_compatible(v) for (k, v) in value._inner.items() if k not in defaulted}
+    elif isinstance(value, dict):
+        return {k: _stix2_to_json_compatible(v) for (k, v) in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_stix2_to_json_compatible(v) for v in value]
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        return format_datetime(value)
+    return value
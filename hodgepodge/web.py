@@ -1,17 +1,44 @@
 from requests import Session
-from typing import Optional
-from hodgepodge.hashing import Hashes
+from typing import Optional, Iterable, Iterator, Tuple
+from hodgepodge.hashing import Hashes, HashCache
 from hodgepodge.files import INCLUDE_FILE_HASHES_BY_DEFAULT
+from hodgepodge.http import DownloadResult, SessionManager, DEFAULT_MAX_DOWNLOAD_WORKERS, \
+    DEFAULT_MAX_DOWNLOADS_PER_HOST
 
 import hodgepodge.http
 
 
 def download_file(url: str, path: str, session: Optional[Session] = None,
-                  include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT) -> Optional[Hashes]:
+                  include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+                  hash_cache: Optional[HashCache] = None,
+                  hash_algorithms: Optional[Iterable[str]] = None,
+                  expected_hashes: Optional[Hashes] = None) -> Optional[Hashes]:
 
     return hodgepodge.http.download_file(
         url=url,
         path=path,
         session=session,
         include_file_hashes=include_file_hashes,
+        hash_cache=hash_cache,
+        hash_algorithms=hash_algorithms,
+        expected_hashes=expected_hashes,
+    )
+
+
+def download_files(downloads: Iterable[Tuple[str, str]],
+                   session_manager: Optional[SessionManager] = None,
+                   max_workers: int = DEFAULT_MAX_DOWNLOAD_WORKERS,
+                   max_downloads_per_host: int = DEFAULT_MAX_DOWNLOADS_PER_HOST,
+                   include_file_hashes: bool = INCLUDE_FILE_HASHES_BY_DEFAULT,
+                   hash_cache: Optional[HashCache] = None,
+                   hash_algorithms: Optional[Iterable[str]] = None) -> Iterator[DownloadResult]:
+
+    return hodgepodge.http.download_files(
+        downloads=downloads,
+        session_manager=session_manager,
+        max_workers=max_workers,
+        max_downloads_per_host=max_downloads_per_host,
+        include_file_hashes=include_file_hashes,
+        hash_cache=hash_cache,
+        hash_algorithms=hash_algorithms,
     )
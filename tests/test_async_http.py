@@ -0,0 +1,218 @@
+from unittest import TestCase
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from hodgepodge.async_http import AsyncSession
+from hodgepodge.error import IntegrityError
+from hodgepodge.hashing import Hashes
+
+import hodgepodge.async_http
+import hodgepodge.hashing
+import hodgepodge.http
+import threading
+import json
+import requests
+import tempfile
+import asyncio
+import os
+
+
+class AsyncHttpTestCases(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), AsyncTestHTTPRequestHandler)
+        cls.server.data = os.urandom(3 * 1024 * 1024 + 1)
+        cls.server.failures = 0
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get(self):
+        async def main():
+            async with AsyncSession() as session:
+                for path in ['/data', '/chunked', '/redirect']:
+                    async with await session.get(self.url + path) as response:
+                        self.assertEqual(200, response.status_code)
+                        self.assertEqual(self.server.data, await response.read())
+                return session.get_metrics()
+
+        metrics = asyncio.run(main())
+        self.assertEqual(1, metrics.connections)
+        self.assertEqual(4, metrics.requests)
+
+    def test_errors(self):
+        async def main():
+            async with AsyncSession() as session:
+                response = await session.get(self.url + '/missing')
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    response.raise_for_status()
+                response.release()
+
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    await session.get('http://127.0.0.1:1/')
+
+                #: Line breaks in headers (or the request target) would allow headers or requests to be injected.
+                for headers in [{'X-Test': 'a\r\nX-Injected: b'}, {'X-Test\r\nX-Injected': 'b'}, {'X Test': 'a'}]:
+                    with self.assertRaises(requests.exceptions.InvalidHeader):
+                        await session.get(self.url + '/data', headers=headers)
+                with self.assertRaises(requests.exceptions.InvalidURL):
+                    await session.get(self.url + '/data HTTP/1.1\r\nX-Injected: b')
+
+        asyncio.run(main())
+
+    def test_malformed_responses(self):
+        async def main():
+            async with AsyncSession(max_connections=1) as session:
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    await session.get(self.url + '/malformed?status')
+                with self.assertRaises(requests.exceptions.InvalidHeader):
+                    await session.get(self.url + '/malformed?headers')
+
+                #: The connection slot should have been released, or this would wait forever.
+                response = await asyncio.wait_for(session.get(self.url + '/missing'), timeout=5)
+                response.release()
+                return response.status_code
+
+        self.assertEqual(404, asyncio.run(main()))
+
+    def test_redirects(self):
+        async def main():
+            headers = {'Authorization': 'Bearer secret', 'Content-Type': 'text/plain'}
+            async with AsyncSession(headers={'Cookie': 'a=b'}) as session:
+                results = []
+                for (method, path) in [('GET', '/redirect?to=/echo'), ('GET', '/redirect?to=localhost'),
+                                       ('POST', '/redirect?to=/echo')]:
+                    data = b'x' if method == 'POST' else None
+                    async with await session.request(method, self.url + path, headers=headers, data=data) as response:
+                        results.append(json.loads(await response.read()))
+                return results
+
+        same_host, cross_host, post = asyncio.run(main())
+        self.assertEqual('Bearer secret', same_host['headers'].get('Authorization'))
+        self.assertEqual('a=b', same_host['headers'].get('Cookie'))
+
+        #: Credentials aren't sent to other hosts, and POST requests are followed with a GET without a body.
+        self.assertNotIn('Authorization', cross_host['headers'])
+        self.assertNotIn('Cookie', cross_host['headers'])
+        self.assertEqual('GET', post['method'])
+        self.assertEqual('', post['body'])
+        self.assertNotIn('Content-Type', post['headers'])
+        self.assertNotIn('Content-Length', post['headers'])
+
+    def test_retry_policy(self):
+        async def main(policies):
+            self.server.failures = 2
+            async with AsyncSession(policies=policies) as session:
+                response = await session.get(self.url + '/flaky')
+                response.release()
+                return response.status_code
+
+        self.assertEqual(503, asyncio.run(main(None)))
+        policy = hodgepodge.http.get_automatic_retry_policy(backoff_factor=0)
+        self.assertEqual(200, asyncio.run(main([policy])))
+
+    def test_download_file(self):
+        path = os.path.join(self.tmp_dir.name, 'data')
+        progress = []
+        hashes = asyncio.run(hodgepodge.async_http.download_file(
+            self.url + '/chunked', path, include_file_hashes=True, hash_algorithms=['sha256'],
+            chunk_size=1024 * 1024, progress=progress.append))
+        self.assertEqual(Hashes(sha256=hodgepodge.hashing.get_sha256(self.server.data)), hashes)
+        with open(path, 'rb') as fp:
+            self.assertEqual(self.server.data, fp.read())
+        self.assertEqual(len(self.server.data), progress[-1].downloaded)
+
+        #: Files that fail verification shouldn't replace the existing file or be left behind.
+        with self.assertRaises(IntegrityError):
+            asyncio.run(hodgepodge.async_http.download_file(
+                self.url + '/data', path, expected_hashes=Hashes(md5='0' * 32)))
+        self.assertEqual(['data'], os.listdir(self.tmp_dir.name))
+
+    def test_download_files(self):
+        async def main(downloads):
+            return [result async for result in hodgepodge.async_http.download_files(
+                downloads, max_concurrent_downloads=4, max_downloads_per_host=2, include_file_hashes=True,
+                hash_algorithms=['sha256'])]
+
+        urls = [self.url + '/data'] * 6 + [self.url + '/missing']
+        downloads = [(url, os.path.join(self.tmp_dir.name, str(i))) for (i, url) in enumerate(urls)]
+        results = asyncio.run(main(downloads))
+        self.assertEqual(sorted(urls), sorted(result.url for result in results))
+        self.assertEqual([self.url + '/missing'], [result.url for result in results if not result.ok])
+
+        sha256 = hodgepodge.hashing.get_sha256(self.server.data)
+        self.assertTrue(all(result.hashes.sha256 == sha256 for result in results if result.ok))
+
+    def test_download_files_stopped_early(self):
+        async def main(downloads):
+            results = hodgepodge.async_http.download_files(downloads, max_concurrent_downloads=2)
+            async for _ in results:
+                break
+            await results.aclose()
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+        #: Downloads that were still running should be cancelled and finished by the time the iterator is closed.
+        downloads = [(self.url + '/data', os.path.join(self.tmp_dir.name, str(i))) for i in range(8)]
+        self.assertEqual([], asyncio.run(main(downloads)))
+
+
+class AsyncTestHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        data = self.server.data
+        if self.path == '/data':
+            self.send(200, data)
+        elif self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(data), 100000):
+                chunk = data[i:i + 100000]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        elif self.path == '/redirect':
+            self.send(302, b'', headers={'Location': '/data'})
+        elif self.path == '/redirect?to=/echo':
+            self.send(302, b'', headers={'Location': '/echo'})
+        elif self.path == '/redirect?to=localhost':
+            self.send(302, b'', headers={'Location': 'http://localhost:{}/echo'.format(self.server.server_port)})
+        elif self.path == '/echo':
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            self.send(200, json.dumps({'method': self.command, 'headers': dict(self.headers), 'body': body}).encode())
+        elif self.path == '/malformed?status':
+            self.close_connection = True
+            self.wfile.write(b'HTTP/1.1 OK\r\nContent-Length: 0\r\n\r\n')
+        elif self.path == '/malformed?headers':
+            self.close_connection = True
+            self.wfile.write(b'HTTP/1.1 200 OK\r\n' + b'X-Header: x\r\n' * 101 + b'Content-Length: 0\r\n\r\n')
+        elif self.path == '/flaky' and self.server.failures:
+            self.server.failures -= 1
+            self.send(503, b'unavailable')
+        elif self.path == '/flaky':
+            self.send(200, b'ok')
+        else:
+            self.send(404, b'not found')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def send(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        for (k, v) in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
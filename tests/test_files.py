@@ -1,7 +1,12 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 from hodgepodge.files import FileSearch, File, MACTimestamps, StatResult
 
 import hodgepodge.files
+import hodgepodge.hashing
+import hodgepodge.pattern_matching
+import hodgepodge.time
+import dataclasses
+import datetime
 import tempfile
 import uuid
 import os
@@ -185,3 +190,344 @@ class FileTestCases(TestCase):
 
         result = {f.path for f in FileSearch(roots=[path])}
         self.assertEqual(0, len(result))
+
+    def test_search_stats_each_path_once(self):
+        def count_stat_calls(file_count: int) -> int:
+            tmp_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+            sub_dir = tempfile.mkdtemp(dir=tmp_dir)
+            for i in range(file_count):
+                tempfile.mkstemp(dir=tmp_dir if i % 2 else sub_dir)
+
+            with mock.patch('os.stat', wraps=os.stat) as a, mock.patch('os.lstat', wraps=os.lstat) as b:
+                files = list(FileSearch(roots=[tmp_dir], filename_patterns=['*']))
+                self.assertEqual(file_count + 2, len(files))
+                return a.call_count + b.call_count
+
+        #: Directory entries should reuse the stat result from os.scandir() rather than being stat'd again.
+        self.assertEqual(count_stat_calls(5), count_stat_calls(50))
+
+    def _make_tree(self, depth: int = 3, width: int = 3) -> str:
+        root = tempfile.mkdtemp(dir=self.tmp_dir)
+        directories = [root]
+        for _ in range(depth):
+            subdirectories = []
+            for directory in directories:
+                for _ in range(width):
+                    tempfile.mkstemp(dir=directory)
+                    subdirectories.append(tempfile.mkdtemp(dir=directory))
+            directories = subdirectories
+        return hodgepodge.files.get_real_path(root)
+
+    def test_parallel_search(self):
+        root = self._make_tree()
+        expected = list(FileSearch(roots=[root]).iter_matching_paths())
+
+        for ordered in (True, False):
+            with self.subTest(ordered=ordered):
+                result = list(FileSearch(roots=[root], max_workers=4, ordered=ordered).iter_matching_paths())
+                if ordered:
+                    self.assertEqual(expected, result)
+                else:
+                    self.assertEqual(sorted(expected), sorted(result))
+
+    def test_parallel_search_with_max_search_depth(self):
+        root = self._make_tree()
+        for max_search_depth in (1, 2):
+            expected = set(FileSearch(roots=[root], max_search_depth=max_search_depth).iter_matching_paths())
+            for ordered in (True, False):
+                with self.subTest(max_search_depth=max_search_depth, ordered=ordered):
+                    result = set(FileSearch(
+                        roots=[root],
+                        max_search_depth=max_search_depth,
+                        max_workers=4,
+                        ordered=ordered,
+                    ).iter_matching_paths())
+                    self.assertEqual(expected, result)
+
+    def test_parallel_search_with_max_search_results(self):
+        root = self._make_tree()
+        for ordered in (True, False):
+            with self.subTest(ordered=ordered):
+                result = list(FileSearch(
+                    roots=[root],
+                    max_search_results=7,
+                    max_workers=4,
+                    ordered=ordered,
+                ).iter_matching_paths())
+                self.assertEqual(7, len(result))
+
+    def test_search_with_parallel_file_hashing(self):
+        root = self._make_tree()
+        for path in FileSearch(roots=[root]).iter_matching_paths():
+            if hodgepodge.files.is_regular_file(path):
+                with open(path, 'wb') as fp:
+                    fp.write(os.urandom(len(path) * 64))
+
+        expected = {f.path: f.hashes for f in FileSearch(roots=[root], include_file_hashes=True)}
+        result = {f.path: f.hashes for f in FileSearch(
+            roots=[root],
+            include_file_hashes=True,
+            max_hashing_workers=4,
+            max_pending_hashing_bytes=4096,
+        )}
+        self.assertEqual(expected, result)
+
+    def test_search_with_hash_cache(self):
+        root = self._make_tree(depth=1)
+        with hodgepodge.hashing.HashCache(tempfile.mktemp(dir=self.tmp_dir)) as cache:
+            expected = {f.path: f.hashes for f in FileSearch(roots=[root], include_file_hashes=True)}
+            for i in range(2):
+                with self.subTest(i=i):
+                    result = {f.path: f.hashes for f in FileSearch(roots=[root], include_file_hashes=True, hash_cache=cache)}
+                    self.assertEqual(expected, result)
+                    self.assertEqual(3, len(cache))
+
+    def test_diff_snapshots(self):
+        root = self._make_tree(depth=2)
+        paths = [path for path in FileSearch(roots=[root]).iter_matching_paths() if hodgepodge.files.is_regular_file(path)]
+        a = FileSearch(roots=[root]).get_snapshot()
+
+        removed, modified = paths[:2]
+        hodgepodge.files.delete(removed)
+        with open(modified, 'wb') as fp:
+            fp.write(b'hello')
+        _, added = tempfile.mkstemp(dir=root)
+
+        diff = FileSearch(roots=[root], filename_patterns=['tmp*']).diff(a)
+        self.assertEqual({added}, {f.path for f in diff.added})
+        self.assertEqual({modified}, {f.path for f in diff.modified if hodgepodge.files.is_regular_file(f.path)})
+        self.assertEqual({removed}, {entry.path for entry in diff.removed})
+        self.assertEqual(set(FileSearch(roots=[root]).iter_matching_paths()), set(diff.snapshot.entries))
+
+        #: Searching again should yield no changes.
+        diff = FileSearch(roots=[root]).diff(diff.snapshot)
+        self.assertEqual(([], [], []), (diff.added, diff.modified, diff.removed))
+
+    def test_diff_snapshots_with_pruned_directories(self):
+        root = self._make_tree(depth=2)
+        for path in FileSearch(roots=[root]).iter_matching_paths():
+            os.utime(path, (0, 0))
+
+        search = FileSearch(roots=[root], include_file_hashes=True, prune_unchanged_directories=True)
+        a = search.get_snapshot()
+
+        tmp = tempfile.mktemp(dir=self.tmp_dir)
+        hodgepodge.files.write_snapshot(a, tmp)
+        a = hodgepodge.files.read_snapshot(tmp)
+
+        #: Unmodified directories should not be listed again.
+        _, added = tempfile.mkstemp(dir=root)
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            diff = search.diff(a)
+            self.assertEqual(1, scandir.call_count)
+
+        self.assertEqual({added}, {f.path for f in diff.added})
+        self.assertEqual([root], [f.path for f in diff.modified])
+        self.assertEqual([], diff.removed)
+        self.assertEqual(set(FileSearch(roots=[root]).iter_matching_paths()), set(diff.snapshot.entries))
+        self.assertIsNotNone(diff.snapshot.entries[added].hashes)
+
+    def test_search_with_ignored_paths(self):
+        root = self._make_tree(depth=2)
+        ignored = sorted(p for p in FileSearch(roots=[root], max_search_depth=1).iter_matching_paths() if
+                         hodgepodge.files.is_directory(p) and p != root)[0]
+
+        result = set(FileSearch(roots=[root], ignored_paths=[ignored]).iter_matching_paths())
+        self.assertIn(ignored, result)
+        self.assertFalse(any(path.startswith(ignored + os.sep) for path in result))
+
+    def test_search_with_ignore_rules(self):
+        root = tempfile.mkdtemp(dir=self.tmp_dir)
+        for path in ['a.log', 'keep.log', 'a.txt', 'node_modules/x.js', 'src/node_modules/y.js', 'src/b.txt']:
+            path = os.path.join(root, path)
+            hodgepodge.files.mkdir(hodgepodge.files.dirname(path))
+            hodgepodge.files.touch(path)
+
+        search = FileSearch(roots=[root], ignore_rules=['node_modules/', '*.log', '!keep.log'], case_sensitive=True)
+        compile_ignore_rules = hodgepodge.pattern_matching.compile_ignore_rules
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir, \
+                mock.patch('hodgepodge.pattern_matching.compile_ignore_rules', wraps=compile_ignore_rules) as compile:
+            result = {os.path.relpath(path, root) for path in search.iter_matching_paths()}
+
+            #: Excluded directories shouldn't be listed, and the rules should only be compiled once per search.
+            self.assertEqual(2, scandir.call_count)
+            self.assertEqual(1, compile.call_count)
+
+        self.assertEqual({'.', 'keep.log', 'a.txt', 'src', 'src/b.txt'}, result)
+
+    def test_in_directory(self):
+        for path, directories, expected in (
+            ('/a/b/c', ['/a/b'], True),
+            ('/a/b', ['/a/b/'], True),
+            ('/a/bc', ['/a/b'], False),
+            ('/a', ['/a/b'], False),
+            ('/a/b/c', ['/'], True),
+            ('/a/b/c', [], False),
+        ):
+            with self.subTest(path=path, directories=directories):
+                self.assertEqual(expected, hodgepodge.files.in_directory(path, directories))
+
+    def test_get_file_table(self):
+        root = self._make_tree(depth=2)
+        for i, path in enumerate(FileSearch(roots=[root]).iter_matching_paths()):
+            if hodgepodge.files.is_regular_file(path):
+                with open(path, 'wb') as fp:
+                    fp.write(os.urandom(i))
+
+        expected = list(FileSearch(roots=[root]))
+        table = FileSearch(roots=[root]).get_file_table()
+        self.assertEqual(len(expected), len(table))
+        self.assertEqual(expected, list(table))
+        self.assertEqual([f.path for f in expected], list(table.get_paths()))
+
+        #: Filter the table by size.
+        result = table.filter(min_file_size=5, max_file_size=10)
+        self.assertEqual([f.path for f in expected if 5 <= f.size <= 10], list(result.get_paths()))
+
+        #: Filter the table by modification time.
+        self.assertEqual(len(table), len(table.filter(max_mtime=hodgepodge.time.current_time_as_datetime())))
+        self.assertEqual(0, len(table.filter(min_mtime=hodgepodge.time.current_time_as_epoch_time() + 60)))
+
+    def test_search_with_mtime_range(self):
+        root = tempfile.mkdtemp(dir=self.tmp_dir)
+        paths = []
+        for i in range(1, 4):
+            _, path = tempfile.mkstemp(dir=root)
+            os.utime(path, ns=(0, i * 1000 * 1000 * 1000 * 1000))
+            paths.append(hodgepodge.files.get_real_path(path))
+
+        result = set(FileSearch(roots=[root], min_mtime=1500, max_mtime='1970-01-01T00:40:00+00:00').iter_matching_paths())
+        self.assertEqual({paths[1]}, result)
+
+    def test_stat_result_timestamps(self):
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir) as tmp:
+            os.utime(tmp.name, ns=(1500000000, 2500000000))
+            st = hodgepodge.files.stat(tmp.name)
+            self.assertEqual(2500000000, st.st_mtime_ns)
+            self.assertEqual(hodgepodge.time.to_datetime(2.5), st.st_mtime)
+            self.assertEqual(hodgepodge.time.to_datetime(1.5), st.get_mac_timestamps().access_time)
+
+    def test_stat_result_with_legacy_timestamps(self):
+        st = StatResult(
+            st_mode=0, st_ino=1, st_dev=2, st_nlink=1, st_uid=0, st_gid=0, st_size=3,
+            st_atime=hodgepodge.time.to_datetime(1.5), st_mtime=2.5, st_ctime='1970-01-01T00:00:03+00:00',
+        )
+        self.assertEqual((1500000000, 2500000000, 3000000000), (st.st_atime_ns, st.st_mtime_ns, st.st_ctime_ns))
+        self.assertEqual(hodgepodge.time.to_datetime(2.5), st.st_mtime)
+
+        timestamps = MACTimestamps(modify_time=2.5, access_time=1.5, change_time=3)
+        self.assertEqual(st.get_mac_timestamps(), timestamps)
+        self.assertEqual(hodgepodge.time.to_datetime(1.5), timestamps.access_time)
+
+        with self.assertRaises(TypeError):
+            MACTimestamps(modify_time=1, access_time=1)
+
+    def test_stat_result_with_microsecond_precision_timestamps(self):
+        t = datetime.datetime(2023, 11, 14, 22, 13, 20, 123457)
+        st = StatResult(
+            st_mode=0, st_ino=1, st_dev=2, st_nlink=1, st_uid=0, st_gid=0, st_size=3,
+            st_atime=t, st_mtime=t, st_ctime=t,
+        )
+        self.assertEqual(int(t.timestamp()) * 1000 * 1000 * 1000 + 123457000, st.st_mtime_ns)
+        self.assertEqual(t, st.st_mtime)
+
+    def test_asdict(self):
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir) as tmp:
+            os.utime(tmp.name, ns=(1500000000, 2500000000))
+            data = dataclasses.asdict(hodgepodge.files.get_metadata(tmp.name))
+            self.assertEqual(hodgepodge.time.to_datetime(2.5), data['mac_timestamps']['modify_time'])
+            self.assertEqual(hodgepodge.time.to_datetime(1.5), data['stat_result']['st_atime'])
+            self.assertEqual([
+                'st_mode', 'st_ino', 'st_dev', 'st_nlink', 'st_uid', 'st_gid', 'st_size',
+                'st_atime', 'st_mtime', 'st_ctime',
+            ], list(data['stat_result']))
+            self.assertEqual(2500000000, StatResult(**data['stat_result']).st_mtime_ns)
+
+    def test_search_with_attribute_filters(self):
+        root = tempfile.mkdtemp(dir=self.tmp_dir)
+        a = os.path.join(root, 'a')
+        b = os.path.join(root, 'b')
+        for path in (a, b):
+            with open(path, 'w'):
+                pass
+        os.chmod(b, 0o755)
+        os.utime(a, ns=(1000 * 1000 * 1000 * 1000, 0))
+        os.link(a, os.path.join(root, 'c'))
+        os.mkdir(os.path.join(root, 'd'))
+        a, b = map(hodgepodge.files.get_real_path, (a, b))
+
+        result = set(FileSearch(roots=[root], file_types=[hodgepodge.files.DIRECTORY]).iter_matching_paths())
+        self.assertEqual({hodgepodge.files.get_real_path(root), os.path.join(os.path.dirname(a), 'd')}, result)
+
+        result = set(FileSearch(roots=[root], required_permissions=0o100).iter_matching_paths())
+        self.assertIn(b, result)
+        self.assertNotIn(a, result)
+
+        result = set(FileSearch(roots=[root], max_atime=1500, file_types=['file']).iter_matching_paths())
+        self.assertEqual(2, len(result))
+        self.assertNotIn(b, result)
+
+        result = list(FileSearch(roots=[root], file_types=['file'], deduplicate_inodes=True).iter_matching_paths())
+        self.assertEqual(2, len(result))
+
+        result = list(FileSearch(roots=[root], user_ids=[os.getuid() + 1]).iter_matching_paths())
+        self.assertEqual([], result)
+
+        with self.assertRaises(ValueError):
+            list(FileSearch(roots=[root], file_types=['nope']).iter_matching_paths())
+
+    def test_search_resolves_real_paths_after_stat_filters(self):
+        root = tempfile.mkdtemp(dir=self.tmp_dir)
+        a = os.path.join(root, 'a')
+        with open(a, 'w') as fp:
+            fp.write('a' * 10)
+
+        #: The real paths of symlinks aren't known until they're resolved.
+        link = os.path.join(root, 'link')
+        os.symlink(a, link)
+        search = FileSearch(roots=[root], filename_patterns=['*'], file_types=['symlink'], min_file_size=4096)
+        with mock.patch('hodgepodge.files.get_real_path', wraps=hodgepodge.files.get_real_path) as get_real_path:
+            self.assertEqual([], list(search.iter_matching_paths()))
+        self.assertNotIn(link, [c.args[0] for c in get_real_path.call_args_list])
+
+        search = FileSearch(roots=[root], filename_patterns=['link'], file_types=['symlink'])
+        with mock.patch('hodgepodge.files.get_real_path', wraps=hodgepodge.files.get_real_path) as get_real_path:
+            self.assertEqual([hodgepodge.files.get_real_path(a)], [file.real_path for file in search.iter_matching_files()])
+        self.assertEqual(1, [c.args[0] for c in get_real_path.call_args_list].count(link))
+
+    def test_iter_duplicate_files(self):
+        root = tempfile.mkdtemp(dir=self.tmp_dir)
+        large = os.urandom(256 * 1024)
+        contents = {
+            'a': b'hello', 'b': b'hello', 'c': b'world', 'd': b'unique size',
+            'e': large, 'f': large, 'g': large[:-1] + b'!',
+        }
+        for name, data in contents.items():
+            with open(os.path.join(root, name), 'wb') as fp:
+                fp.write(data)
+        os.link(os.path.join(root, 'a'), os.path.join(root, 'h'))
+
+        opened = []
+        get_file_hashes = hodgepodge.hashing.get_file_hashes
+
+        def get_file_hashes_and_record(path, **kwargs):
+            opened.append(os.path.basename(path))
+            return get_file_hashes(path, **kwargs)
+
+        for max_hashing_workers in (None, 4):
+            with self.subTest(max_hashing_workers=max_hashing_workers):
+                opened.clear()
+                search = FileSearch(roots=[root], max_hashing_workers=max_hashing_workers)
+                with mock.patch('hodgepodge.hashing.get_file_hashes', side_effect=get_file_hashes_and_record):
+                    groups = list(search.iter_duplicate_files())
+
+                result = sorted(sorted(os.path.basename(file.path) for file in group) for group in groups)
+                self.assertIn(result, ([['a', 'b'], ['e', 'f']], [['b', 'h'], ['e', 'f']]))
+                for group in groups:
+                    self.assertEqual(1, len({file.hashes for file in group}))
+                    self.assertIsNotNone(group[0].hashes.sha256)
+                    self.assertIsNone(group[0].hashes.md5)
+
+                #: Files with unique sizes or unique quick hashes should never be fully hashed.
+                self.assertNotIn('d', opened)
+                self.assertNotIn('g', opened)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+from hodgepodge.fuzzy_hashing import CTPH, SimilarityIndex
+
+import hodgepodge.fuzzy_hashing
+import hodgepodge.hashing
+import tempfile
+import random
+import os
+
+
+class FuzzyHashingTestCases(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(0)
+        cls.data = bytes(rng.getrandbits(8) for _ in range(256 * 1024))
+
+    def test_get_ctph(self):
+        self.assertEqual('3::', hodgepodge.fuzzy_hashing.get_ctph(b''))
+
+        digest = hodgepodge.fuzzy_hashing.get_ctph(self.data)
+        block_size, a, b = hodgepodge.fuzzy_hashing.parse_ctph(digest)
+        self.assertLessEqual(len(a), hodgepodge.fuzzy_hashing.SPAMSUM_LENGTH)
+        self.assertLessEqual(len(b), hodgepodge.fuzzy_hashing.SPAMSUM_LENGTH // 2)
+        self.assertGreaterEqual(len(a), hodgepodge.fuzzy_hashing.SPAMSUM_LENGTH // 4)
+
+        #: Digests shouldn't depend on how the input is split up.
+        h = CTPH()
+        for i in range(0, len(self.data), 1000):
+            h.update(self.data[i:i + 1000])
+        self.assertEqual(digest, h.hexdigest())
+
+    def test_compare(self):
+        a = hodgepodge.fuzzy_hashing.get_ctph(self.data)
+        b = hodgepodge.fuzzy_hashing.get_ctph(self.data[:100000] + b'x' * 100 + self.data[120000:])
+        c = hodgepodge.fuzzy_hashing.get_ctph(bytes(reversed(self.data)))
+
+        self.assertEqual(100, hodgepodge.fuzzy_hashing.compare(a, a))
+        self.assertGreater(hodgepodge.fuzzy_hashing.compare(a, b), 50)
+        self.assertEqual(hodgepodge.fuzzy_hashing.compare(a, b), hodgepodge.fuzzy_hashing.compare(b, a))
+        self.assertEqual(0, hodgepodge.fuzzy_hashing.compare(a, c))
+
+        with self.assertRaises(ValueError):
+            hodgepodge.fuzzy_hashing.compare(a, 'nope')
+
+    def test_similarity_index(self):
+        a = hodgepodge.fuzzy_hashing.get_ctph(self.data)
+        b = hodgepodge.fuzzy_hashing.get_ctph(self.data[:200000] + b'x' * 100 + self.data[200000:])
+        c = hodgepodge.fuzzy_hashing.get_ctph(bytes(reversed(self.data)))
+
+        index = SimilarityIndex([('a', a), ('c', c)])
+        self.assertEqual([('a', 100)], index.query(a))
+        self.assertEqual(['a'], [key for (key, _) in index.query(b)])
+
+        index.add('b', b)
+        self.assertEqual(['a', 'b'], [key for (key, _) in index.query(a)])
+        self.assertEqual(['a'], [key for (key, _) in index.query(a, limit=1)])
+
+        index.remove('a')
+        self.assertNotIn('a', index)
+        self.assertEqual(2, len(index))
+        self.assertEqual(['b'], [key for (key, _) in index.query(a)])
+
+    def test_get_file_hashes_with_ctph(self):
+        _, tmp = tempfile.mkstemp()
+        with open(tmp, 'wb') as fp:
+            fp.write(self.data)
+
+        expected = hodgepodge.fuzzy_hashing.get_ctph(self.data)
+        for use_mmap in (True, False):
+            with self.subTest(use_mmap=use_mmap):
+                hashes = hodgepodge.hashing.get_file_hashes(
+                    tmp, block_size=4096, hash_algorithms=['sha256', 'ctph'], use_mmap=use_mmap)
+                self.assertEqual(expected, hashes.ctph)
+                self.assertEqual(hodgepodge.hashing.get_sha256(self.data), hashes.sha256)
+        os.unlink(tmp)
@@ -1,9 +1,10 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 from hodgepodge.hashing import Hashes
 
 import hodgepodge.types
 import hodgepodge.hashing
 import hodgepodge.files
+import concurrent.futures
 import tempfile
 import os
 
@@ -44,3 +45,129 @@ class HashingTestCases(TestCase):
         )
         result = hodgepodge.hashing.get_file_hashes(self.tmp)
         self.assertEqual(expected, result)
+
+    def test_hash_cache(self):
+        _, tmp = tempfile.mkstemp()
+        with open(tmp, 'wb') as fp:
+            fp.write(self.txt)
+
+        with hodgepodge.hashing.HashCache(tempfile.mktemp()) as cache:
+            expected = hodgepodge.hashing.get_file_hashes(self.tmp)
+            self.assertEqual(expected, hodgepodge.hashing.get_file_hashes(tmp, cache=cache))
+
+            #: Unchanged files should be served from the cache without being read.
+            with mock.patch('builtins.open', side_effect=AssertionError("File was re-read")):
+                self.assertEqual(expected, hodgepodge.hashing.get_file_hashes(tmp, cache=cache))
+
+            #: Modified files should be rehashed.
+            with open(tmp, 'ab') as fp:
+                fp.write(b'!')
+            st = os.stat(tmp)
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+
+            result = hodgepodge.hashing.get_file_hashes(tmp, cache=cache)
+            self.assertNotEqual(expected, result)
+            self.assertEqual(hodgepodge.hashing.get_hashes(self.txt + b'!'), result)
+        os.unlink(tmp)
+
+    def test_hash_cache_eviction(self):
+        with hodgepodge.hashing.HashCache(tempfile.mktemp(), max_entries=2) as cache:
+            paths = []
+            for i in range(3):
+                _, tmp = tempfile.mkstemp()
+                paths.append(tmp)
+                cache.get_file_hashes(tmp)
+            cache.flush()
+
+            #: The least recently used entry should have been evicted.
+            self.assertEqual(2, len(cache))
+            self.assertIsNone(cache.get(os.stat(paths[0])))
+            self.assertIsNotNone(cache.get(os.stat(paths[2])))
+
+        for path in paths:
+            os.unlink(path)
+
+    def test_get_file_hashes_with_hash_algorithms(self):
+        expected = Hashes(sha256='b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9')
+        self.assertEqual(expected, hodgepodge.hashing.get_file_hashes(self.tmp, hash_algorithms=['sha256']))
+        self.assertEqual(expected, hodgepodge.hashing.get_hashes(self.txt, hash_algorithms=['SHA256']))
+
+        with self.assertRaises(ValueError):
+            hodgepodge.hashing.get_file_hashes(self.tmp, hash_algorithms=['crc32'])
+
+    def test_get_file_hashes_across_blocks(self):
+        data = os.urandom(10000)
+        _, tmp = tempfile.mkstemp()
+        with open(tmp, 'wb') as fp:
+            fp.write(data)
+
+        for hash_algorithms in (None, ['md5'], ['sha1', 'sha512']):
+            with self.subTest(hash_algorithms=hash_algorithms):
+                expected = hodgepodge.hashing.get_hashes(data, hash_algorithms=hash_algorithms)
+                result = hodgepodge.hashing.get_file_hashes(tmp, block_size=1024, hash_algorithms=hash_algorithms)
+                self.assertEqual(expected, result)
+        os.unlink(tmp)
+
+    def test_get_file_hashes_from_worker_thread(self):
+        data = os.urandom(10000)
+        _, tmp = tempfile.mkstemp()
+        with open(tmp, 'wb') as fp:
+            fp.write(data)
+
+        expected = hodgepodge.hashing.get_hashes(data)
+        for use_mmap in (True, False):
+            with self.subTest(use_mmap=use_mmap):
+                with mock.patch('hodgepodge.hashing._get_hashing_executor') as m, \
+                        concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    future = executor.submit(
+                        hodgepodge.hashing.get_file_hashes, tmp, block_size=1024, use_mmap=use_mmap)
+                    self.assertEqual(expected, future.result())
+                m.assert_not_called()
+
+                #: Callers can still opt into parallel hashing with a bounded number of threads.
+                with mock.patch(
+                        'hodgepodge.hashing._get_hashing_executor',
+                        wraps=hodgepodge.hashing._get_hashing_executor) as m:
+                    result = hodgepodge.hashing.get_file_hashes(tmp, block_size=1024, use_mmap=use_mmap, max_workers=2)
+                    self.assertEqual(expected, result)
+                m.assert_called_once_with(2)
+        os.unlink(tmp)
+
+    def test_hash_cache_with_hash_algorithms(self):
+        with hodgepodge.hashing.HashCache(tempfile.mktemp()) as cache:
+            expected = hodgepodge.hashing.get_file_hashes(self.tmp)
+            self.assertEqual(Hashes(md5=expected.md5), cache.get_file_hashes(self.tmp, hash_algorithms=['md5']))
+
+            #: Missing hashes should be calculated and merged into the existing entry.
+            self.assertEqual(expected, cache.get_file_hashes(self.tmp))
+            with mock.patch('builtins.open', side_effect=AssertionError("File was re-read")):
+                self.assertEqual(expected, cache.get_file_hashes(self.tmp))
+
+    def test_get_file_hashes_with_mmap(self):
+        data = os.urandom(10000)
+        _, tmp = tempfile.mkstemp()
+        with open(tmp, 'wb') as fp:
+            fp.write(data)
+
+        expected = hodgepodge.hashing.get_hashes(data)
+        for hash_algorithms in (None, ['sha256']):
+            for use_mmap in (True, False):
+                with self.subTest(hash_algorithms=hash_algorithms, use_mmap=use_mmap):
+                    result = hodgepodge.hashing.get_file_hashes(
+                        tmp, block_size=1024, hash_algorithms=hash_algorithms, use_mmap=use_mmap)
+                    self.assertEqual(hodgepodge.hashing.get_hashes(data, hash_algorithms=hash_algorithms), result)
+
+        #: Files are only memory mapped if the caller opts in.
+        with mock.patch('mmap.mmap', side_effect=OSError("Not supported")) as m, \
+                mock.patch('hodgepodge.hashing.MMAP_MIN_FILE_SIZE', 0):
+            self.assertEqual(expected, hodgepodge.hashing.get_file_hashes(tmp))
+            m.assert_not_called()
+
+        #: Files that can't be memory mapped should be read in blocks instead.
+        with mock.patch('mmap.mmap', side_effect=OSError("Not supported")):
+            self.assertEqual(expected, hodgepodge.hashing.get_file_hashes(tmp, use_mmap=True))
+
+        #: Empty files can't be memory mapped.
+        open(tmp, 'wb').close()
+        self.assertEqual(hodgepodge.hashing.get_hashes(b''), hodgepodge.hashing.get_file_hashes(tmp, use_mmap=True))
+        os.unlink(tmp)
@@ -0,0 +1,341 @@
+from unittest import TestCase
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler, BaseHTTPRequestHandler
+from hodgepodge.error import IntegrityError
+from hodgepodge.hashing import Hashes
+
+import hodgepodge.hashing
+import hodgepodge.http
+import requests
+import collections
+import functools
+import gzip
+import json
+import time
+import re
+import threading
+import tempfile
+import os
+
+
+class HttpTestCases(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.data = os.urandom(3 * 1024 * 1024 + 1)
+        with open(os.path.join(cls.tmp_dir.name, 'data'), 'wb') as fp:
+            fp.write(cls.data)
+
+        handler = functools.partial(QuietHTTPRequestHandler, directory=cls.tmp_dir.name)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        cls.url = 'http://127.0.0.1:{}/data'.format(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp_dir.cleanup()
+
+    def test_download_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data')
+            hashes = hodgepodge.http.download_file(self.url, path, include_file_hashes=True, hash_algorithms=['sha256'])
+            self.assertEqual(Hashes(sha256=hodgepodge.hashing.get_sha256(self.data)), hashes)
+            with open(path, 'rb') as fp:
+                self.assertEqual(self.data, fp.read())
+            self.assertEqual(['data'], os.listdir(directory))
+
+    def test_download_file_with_expected_hashes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data')
+            expected = Hashes(md5=hodgepodge.hashing.get_md5(self.data).upper())
+            self.assertIsNone(hodgepodge.http.download_file(self.url, path, expected_hashes=expected))
+            self.assertTrue(os.path.exists(path))
+
+            #: Files that fail verification shouldn't replace the existing file or be left behind.
+            with self.assertRaises(IntegrityError):
+                hodgepodge.http.download_file(self.url, path, expected_hashes=Hashes(md5='0' * 32))
+            self.assertEqual(['data'], os.listdir(directory))
+
+    def test_download_file_with_hash_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data')
+            with hodgepodge.hashing.HashCache(os.path.join(directory, 'cache.db')) as cache:
+                hashes = hodgepodge.http.download_file(self.url, path, include_file_hashes=True, hash_cache=cache)
+                self.assertEqual(hashes, cache.get(os.stat(path)))
+
+    def test_session_manager_reuses_connections(self):
+        with hodgepodge.http.SessionManager() as manager, tempfile.TemporaryDirectory() as directory:
+            session = manager.get_session()
+            for _ in range(2):
+                hodgepodge.http.download_file(self.url, os.path.join(directory, 'data'), session=session)
+
+            #: Each thread gets its own session, but sessions share connections.
+            thread = threading.Thread(target=lambda: hodgepodge.http.download_file(
+                self.url, os.path.join(directory, 'data'), session=manager.get_session()))
+            thread.start()
+            thread.join()
+
+            self.assertIs(session, manager.get_session())
+            metrics = manager.get_metrics()
+            self.assertEqual(3, metrics.requests)
+            self.assertEqual(1, metrics.connections)
+            self.assertEqual(2, metrics.reused_connections)
+            self.assertEqual(0, metrics.tls_handshakes)
+
+    def test_session_manager_host_pool_sizes(self):
+        with hodgepodge.http.SessionManager(pool_maxsize=4, host_pool_sizes={'example.com': 32}) as manager:
+            session = manager.get_session()
+            self.assertEqual(4, session.get_adapter('https://example.org/').poolmanager.connection_pool_kw['maxsize'])
+            self.assertEqual(32, session.get_adapter('https://example.com/').poolmanager.connection_pool_kw['maxsize'])
+
+    def test_get_http_adapter(self):
+        adapter = hodgepodge.http.get_http_adapter([
+            hodgepodge.http.get_automatic_retry_policy(max_retries_on_connection_errors=3),
+            hodgepodge.http.ConnectionPoolPolicy(pool_maxsize=8),
+        ])
+        self.assertEqual(3, adapter.max_retries.connect)
+        self.assertEqual(8, adapter.poolmanager.connection_pool_kw['maxsize'])
+
+    def test_policies_with_custom_http_adapters(self):
+        adapter = requests.adapters.HTTPAdapter(max_retries=5)
+
+        class CustomPolicy(hodgepodge.http.HttpRequestPolicy):
+            def to_http_adapter(self):
+                return adapter
+
+        policies = [hodgepodge.http.ConnectionPoolPolicy(pool_maxsize=8), CustomPolicy()]
+        self.assertIs(adapter, hodgepodge.http.get_http_adapter(policies))
+
+        session = requests.Session()
+        hodgepodge.http.attach_session_policies(session, policies)
+        self.assertIs(adapter, session.get_adapter('https://example.com/'))
+
+        with hodgepodge.http.SessionManager(policies=[CustomPolicy()]) as manager:
+            self.assertIs(adapter, manager.get_session().get_adapter('https://example.com/'))
+
+    def test_download_files(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(
+            ConcurrencyTrackingHTTPRequestHandler, directory=self.tmp_dir.name))
+        server.active = collections.Counter()
+        server.max_active = collections.Counter()
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        #: 127.0.0.1 and localhost are different hosts as far as per-host limits are concerned.
+        urls = ['http://{}:{}/data'.format(host, server.server_port) for host in ['127.0.0.1', 'localhost']] * 4
+        urls.append('http://127.0.0.1:{}/missing'.format(server.server_port))
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                downloads = [(url, os.path.join(directory, str(i))) for (i, url) in enumerate(urls)]
+                results = list(hodgepodge.http.download_files(
+                    downloads, max_workers=3, max_downloads_per_host=2, include_file_hashes=True,
+                    hash_algorithms=['sha256']))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(sorted(urls), sorted(result.url for result in results))
+        failed = [result for result in results if not result.ok]
+        self.assertEqual([urls[-1]], [result.url for result in failed])
+
+        sha256 = hodgepodge.hashing.get_sha256(self.data)
+        for result in results:
+            if result.ok:
+                self.assertEqual(sha256, result.hashes.sha256)
+                self.assertEqual(len(self.data), result.size)
+                self.assertGreater(result.duration, 0)
+
+        self.assertLessEqual(server.max_active['*'], 3)
+        self.assertLessEqual(max(v for (k, v) in server.max_active.items() if k != '*'), 2)
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+class ConcurrencyTrackingHTTPRequestHandler(QuietHTTPRequestHandler):
+    def do_GET(self):
+        keys = ['*', self.headers['Host'].split(':')[0]]
+        with self.server.lock:
+            for key in keys:
+                self.server.active[key] += 1
+                self.server.max_active[key] = max(self.server.max_active[key], self.server.active[key])
+        try:
+            time.sleep(0.05)
+            super().do_GET()
+        finally:
+            with self.server.lock:
+                for key in keys:
+                    self.server.active[key] -= 1
+
+
+class RangeHttpTestCases(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHTTPRequestHandler)
+        self.server.data = os.urandom(2 * 1024 * 1024 + 1)
+        self.server.etag = '"1"'
+        self.server.drop_after = None
+        self.server.content_encoding = None
+        self.server.requests = []
+        self.server.accept_encodings = []
+        self.url = 'http://127.0.0.1:{}/data'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'data')
+        self.sha256 = hodgepodge.hashing.get_sha256(self.server.data)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def download_file(self, **kwargs) -> Hashes:
+        return hodgepodge.http.download_file(
+            self.url, self.path, include_file_hashes=True, hash_algorithms=['sha256'], **kwargs)
+
+    def assertDownloaded(self, hashes: Hashes):
+        self.assertEqual(self.sha256, hashes.sha256)
+        with open(self.path, 'rb') as fp:
+            self.assertEqual(self.server.data, fp.read())
+        self.assertEqual(['data'], os.listdir(self.tmp_dir.name))
+
+    def use_gzip_encoding(self):
+
+        #: The server ignores Accept-Encoding, so the gzip-encoded representation should be downloaded as-is.
+        self.server.data = gzip.compress(os.urandom(2 * 1024 * 1024), compresslevel=1)
+        self.server.content_encoding = 'gzip'
+        self.sha256 = hodgepodge.hashing.get_sha256(self.server.data)
+
+    def test_resume_interrupted_download(self):
+        self.server.drop_after = 1024 * 1024
+        progress = []
+        self.assertDownloaded(self.download_file(progress=progress.append))
+        self.assertIn(('GET', 'bytes=1048576-'), self.server.requests)
+
+        self.assertEqual(len(self.server.data), progress[-1].downloaded)
+        self.assertEqual(len(self.server.data), progress[-1].total)
+        self.assertEqual(len(self.server.data), progress[-1].transferred)
+        self.assertGreater(progress[-1].throughput, 0)
+
+    def test_resume_partial_download(self):
+        self.server.drop_after = 1024 * 1024
+        with self.assertRaises(requests.exceptions.RequestException):
+            self.download_file(max_resumes=0)
+        self.assertEqual(['.data.part', '.data.part.json'], sorted(os.listdir(self.tmp_dir.name)))
+
+        self.server.requests.clear()
+        self.assertDownloaded(self.download_file())
+        self.assertEqual([('GET', 'bytes=1048576-')], self.server.requests)
+
+    def test_resume_complete_partial_download(self):
+
+        for kwargs in [{}, {'expected_hashes': Hashes(sha256=self.sha256)}]:
+            with self.subTest(**kwargs):
+                self.server.requests.clear()
+
+                #: e.g. a download that finished but failed to be moved into place.
+                with open(os.path.join(self.tmp_dir.name, '.data.part'), 'wb') as fp:
+                    fp.write(self.server.data)
+                with open(os.path.join(self.tmp_dir.name, '.data.part.json'), 'w') as fp:
+                    json.dump({'url': self.url, 'validator': self.server.etag}, fp)
+
+                self.assertDownloaded(self.download_file(**kwargs))
+                self.assertEqual([('GET', 'bytes={}-'.format(len(self.server.data)))], self.server.requests)
+
+    def test_resume_partial_download_of_changed_file(self):
+        self.server.drop_after = 1024 * 1024
+        with self.assertRaises(requests.exceptions.RequestException):
+            self.download_file(max_resumes=0)
+
+        self.server.data = os.urandom(len(self.server.data))
+        self.server.etag = '"2"'
+        self.sha256 = hodgepodge.hashing.get_sha256(self.server.data)
+        self.assertDownloaded(self.download_file())
+
+    def test_segmented_download(self):
+        progress = []
+        self.assertDownloaded(self.download_file(segments=4, min_segment_size=256 * 1024, progress=progress.append))
+
+        ranges = sorted(r for (method, r) in self.server.requests if method == 'GET')
+        self.assertEqual(4, len(ranges))
+        self.assertEqual(len(self.server.data), progress[-1].downloaded)
+
+    def test_resume_gzip_encoded_download(self):
+        self.use_gzip_encoding()
+        self.server.drop_after = 1024 * 1024
+        self.assertDownloaded(self.download_file())
+        self.assertIn(('GET', 'bytes=1048576-'), self.server.requests)
+        self.assertEqual({'identity'}, set(self.server.accept_encodings))
+
+    def test_segmented_gzip_encoded_download(self):
+        self.use_gzip_encoding()
+        self.assertDownloaded(self.download_file(segments=4, min_segment_size=256 * 1024))
+        self.assertEqual(4, len([r for (method, r) in self.server.requests if method == 'GET']))
+        self.assertEqual({'identity'}, set(self.server.accept_encodings))
+
+    def test_segmented_download_with_session(self):
+        with requests.Session() as session:
+            self.assertDownloaded(self.download_file(segments=4, min_segment_size=256 * 1024, session=session))
+        self.assertEqual([('GET', None)], self.server.requests)
+
+    def test_segmented_download_of_small_file(self):
+        self.assertDownloaded(self.download_file(segments=4))
+        self.assertEqual([None], [r for (method, r) in self.server.requests if method == 'GET'])
+
+
+class RangeHTTPRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves `server.data` with support for range requests (validated using `If-Range`) and, if `server.drop_after` is
+    set, drops the connection once that many bytes of the next response have been sent.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.send_data(include_body=False)
+
+    def do_GET(self):
+        self.send_data(include_body=True)
+
+    def send_data(self, include_body: bool):
+        data = self.server.data
+        self.server.requests.append((self.command, self.headers.get('Range')))
+        self.server.accept_encodings.append(self.headers.get('Accept-Encoding'))
+
+        start, end, status = 0, len(data) - 1, 200
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if match and self.headers.get('If-Range', self.server.etag) == self.server.etag:
+            start, status = int(match.group(1)), 206
+            end = min(int(match.group(2) or end), end)
+
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(data)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        self.send_response(status)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if self.server.content_encoding:
+            self.send_header('Content-Encoding', self.server.content_encoding)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(data)))
+        self.end_headers()
+
+        if include_body:
+            body = data[start:end + 1]
+            if self.server.drop_after is not None:
+                body = body[:self.server.drop_after]
+                self.server.drop_after = None
+                self.close_connection = True
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,154 @@
+from unittest import TestCase
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from hodgepodge.http import Session
+from hodgepodge.http_cache import HttpCache
+
+import hodgepodge.http
+import contextlib
+import threading
+import sqlite3
+import tempfile
+import os
+
+
+class HttpCacheTestCases(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), CachingHTTPRequestHandler)
+        self.server.resources = {}
+        self.server.requests = []
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(os.path.join(self.tmp_dir.name, 'cache'))
+        self.session = Session(cache=self.cache)
+
+    def tearDown(self):
+        self.cache.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def add_resource(self, path: str, body: bytes, etag: str = '"1"', cache_control: str = None, headers: dict = None):
+        self.server.resources[path] = (body, etag, cache_control, headers or {})
+
+    def test_revalidation(self):
+        self.add_resource('/feed', b'x' * 1000)
+        for _ in range(3):
+            response = self.session.get(self.url + '/feed')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b'x' * 1000, response.content)
+
+        self.assertEqual([None, '"1"', '"1"'], [if_none_match for (_, if_none_match) in self.server.requests])
+        stats = self.cache.get_stats()
+        self.assertEqual((0, 2, 1), (stats.hits, stats.revalidations, stats.misses))
+        self.assertEqual(2000, stats.bytes_saved)
+        self.assertAlmostEqual(2 / 3, stats.hit_rate)
+
+        #: Modified resources should replace the cached response.
+        self.add_resource('/feed', b'y' * 1000, etag='"2"')
+        self.assertEqual(b'y' * 1000, self.session.get(self.url + '/feed').content)
+        self.assertEqual(b'y' * 1000, self.session.get(self.url + '/feed').content)
+        self.assertEqual('"2"', self.server.requests[-1][1])
+
+    def test_max_age(self):
+        self.add_resource('/feed', b'x', cache_control='max-age=3600')
+        self.assertEqual(b'x', self.session.get(self.url + '/feed').content)
+        self.assertEqual(b'x', self.session.get(self.url + '/feed').content)
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual(1, self.cache.get_stats().hits)
+
+    def test_no_store(self):
+        self.add_resource('/feed', b'x', cache_control='no-store')
+        self.session.get(self.url + '/feed')
+        self.session.get(self.url + '/feed')
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual([None, None], [if_none_match for (_, if_none_match) in self.server.requests])
+
+    def test_requests_with_credentials(self):
+        self.add_resource('/feed', b'x', cache_control='max-age=3600')
+        for headers in [{'Authorization': 'Bearer 1'}, {'Cookie': 'session=1'}]:
+            self.session.get(self.url + '/feed', headers=headers)
+            self.session.get(self.url + '/feed', headers=headers)
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_vary(self):
+        self.add_resource('/feed', b'x', cache_control='max-age=3600', headers={'Vary': 'Accept, Accept-Encoding'})
+        for accept in ['application/json', 'application/xml', 'application/json']:
+            self.assertEqual(b'x', self.session.get(self.url + '/feed', headers={'Accept': accept}).content)
+        self.assertEqual(2, len(self.server.requests))
+        self.assertIsNotNone(self.cache.get(self.url + '/feed', headers={'Accept': 'application/xml'}))
+        self.assertIsNone(self.cache.get(self.url + '/feed'))
+
+        #: Responses that vary on request headers that aren't part of the cache key aren't cached.
+        for vary in ['User-Agent', '*']:
+            self.add_resource('/other', b'y', cache_control='max-age=3600', headers={'Vary': vary})
+            self.session.get(self.url + '/other')
+            self.assertIsNone(self.cache.get(self.url + '/other'))
+
+    def test_lru_eviction(self):
+        self.cache.max_size = 2500
+        for path in ['/a', '/b', '/c']:
+            self.add_resource(path, b'x' * 1000)
+
+        self.session.get(self.url + '/a')
+        self.session.get(self.url + '/b')
+        self.session.get(self.url + '/a')
+        self.session.get(self.url + '/c')
+
+        self.assertEqual(2, len(self.cache))
+        self.assertEqual(2000, self.cache.get_size())
+        self.assertIsNotNone(self.cache.get(self.url + '/a'))
+        self.assertIsNone(self.cache.get(self.url + '/b'))
+        self.assertEqual([], [name for name in os.listdir(self.cache.directory) if name.endswith('.tmp')])
+
+    def test_access_times_are_committed_in_batches(self):
+        self.add_resource('/feed', b'x', cache_control='max-age=3600')
+        self.session.get(self.url + '/feed')
+
+        path = os.path.join(self.cache.directory, 'index.db')
+        with contextlib.closing(sqlite3.connect(path)) as connection:
+            query = "SELECT last_used FROM responses"
+            (last_used,) = connection.execute(query).fetchone()
+            for _ in range(3):
+                self.assertEqual(b'x', self.session.get(self.url + '/feed').content)
+            self.assertEqual(last_used, connection.execute(query).fetchone()[0])
+
+            self.cache.close()
+            self.assertLess(last_used, connection.execute(query).fetchone()[0])
+
+    def test_download_file(self):
+        self.add_resource('/data', os.urandom(100000))
+        path = os.path.join(self.tmp_dir.name, 'data')
+        for _ in range(2):
+            hodgepodge.http.download_file(self.url + '/data', path, session=self.session)
+            with open(path, 'rb') as fp:
+                self.assertEqual(self.server.resources['/data'][0], fp.read())
+        self.assertEqual(1, self.cache.get_stats().revalidations)
+
+
+class CachingHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if_none_match = self.headers.get('If-None-Match')
+        self.server.requests.append((self.path, if_none_match))
+        body, etag, cache_control, headers = self.server.resources[self.path]
+
+        self.send_response(304 if if_none_match == etag else 200)
+        self.send_header('ETag', etag)
+        if cache_control:
+            self.send_header('Cache-Control', cache_control)
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+        if if_none_match == etag:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 import hodgepodge.pattern_matching
+import fnmatch
 
 
 class PatternMatchingTestCases(TestCase):
@@ -41,3 +42,55 @@ class PatternMatchingTestCases(TestCase):
                     case_sensitive=case_sensitive,
                 )
                 self.assertEqual(expected, result)
+
+    def test_glob_matcher(self):
+        patterns = ['readme', 'setup.*', '*.py', '*test*', 'file?.[ch]', '[!a]bc']
+        matcher = hodgepodge.pattern_matching.compile_globs(patterns)
+        for value in (
+            'README', 'readme.md', 'setup.py', 'setup', 'x.py', 'x.pyc', 'a_test_b', 'test', 'file1.c', 'file12.c',
+            'FILE1.H', 'abc', 'xbc', 'xbcd', '', 'x\ny.py',
+        ):
+            with self.subTest(value=value):
+                expected = any(fnmatch.fnmatch(value.lower(), pattern) for pattern in patterns)
+                self.assertEqual(expected, matcher.matches(value))
+
+    def test_glob_matcher_with_case_sensitivity(self):
+        matcher = hodgepodge.pattern_matching.compile_globs(['Hello*', '*World'], case_sensitive=True)
+        self.assertTrue(matcher.matches('Hello there'))
+        self.assertTrue(matcher.matches(['hello', 'Hello World']))
+        self.assertFalse(matcher.matches('hello world'))
+        self.assertFalse(matcher.matches(None))
+
+    def test_glob_matcher_with_many_patterns(self):
+        patterns = ['*infix{}*'.format(i) for i in range(100)] + ['prefix{}*'.format(i) for i in range(100)]
+        matcher = hodgepodge.pattern_matching.compile_globs(patterns)
+        for value, expected in (
+            ('an_infix42_file', True),
+            ('infix99', True),
+            ('prefix7.txt', True),
+            ('a_prefix7.txt', False),
+            ('infix', False),
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(expected, matcher.matches(value))
+
+    def test_ignore_rules(self):
+        rules = hodgepodge.pattern_matching.compile_ignore_rules([
+            '# comment', '', 'node_modules/', '*.log', '!keep.log', '/build', 'docs/**/*.tmp',
+        ], case_sensitive=True)
+        for path, is_directory, expected in (
+            ('node_modules', True, True),
+            ('src/node_modules', True, True),
+            ('node_modules', False, False),
+            ('a.log', False, True),
+            ('src/a.log', False, True),
+            ('src/keep.log', False, False),
+            ('build', True, True),
+            ('src/build', True, False),
+            ('docs/c.tmp', False, True),
+            ('docs/a/b/c.tmp', False, True),
+            ('src/c.tmp', False, False),
+            ('A.LOG', False, False),
+        ):
+            with self.subTest(path=path, is_directory=is_directory):
+                self.assertEqual(expected, rules.is_ignored(path, is_directory=is_directory))
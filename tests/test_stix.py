@@ -1,8 +1,17 @@
 from unittest import TestCase
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from stix2.datastore import DataSourceError
 from hodgepodge.stix import MITRE_ATTACK_ICS_URL
 
 import hodgepodge.stix
+import tempfile
 import stix2
+import gzip
+import threading
+import re
+import json
+import os
 
 
 class Stix2TestCases(TestCase):
@@ -67,3 +76,321 @@ class Stix2TestCases(TestCase):
         expected = {'intrusion-set'}
         result = {row['type'] for row in rows}
         self.assertEqual(expected, result)
+
+
+def _get_intrusion_set(i: int, name: str, aliases=(), external_id: str = None, modified: str = '2020-01-01') -> dict:
+    o = {
+        'type': 'intrusion-set',
+        'id': 'intrusion-set--00000000-0000-4000-8000-{:012d}'.format(i),
+        'created': '2020-01-01T00:00:00.000Z',
+        'modified': '{}T00:00:00.000Z'.format(modified),
+        'name': name,
+        'aliases': list(aliases),
+    }
+    if external_id:
+        o['external_references'] = [{'source_name': 'mitre-attack', 'external_id': external_id}]
+    return o
+
+
+class StixStoreTestCases(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.objects = [
+            _get_intrusion_set(1, 'Dragonfly 2.0', aliases=['Dragonfly 2.0', 'Berserk Bear'], external_id='G0074'),
+            _get_intrusion_set(2, 'OilRig', aliases=['OilRig', 'APT34'], external_id='G0049'),
+            _get_intrusion_set(3, 'Dragonfly', external_id='G0035'),
+            {
+                'type': 'malware',
+                'id': 'malware--00000000-0000-4000-8000-000000000004',
+                'created': '2020-01-01T00:00:00.000Z',
+                'modified': '2020-01-01T00:00:00.000Z',
+                'name': 'Backdoor.Oldrea',
+                'labels': ['malware'],
+            },
+        ]
+        fd, cls.path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({'type': 'bundle', 'id': 'bundle--00000000-0000-4000-8000-000000000000', 'spec_version': '2.0',
+                       'objects': cls.objects}, fp)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.unlink(cls.path)
+
+    def test_iter_bundle_objects(self):
+        for block_size in (1, 7, 1024 * 1024):
+            with self.subTest(block_size=block_size):
+                result = list(hodgepodge.stix.iter_bundle_objects(self.path, block_size=block_size))
+                self.assertEqual(self.objects, result)
+
+        result = list(hodgepodge.stix.iter_bundle_objects(self.path, object_types=['malware']))
+        self.assertEqual(self.objects[3:], result)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for (name, data) in (
+                ('list.json.gz', self.objects),
+                ('bundle.json.gz', {'objects': self.objects, 'spec_version': 2.0, 'x': [1, {'y': 12345}]}),
+                ('empty.json.gz', {}),
+            ):
+                path = os.path.join(directory, name)
+                with gzip.open(path, 'wt') as fp:
+                    json.dump(data, fp, indent=4)
+
+                with self.subTest(name=name):
+                    expected = self.objects if data else []
+                    self.assertEqual(expected, list(hodgepodge.stix.iter_bundle_objects(path, block_size=5)))
+
+    def test_compressed_stix_store(self):
+        store = hodgepodge.stix.get_stix_store(self.path, compress=True, object_types=['intrusion-set'])
+        self.assertEqual(3, len(store))
+        self.assertEqual(self.objects[1], store.get_object(self.objects[1]['id']))
+        self.assertEqual(['1', '3'], [o['id'][-1] for o in store.iter_objects(object_names=['Dragon*'])])
+        self.assertEqual('OilRig', store.get(self.objects[1]['id']).name)
+
+    def test_get_object(self):
+        store = hodgepodge.stix.get_stix_store(self.path)
+        self.assertEqual(4, len(store))
+        self.assertEqual(self.objects[0], hodgepodge.stix.get_object(store, self.objects[0]['id']))
+        self.assertIsNone(hodgepodge.stix.get_object(store, 'intrusion-set--00000000-0000-4000-8000-999999999999'))
+
+    def test_iter_objects(self):
+        store = hodgepodge.stix.get_stix_store(self.path)
+
+        def get_ids(**kwargs):
+            return [o['id'][-1] for o in hodgepodge.stix.iter_objects(store, **kwargs)]
+
+        self.assertEqual(['1', '2', '3', '4'], get_ids())
+        self.assertEqual(['1', '2', '3'], get_ids(object_types=['intrusion-set']))
+        self.assertEqual(['1'], get_ids(object_names=['dragonfly 2.0']))
+        self.assertEqual(['2'], get_ids(object_names=['APT34']))
+        self.assertEqual(['1', '3'], get_ids(object_names=['Dragon*']))
+        self.assertEqual(['3'], get_ids(object_names=['Dragon*'], object_external_ids=['G0035', 'G0049']))
+        self.assertEqual(['4'], get_ids(object_names=['*oldrea'], object_types=['malware']))
+        self.assertEqual([], get_ids(object_ids=[self.objects[0]['id']], object_types=['malware']))
+
+    def test_new_versions_replace_old_ones(self):
+        store = hodgepodge.stix.StixStore(self.objects)
+        store.add(_get_intrusion_set(2, 'Helix Kitten', external_id='G0049', modified='2021-01-01'))
+        store.add(_get_intrusion_set(2, 'Old', modified='2019-01-01'))
+
+        self.assertEqual('Helix Kitten', store.get_object(self.objects[1]['id'])['name'])
+        self.assertEqual([], list(store.iter_objects(object_names=['OilRig'])))
+        self.assertEqual([], list(store.iter_objects(object_names=['Old'])))
+        self.assertEqual(3, len(store.all_versions(self.objects[1]['id'])))
+
+    def test_data_source_interface(self):
+        store = hodgepodge.stix.StixStore(self.objects)
+        self.assertEqual('OilRig', store.get(self.objects[1]['id']).name)
+        self.assertEqual(3, len(store.query([stix2.Filter('type', '=', 'intrusion-set')])))
+
+        data_source = hodgepodge.stix.combine_data_sources([store])
+        self.assertEqual('OilRig', hodgepodge.stix.get_object(data_source, self.objects[1]['id'])['name'])
+
+    def test_parallel_composite_data_source(self):
+        a = _BarrierStore(self.objects[:3])
+        b = _BarrierStore(self.objects[1:] + [_get_intrusion_set(2, 'Helix Kitten', modified='2021-01-01')])
+        a.barrier = b.barrier = threading.Barrier(2, timeout=5)
+
+        #: Each data source waits for the other one to be queried, so this only completes if they're queried in parallel.
+        data_source = hodgepodge.stix.combine_data_sources([a, b])
+        results = data_source.query([stix2.Filter('type', '=', 'intrusion-set')])
+        self.assertEqual(4, len(results))
+        self.assertEqual('Helix Kitten', data_source.get(self.objects[1]['id']).name)
+        self.assertEqual(2, len(data_source.all_versions(self.objects[1]['id'])))
+
+
+class _BarrierStore(hodgepodge.stix.StixStore):
+    barrier = None
+
+    def get(self, *args, **kwargs):
+        self.barrier.wait()
+        return super().get(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        self.barrier.wait()
+        return super().query(*args, **kwargs)
+
+
+class Stix2ToDictTestCases(TestCase):
+    def test_stix2_to_dict(self):
+        o = stix2.AttackPattern(
+            name='Technique',
+            kill_chain_phases=[{'kill_chain_name': 'mitre-attack', 'phase_name': 'execution'}],
+            external_references=[{'source_name': 'mitre-attack', 'external_id': 'T1000'}],
+            custom_properties={'x_nested': [1, {'a': [2]}]},
+            allow_custom=True,
+        )
+        result = hodgepodge.stix.stix2_to_dict(o)
+        self.assertEqual(json.loads(o.serialize()), result)
+        self.assertNotIn('revoked', result)
+        self.assertIsInstance(result['created'], str)
+
+
+class TaxiiServer(ThreadingHTTPServer):
+    """
+    A minimal, local stand-in for a TAXII 2.0 server that serves a single collection and supports paging and the
+    `added_after` and `match[type]` filters.
+
+    Set `hide_total` to leave the number of objects out of Content-Range headers (responding with a 416 once the client
+    pages past the last object), or `missing` to respond to requests for objects with a 404.
+    """
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), TaxiiRequestHandler)
+        self.objects = []
+        self.requests = []
+        self.hide_total = False
+        self.missing = False
+        self.url = 'http://127.0.0.1:{}/api/collections/test/'.format(self.server_port)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def add_object(self, o: dict, date_added: str = '2020-01-01T00:00:00.000Z'):
+        self.objects.append((date_added, o))
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class TaxiiRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.server.requests.append((url.path, params, self.headers.get('Range')))
+
+        if url.path.endswith('/objects/') and self.server.missing:
+            status = 404
+            headers = {'Content-Type': 'application/vnd.oasis.taxii+json; version=2.0'}
+            body = {'title': 'Not found'}
+        elif url.path.endswith('/objects/'):
+            added_after = params.get('added_after', [''])[0]
+            objects = [o for (date_added, o) in self.server.objects if date_added > added_after]
+            if 'match[type]' in params:
+                object_types = params['match[type]'][0].split(',')
+                objects = [o for o in objects if o['type'] in object_types]
+
+            status = 200
+            headers = {'Content-Type': 'application/vnd.oasis.stix+json; version=2.0'}
+            match = re.match(r'items[= ](\d+)-(\d+)', self.headers.get('Range') or '')
+            if match and self.server.hide_total and int(match.group(1)) >= len(objects):
+                status = 416
+                headers['Content-Range'] = 'items */*'
+                objects = []
+            elif match and objects:
+                start, end = int(match.group(1)), min(int(match.group(2)), len(objects) - 1)
+                status = 206
+                headers['Content-Range'] = 'items {}-{}/{}'.format(
+                    start, end, '*' if self.server.hide_total else len(objects))
+                objects = objects[start:end + 1]
+            elif match:
+                headers['Content-Range'] = 'items */0'
+            body = {'type': 'bundle', 'id': 'bundle--00000000-0000-4000-8000-000000000000', 'spec_version': '2.0',
+                    'objects': objects}
+        else:
+            status = 200
+            headers = {'Content-Type': 'application/vnd.oasis.taxii+json; version=2.0'}
+            body = {'id': 'test', 'title': 'Test', 'can_read': True, 'can_write': False, 'media_types': []}
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TaxiiCacheTestCases(TestCase):
+    def setUp(self):
+        self.server = TaxiiServer()
+        for i in range(1, 4):
+            self.server.add_object(_get_intrusion_set(i, 'Group {}'.format(i)))
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp_dir.cleanup()
+
+    def test_taxii_cache(self):
+        cache = hodgepodge.stix.TaxiiCache(self.tmp_dir.name, page_size=2)
+        store = hodgepodge.stix.get_taxii_data_source(self.server.url, cache=cache)
+        self.assertEqual(3, len(store))
+        self.assertEqual(2, len([r for r in self.server.requests if r[0].endswith('/objects/')]))
+
+        #: Fresh collections should be served from the cache.
+        self.server.requests.clear()
+        store = cache.get_data_source(self.server.url, object_types=['intrusion-set'])
+        self.assertEqual(3, len(store))
+        self.assertEqual([], self.server.requests)
+
+        #: Refreshes should only fetch objects that were added since the last refresh.
+        self.server.add_object(_get_intrusion_set(4, 'Group 4'), date_added='9999-01-01T00:00:00.000Z')
+        self.server.add_object(_get_intrusion_set(1, 'Group 1', modified='2021-01-01'),
+                               date_added='9999-01-01T00:00:00.000Z')
+        self.assertEqual(2, cache.refresh(self.server.url))
+        self.assertTrue(all('added_after' in params for (path, params, _) in self.server.requests
+                            if path.endswith('/objects/')))
+
+        store = cache.get_data_source(self.server.url)
+        self.assertEqual(4, len(store))
+        self.assertEqual('2021-01-01T00:00:00.000Z', store.get_object(_get_intrusion_set(1, '')['id'])['modified'])
+
+        #: Nothing new to fetch.
+        self.server.objects = self.server.objects[:3]
+        self.assertEqual(0, cache.refresh(self.server.url))
+        self.assertEqual(4, len(cache.get_data_source(self.server.url)))
+
+        #: Stale collections should be refreshed before they're served.
+        self.server.requests.clear()
+        cache = hodgepodge.stix.TaxiiCache(self.tmp_dir.name, ttl=0)
+        self.assertEqual(4, len(cache.get_data_source(self.server.url)))
+        self.assertNotEqual([], self.server.requests)
+
+        self.assertEqual(3, cache.refresh(self.server.url, full=True))
+        self.assertEqual(3, len(list(cache.iter_objects(self.server.url))))
+
+
+class TaxiiPagingTestCases(TestCase):
+    def setUp(self):
+        self.server = TaxiiServer()
+        for i in range(1, 6):
+            self.server.add_object(_get_intrusion_set(i, 'Group {}'.format(i)))
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_iter_taxii_pages(self):
+        collection = hodgepodge.stix.get_taxii_collection(self.server.url, max_workers=4)
+        pages = list(hodgepodge.stix.iter_taxii_pages(collection, page_size=2, max_workers=4))
+        self.assertEqual([2, 2, 1], [len(page['objects']) for page in pages])
+        self.assertEqual([o for (_, o) in self.server.objects], [o for page in pages for o in page['objects']])
+
+        ranges = sorted(r for (path, _, r) in self.server.requests if path.endswith('/objects/'))
+        self.assertEqual(['items=0-1', 'items=2-3', 'items=4-5'], ranges)
+
+    def test_iter_taxii_pages_without_total(self):
+        self.server.hide_total = True
+        self.server.objects.pop()
+        collection = hodgepodge.stix.get_taxii_collection(self.server.url)
+
+        #: Paging past the last object ends with a 416 (Range Not Satisfiable), which isn't an error.
+        pages = list(hodgepodge.stix.iter_taxii_pages(collection, page_size=2))
+        self.assertEqual([2, 2], [len(page['objects']) for page in pages])
+
+        #: taxii2client retries failed requests once using the "items a-b" form of the Range header.
+        ranges = [r for (path, _, r) in self.server.requests if path.endswith('/objects/')]
+        self.assertEqual(['items=0-1', 'items=2-3', 'items=4-5', 'items 4-5'], ranges)
+
+    def test_get_taxii_data_source(self):
+        data_source = hodgepodge.stix.get_taxii_data_source(self.server.url, page_size=2)
+        self.assertEqual(5, len(data_source.query([stix2.Filter('type', '=', 'intrusion-set')])))
+        self.assertEqual([], data_source.query([stix2.Filter('type', '=', 'malware')]))
+
+        self.server.hide_total = True
+        self.assertEqual(5, len(data_source.query([stix2.Filter('type', '=', 'intrusion-set')])))
+
+        self.server.missing = True
+        with self.assertRaises(DataSourceError):
+            data_source.query([stix2.Filter('type', '=', 'intrusion-set')])